@@ -0,0 +1,112 @@
+# analytics/grade_events.py
+import io
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+BUCKET_NAME = os.environ["BUCKET_NAME"]
+# Day partitions land under <prefix>dt=YYYY-MM-DD/
+EVENTS_PREFIX = os.environ.get("GRADE_EVENTS_PREFIX", "analytics/grade_events/")
+
+s3 = boto3.client("s3")
+
+# One row per POST /grade. Keep in sync with update_stats._publish_grade_event.
+SCHEMA = pa.schema([
+    ("trackId",      pa.string()),
+    ("grade",        pa.int8()),
+    ("gradedAt",     pa.timestamp("ms", tz="UTC")),
+    ("prevEase",     pa.float32()),
+    ("prevReps",     pa.int32()),
+    ("prevInterval", pa.float32()),
+    ("ease",         pa.float32()),
+    ("reps",         pa.int32()),
+    ("interval",     pa.float32()),
+    ("nextReviewAt", pa.timestamp("ms", tz="UTC")),
+])
+
+_TIMESTAMP_FIELDS = ("gradedAt", "nextReviewAt")
+
+
+def _parse_ts(value):
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _to_row(raw):
+    """Validate one JSON event and coerce it to the column types of SCHEMA."""
+    ev = json.loads(raw)
+    row = {}
+    for field in SCHEMA:
+        v = ev.get(field.name)
+        if v is None:
+            if field.name in ("trackId", "grade", "gradedAt"):
+                raise ValueError(f"missing {field.name}")
+            row[field.name] = None
+        elif field.name in _TIMESTAMP_FIELDS:
+            row[field.name] = _parse_ts(v)
+        else:
+            row[field.name] = v
+    return row
+
+
+def partition_prefix(day):
+    """S3 prefix of the partition holding events graded on `day` (a date)."""
+    return f"{EVENTS_PREFIX}dt={day.isoformat()}/"
+
+
+def encode_batch(rows):
+    """Return the rows as a zstd-compressed Parquet file (bytes)."""
+    table = pa.Table.from_pylist(rows, schema=SCHEMA)
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd")
+    return buf.getvalue()
+
+
+def lambda_handler(event, _ctx):
+    """
+    SQS consumer for the grade-events queue.
+
+    Each message body is one JSON grade event produced by update_stats. The
+    batch is grouped by UTC day of `gradedAt` and written as one Parquet file
+    per day, so a batching window of a few minutes turns thousands of grades
+    into a handful of objects. Messages that fail to parse or whose partition
+    could not be written are returned as batchItemFailures (-> retry / DLQ).
+    """
+    failures = []
+    by_day = {}
+
+    for rec in event.get("Records", []):
+        try:
+            row = _to_row(rec["body"])
+        except Exception as e:
+            log.warning("grade_events bad message id=%s err=%s", rec.get("messageId"), e)
+            failures.append(rec["messageId"])
+            continue
+        by_day.setdefault(row["gradedAt"].date(), []).append((rec["messageId"], row))
+
+    for day, entries in by_day.items():
+        key = f"{partition_prefix(day)}part-{datetime.now(timezone.utc):%H%M%S}-{uuid.uuid4().hex}.parquet"
+        try:
+            s3.put_object(
+                Bucket=BUCKET_NAME,
+                Key=key,
+                Body=encode_batch([row for _, row in entries]),
+                ContentType="application/vnd.apache.parquet",
+            )
+            log.info("grade_events wrote %d rows -> s3://%s/%s", len(entries), BUCKET_NAME, key)
+        except Exception:
+            log.exception("grade_events FAILED partition=%s rows=%d", day, len(entries))
+            failures.extend(mid for mid, _ in entries)
+
+    return {"batchItemFailures": [{"itemIdentifier": mid} for mid in failures]}
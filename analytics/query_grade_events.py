@@ -0,0 +1,71 @@
+# analytics/query_grade_events.py
+"""
+Read the grade event log written by grade_events.lambda_handler.
+
+Only the day partitions in [start, end] are listed, and only the requested
+columns are decoded from each Parquet file, so analytics never touch the
+Tracks table.
+
+    python -m analytics.query_grade_events 2026-10-01 2026-10-19 --columns trackId grade
+"""
+import argparse
+import io
+import os
+from datetime import date, timedelta
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_PREFIX = os.environ.get("GRADE_EVENTS_PREFIX", "analytics/grade_events/")
+
+
+def _days(start, end):
+    d = start
+    while d <= end:
+        yield d
+        d += timedelta(days=1)
+
+
+def read_grade_events(bucket, start, end=None, columns=None, prefix=DEFAULT_PREFIX, s3=None):
+    """
+    Return a pyarrow.Table with the grade events of days start..end (inclusive).
+
+    `columns` limits which columns are decoded (column pruning); None reads all.
+    """
+    s3 = s3 or boto3.client("s3")
+    end = end or start
+    tables = []
+
+    paginator = s3.get_paginator("list_objects_v2")
+    for day in _days(start, end):
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}dt={day.isoformat()}/"):
+            for obj in page.get("Contents", []):
+                if not obj["Key"].endswith(".parquet"):
+                    continue
+                body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+                tables.append(pq.read_table(io.BytesIO(body), columns=columns))
+
+    if not tables:
+        return pa.table({c: [] for c in columns or []})
+    return pa.concat_tables(tables)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Summarise grade events per track")
+    ap.add_argument("start", type=date.fromisoformat)
+    ap.add_argument("end", type=date.fromisoformat, nargs="?")
+    ap.add_argument("--bucket", default=os.environ.get("BUCKET_NAME", "wave-loft-audio-bucket"))
+    ap.add_argument("--columns", nargs="*", default=["trackId", "grade"])
+    args = ap.parse_args()
+
+    table = read_grade_events(args.bucket, args.start, args.end, columns=args.columns)
+    print(f"{table.num_rows} events, columns={table.column_names}")
+    if {"trackId", "grade"} <= set(table.column_names) and table.num_rows:
+        summary = table.group_by("trackId").aggregate([("grade", "count"), ("grade", "mean")])
+        for row in summary.sort_by([("grade_count", "descending")]).to_pylist():
+            print(f"{row['trackId']}\t{row['grade_count']}\t{row['grade_mean']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
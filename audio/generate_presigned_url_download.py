@@ -1,25 +1,21 @@
-import boto3
 import os
 import json
 
-from botocore.config import Config
-from botocore.exceptions import ClientError
 from cors_utils import build_response
+import aws_clients
+import ddb_wire
+import tracing
 
-# Initialize AWS resources
-dynamodb = boto3.resource('dynamodb')
-my_config = Config(
+# Initialize AWS resources (on first use)
+dynamodb = ddb_wire.lazy_client()  # Items come back as plain JSON values
+s3 = aws_clients.lazy_client(
+    "s3",
     region_name="eu-north-1",
+    endpoint_url="https://s3.eu-north-1.amazonaws.com",
     signature_version="s3v4",
     s3={'addressing_style': 'virtual'}  # or 'path'
 )
 
-s3 = boto3.client(
-    "s3",
-    config=my_config,
-    endpoint_url="https://s3.eu-north-1.amazonaws.com"
-)
-
 # Environment variables
 TABLE_NAME = os.environ['DYNAMODB_TABLE']
 BUCKET_NAME = os.environ['BUCKET_NAME']
@@ -28,8 +24,7 @@ def fetch_dynamodb_items():
     """
     Fetch all items from the DynamoDB table.
     """
-    table = dynamodb.Table(TABLE_NAME)
-    response = table.scan()
+    response = dynamodb.scan(TableName=TABLE_NAME)
     return response.get("Items", [])
 
 
@@ -43,7 +38,7 @@ def generate_presigned_url(s3_key):
             Params={'Bucket': BUCKET_NAME, 'Key': s3_key},
             ExpiresIn=3600  # URL valid for 1 hour
         )
-    except ClientError as e:
+    except aws_clients.ClientError as e:
         print(f"Error generating presigned URL for {s3_key}: {str(e)}")
         return None
 
@@ -68,6 +63,7 @@ def enhance_item_with_presigned_urls(item):
     return item
 
 
+@tracing.traced("generate_presigned_url_download")
 def lambda_handler(event, context):
     try:
         # Step 1: Fetch items from DynamoDB
@@ -75,14 +71,13 @@ def lambda_handler(event, context):
 
         # Step 2: Enhance each item with presigned URLs
         enhanced_tracks = [
-            enhance_item_with_presigned_urls(item)
-            for item in items if enhance_item_with_presigned_urls(item)
+            track for track in map(enhance_item_with_presigned_urls, items) if track
         ]
 
         # Step 3: Return the enhanced track list
         return build_response(200, {"tracks": enhanced_tracks})
 
-    except ClientError as e:
+    except aws_clients.ClientError as e:
         return build_response(500, {"error": e.response["Error"]["Message"]})
     except Exception as e:
         return build_response(500, {"error": str(e)})
\ No newline at end of file
@@ -1,12 +1,14 @@
-import boto3
 import os
 import json
 import uuid
 from cors_utils import build_response
+import aws_clients
+import tracing
 
-s3 = boto3.client("s3")
+s3 = aws_clients.lazy_client("s3")
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 
+@tracing.traced("generate_presigned_url_upload")
 def lambda_handler(event, context):
     try:
         body = json.loads(event.get("body") or "{}")
@@ -23,6 +25,9 @@ def lambda_handler(event, context):
             "audio/mpeg": ".mp3",
             "audio/flac": ".flac",
             "audio/x-wav": ".wav",
+            "audio/wav": ".wav",
+            "audio/aiff": ".aiff",
+            "audio/x-aiff": ".aiff",
             "audio/aac": ".aac",
         }
 
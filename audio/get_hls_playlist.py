@@ -0,0 +1,75 @@
+import os
+import re
+
+from cors_utils import build_response
+from presign import presign_get_many
+import aws_clients
+import tracing
+
+dynamodb = aws_clients.lazy_resource('dynamodb')
+# regional virtual-hosted URLs (the global endpoint redirects outside us-east-1)
+s3 = aws_clients.lazy_client('s3', signature_version='s3v4', s3={'addressing_style': 'virtual'})
+
+TABLE_NAME = os.environ['DYNAMODB_TABLE']
+BUCKET_NAME = os.environ['BUCKET_NAME']
+# Every segment URL must outlive playback of the whole mix; capped by the role session
+PRESIGN_EXPIRES_SEC = int(os.environ.get('PRESIGN_EXPIRES_SEC', '3600'))
+
+_MAP_URI = re.compile(r'URI="([^"]+)"')
+
+
+def sign_playlist(playlist, prefix):
+    """
+    Rewrite the relative URIs of a media playlist (segments and the
+    EXT-X-MAP init segment) into presigned S3 URLs, signed in one batch.
+    """
+    lines = playlist.splitlines()
+    keys = []
+    for line in lines:
+        if line.startswith('#EXT-X-MAP'):
+            keys += _MAP_URI.findall(line)
+        elif line and not line.startswith('#'):
+            keys.append(line)
+    urls = presign_get_many(s3, BUCKET_NAME, [f'{prefix}/{k}' for k in keys], PRESIGN_EXPIRES_SEC)
+
+    out = []
+    for line in lines:
+        if line.startswith('#EXT-X-MAP'):
+            line = _MAP_URI.sub(lambda m: f'URI="{urls[prefix + "/" + m.group(1)]}"', line)
+        elif line and not line.startswith('#'):
+            line = urls[f'{prefix}/{line}']
+        out.append(line)
+    return '\n'.join(out) + '\n'
+
+
+@tracing.traced("get_hls_playlist")
+def lambda_handler(event, context):
+    """
+    GET /tracks/{id}/playlist.m3u8 -> the track's HLS playlist with every
+    segment URL presigned, so a player can start after the first segment
+    and seek without downloading the whole file.
+    """
+    try:
+        track_id = event['pathParameters']['id']
+        item = dynamodb.Table(TABLE_NAME).get_item(
+            Key={'id': track_id}, ProjectionExpression='hlsS3Key'
+        ).get('Item')
+        if not item or not item.get('hlsS3Key'):
+            return build_response(404, {'error': 'No HLS rendition for this track'})
+
+        playlist_key = item['hlsS3Key']
+        playlist = s3.get_object(Bucket=BUCKET_NAME, Key=playlist_key)['Body'].read().decode('utf-8')
+        signed = sign_playlist(playlist, os.path.dirname(playlist_key))
+
+        response = build_response(200, {})
+        response['headers'].update({
+            'Content-Type': 'application/vnd.apple.mpegurl',
+            # the segment signatures expire; never let a cache outlive them
+            'Cache-Control': 'private, max-age=60',
+        })
+        response['body'] = signed
+        return response
+    except aws_clients.ClientError as e:
+        return build_response(500, {'error': e.response['Error']['Message']})
+    except Exception as e:
+        return build_response(500, {'error': str(e)})
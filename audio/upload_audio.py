@@ -1,12 +1,14 @@
-import boto3
 import json
 import uuid
 from mimetypes import guess_extension
-from botocore.exceptions import ClientError
 
-s3 = boto3.client('s3')
+import aws_clients
+import tracing
+
+s3 = aws_clients.lazy_client('s3')
 BUCKET_NAME = 'wave-loft-audio-bucket'  # Update with your bucket name
 
+@tracing.traced("upload_audio")
 def lambda_handler(event, context):
     try:
         body = event["body"]
@@ -46,7 +48,7 @@ def lambda_handler(event, context):
                 },
             }
 
-    except ClientError as e:
+    except aws_clients.ClientError as e:
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)}),
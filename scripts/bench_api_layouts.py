@@ -0,0 +1,194 @@
+"""
+Cold starts and latency of app sessions: one function per endpoint vs ApiRouterFunction.
+
+    python scripts/bench_api_layouts.py --sessions 10 --idle-min 10 --gap-min 45
+
+Replays the same seeded sequence of app sessions (list tracks, a few
+filename lookups, create a track item, upload, rename, delete, list again,
+with think time in between and a gap between sessions) against both
+layouts. Each "container" is a real worker process with its own in-process
+moto; it is reused while warm and replaced when it has been idle longer
+than --idle-min of simulated time, so a cold start is a real fresh import.
+
+Latency of a request is the handler duration; a cold request adds its init:
+interpreter start + `import boto3` (both measured once here, because the
+worker needs boto3 for moto before the handler loads) + the handler module
+import. Lambda's own sandbox start comes on top of every cold start in both
+layouts; pass its estimate as --sandbox-ms.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENV = {
+    "AWS_DEFAULT_REGION": "eu-north-1", "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+    "DYNAMODB_TABLE": "Tracks", "BUCKET_NAME": "wave-loft-audio-bucket", "STATS_TABLE": "LearningStats",
+}
+
+# endpoint -> module of its split-layout function
+SPLIT = {
+    "GET /tracks": "tracks.list_tracks",
+    "PUT /tracks/{id}": "tracks.update_track",
+    "DELETE /tracks/{id}": "tracks.delete_track",
+    "GET /lookup": "tracks.lookup_by_filename",
+    "POST /trackItems": "tracks.create_track_item",
+    "POST /upload": "audio.upload_audio",
+}
+ROUTER = "tracks.api_router"
+
+WORKER = r"""
+import importlib, json, sys, time
+sys.path[:0] = [sys.argv[1], sys.argv[1] + "/utils/python"]
+import boto3
+from moto import mock_aws
+mock = mock_aws(); mock.start()
+ddb = boto3.resource("dynamodb")
+for name in ("Tracks", "LearningStats"):
+    key = "id" if name == "Tracks" else "pk"
+    ddb.create_table(TableName=name, KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                     AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                     BillingMode="PAY_PER_REQUEST")
+with ddb.Table("Tracks").batch_writer() as batch:
+    for i in range(int(sys.argv[2])):
+        batch.put_item(Item={"id": f"t{i}", "title": f"Track {i}", "fileName": f"track-{i}.flac",
+                             "audioS3Key": f"mp3/t{i}.mp3"})
+boto3.client("s3").create_bucket(Bucket="wave-loft-audio-bucket",
+                                 CreateBucketConfiguration={"LocationConstraint": "eu-north-1"})
+print("ready", flush=True)
+handlers = {}
+for line in sys.stdin:
+    req = json.loads(line)
+    init = 0.0
+    if req["module"] not in handlers:
+        t0 = time.perf_counter()
+        handlers[req["module"]] = importlib.import_module(req["module"]).lambda_handler
+        init = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    resp = handlers[req["module"]](req["event"], None)
+    print(json.dumps({"init": init, "duration": (time.perf_counter() - t0) * 1000,
+                      "status": resp["statusCode"]}), flush=True)
+"""
+
+
+def fresh_process_ms(code, runs=5):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def make_sessions(n, gap_min, library, seed):
+    rnd = random.Random(seed)
+    clock = 0.0
+    sessions = []
+    for s in range(n):
+        clock += rnd.expovariate(1 / (gap_min * 60)) if s else 0
+        new_id = f"new-{s}"
+        steps = [("GET /tracks", {})]
+        steps += [("GET /lookup", {"queryStringParameters": {"fileName": f"track-{rnd.randrange(library)}.flac"}})
+                  for _ in range(3)]
+        steps += [
+            ("POST /trackItems", {"body": json.dumps({"trackId": new_id, "title": "New"})}),
+            ("POST /upload", {"headers": {"Content-Type": "multipart/form-data; boundary=x"}, "body": "x" * 2048}),
+            ("PUT /tracks/{id}", {"pathParameters": {"id": new_id}, "body": json.dumps({"name": "N", "artist": "A"})}),
+            ("DELETE /tracks/{id}", {"pathParameters": {"id": new_id}}),
+            ("GET /tracks", {}),
+        ]
+        session = []
+        for endpoint, extra in steps:
+            clock += rnd.uniform(2, 60)
+            method, resource = endpoint.split(" ")
+            path = resource.replace("{id}", extra.get("pathParameters", {}).get("id", ""))
+            session.append((clock, endpoint, {"httpMethod": method, "resource": resource, "path": path, **extra}))
+        sessions.append(session)
+    return sessions
+
+
+class Container:
+    def __init__(self, library):
+        self.proc = subprocess.Popen([sys.executable, "-c", WORKER, ROOT, str(library)], cwd=ROOT,
+                                     env={**os.environ, **ENV}, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True)
+        if self.proc.stdout.readline().strip() != "ready":
+            raise SystemExit("worker failed to start")
+        self.last_used = None
+
+    def call(self, module, event):
+        self.proc.stdin.write(json.dumps({"module": module, "event": event}) + "\n")
+        self.proc.stdin.flush()
+        return json.loads(self.proc.stdout.readline())
+
+    def stop(self):
+        self.proc.kill()
+        self.proc.wait()
+
+
+def run_layout(layout, sessions, args, cold_base_ms):
+    containers = {}
+    latencies, colds, errors = [], 0, 0
+    for session in sessions:
+        for at, endpoint, event in session:
+            fn = ROUTER if layout == "router" else SPLIT[endpoint]
+            c = containers.get(fn)
+            if c and at - c.last_used > args.idle_min * 60:
+                c.stop()
+                c = None
+            cold = c is None
+            if cold:
+                c = containers[fn] = Container(args.library)
+                colds += 1
+            r = c.call(fn, event)
+            c.last_used = at
+            errors += r["status"] >= 500
+            latencies.append(r["duration"] + (cold_base_ms + args.sandbox_ms + r["init"] if cold else 0))
+    for c in containers.values():
+        c.stop()
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)  # noqa: E731
+    return {"layout": layout, "requests": len(latencies), "coldStarts": colds, "errors": errors,
+            "p50Ms": pct(0.50), "p95Ms": pct(0.95), "p99Ms": pct(0.99), "maxMs": round(latencies[-1], 1),
+            "coldPerSession": round(colds / len(sessions), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--idle-min", type=float, default=10, help="simulated idle time before a container is reclaimed")
+    parser.add_argument("--gap-min", type=float, default=45, help="mean simulated gap between sessions")
+    parser.add_argument("--library", type=int, default=500, help="tracks seeded into each container's table")
+    parser.add_argument("--sandbox-ms", type=float, default=0, help="per cold start platform overhead to add")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    interpreter = fresh_process_ms("pass")
+    boto3_import = fresh_process_ms("import boto3") - interpreter
+    cold_base = interpreter + boto3_import
+    sessions = make_sessions(args.sessions, args.gap_min, args.library, args.seed)
+    rows = [run_layout(layout, sessions, args, cold_base) for layout in ("split", "router")]
+
+    print(f"\n{args.sessions} sessions, {len(sessions[0])} requests each; cold start base "
+          f"{interpreter:.0f} ms interpreter + {boto3_import:.0f} ms boto3 import + {args.sandbox_ms:.0f} ms sandbox")
+    header = f"{'layout':<8} {'requests':>8} {'cold':>5} {'cold/session':>12} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['layout']:<8} {r['requests']:>8} {r['coldStarts']:>5} {r['coldPerSession']:>12} "
+              f"{r['p50Ms']:>7} {r['p95Ms']:>7} {r['p99Ms']:>7} {r['maxMs']:>7}"
+              + (f"  ({r['errors']} errors)" if r["errors"] else ""))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Init (cold start) cost of every handler module, measured in fresh interpreters.
+
+    python scripts/bench_cold_start.py --runs 15
+    python scripts/bench_cold_start.py --modules tracks/create_track,tracks/list_tracks --json init.json
+
+For each handler a new Python process puts the handler's CodeUri dir and
+the utils layer on sys.path (as Lambda does with /opt/python), then times:
+
+  init   import of the handler module: what Lambda bills as Init Duration
+  first  materializing the AWS clients/tables the module declared lazily
+         (aws_clients proxies), i.e. the extra cost the first real request
+         pays; 0 for modules that build everything at import
+
+Nothing talks to AWS: creating a boto3 client only loads its service model.
+Reports the median and p90 over --runs processes per module.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+HANDLERS = [
+    "tracks/create_track", "tracks/create_track_item", "tracks/delete_track", "tracks/details_enricher",
+    "tracks/get_details", "tracks/get_due_stats", "tracks/get_due_tracks", "tracks/list_tracks",
+    "tracks/lookup_by_filename", "tracks/rebuild_due_counters", "tracks/update_stats", "tracks/update_track",
+    "audio/generate_presigned_url_download", "audio/generate_presigned_url_upload",
+    "audio/get_hls_playlist", "audio/upload_audio", "transcode/transcode",
+]
+
+ENV = {
+    "AWS_DEFAULT_REGION": "eu-north-1", "AWS_ACCESS_KEY_ID": "x", "AWS_SECRET_ACCESS_KEY": "x",
+    "DYNAMODB_TABLE": "Tracks", "TRACKS_TABLE": "Tracks", "DETAILS_TABLE": "TrackDetails",
+    "BUCKET_NAME": "bench", "S3_BUCKET": "bench", "STATS_TABLE": "LearningStats",
+}
+
+PROBE = r"""
+import importlib, json, sys, time
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+t0 = time.perf_counter()
+mod = importlib.import_module(sys.argv[3])
+t1 = time.perf_counter()
+try:
+    import aws_clients
+    for value in list(vars(mod).values()):
+        if isinstance(value, aws_clients.Lazy):
+            value.resolve()
+except ImportError:
+    pass
+t2 = time.perf_counter()
+print(json.dumps({"init": (t1 - t0) * 1000, "first": (t2 - t1) * 1000}))
+"""
+
+
+def measure(handler, runs):
+    code_dir, module = os.path.split(handler)
+    env = {**os.environ, **ENV}
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, os.path.join(ROOT, code_dir), os.path.join(ROOT, "utils", "python"), module],
+            env=env, capture_output=True, text=True, cwd=ROOT,
+        )
+        if out.returncode != 0:
+            return {"handler": handler, "error": out.stderr.strip().splitlines()[-1]}
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    init = sorted(s["init"] for s in samples)
+    first = sorted(s["first"] for s in samples)
+    return {
+        "handler": handler,
+        "initMs": round(statistics.median(init), 1),
+        "initP90Ms": round(init[int(0.9 * (len(init) - 1))], 1),
+        "firstUseMs": round(statistics.median(first), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15, help="fresh processes per handler")
+    parser.add_argument("--modules", help="comma separated <codeuri>/<module> (default: every handler)")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rows = [measure(h, args.runs) for h in (args.modules.split(",") if args.modules else HANDLERS)]
+    header = f"{'handler':<42} {'init ms':>8} {'p90':>7} {'first use ms':>13}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        if "error" in r:
+            print(f"{r['handler']:<42}  {r['error']}")
+            continue
+        print(f"{r['handler']:<42} {r['initMs']:>8} {r['initP90Ms']:>7} {r['firstUseMs']:>13}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Client-side cost of a bulk read: boto3 resource + build_response vs ddb_wire.
+
+    python scripts/bench_ddb_wire.py --sizes 500,2000 --repeat 10
+
+Seeds moto with --sizes synthetic tracks (bench_handlers.seed), captures the
+raw body of the first Scan page once, then times only what happens in the
+Lambda after the bytes arrive, best of --repeat runs, interleaved:
+
+  resource   botocore's model-driven parse + TypeDeserializer + cors_utils.dumps
+  wire       ddb_wire's before-parse hook (json.loads + decode_item), botocore
+             parsing what is left of the body, + cors_utils.dumps
+
+Both bodies are checked to decode to the same JSON values first. moto's own
+time is left out: it dwarfs both and is not what Lambda pays.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_handlers  # noqa: E402  (sets up sys.path and the dummy AWS env)
+import boto3  # noqa: E402
+from boto3.dynamodb.types import TypeDeserializer  # noqa: E402
+from botocore import parsers  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import cors_utils  # noqa: E402
+import ddb_wire  # noqa: E402
+
+
+def capture_page(size):
+    with mock_aws():
+        bench_handlers.seed(size, 0, random.Random(size))
+        client = boto3.client("dynamodb", region_name=bench_handlers.REGION)
+        page = {}
+        client.meta.events.register("after-call.dynamodb.Scan",
+                                    lambda http_response, **_: page.setdefault("body", http_response.content))
+        client.scan(TableName="Tracks")
+        return page["body"], client.meta.service_model.operation_model("Scan").output_shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="500,2000")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    json_parser = parsers.create_parser("json")
+    deserializer = TypeDeserializer()
+
+    def resource(body, shape):
+        parsed = json_parser.parse({"body": body, "headers": {}, "status_code": 200}, shape)
+        items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in parsed["Items"]]
+        return cors_utils.dumps({"tracks": items})
+
+    def wire(body, shape):
+        response_dict, customized = {"body": body, "headers": {}, "status_code": 200}, {}
+        ddb_wire._decode_items(response_dict, customized)
+        parsed = json_parser.parse(response_dict, shape)
+        parsed.update(customized)
+        return cors_utils.dumps({"tracks": parsed["Items"]})
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        body, shape = capture_page(size)
+        if json.loads(resource(body, shape)) != json.loads(wire(body, shape)):
+            raise SystemExit(f"decoded items differ for size={size}")
+        best = [float("inf")] * 2
+        for _ in range(args.repeat):
+            for i, fn in enumerate((resource, wire)):
+                best[i] = min(best[i], timeit.timeit(lambda: fn(body, shape), number=1))
+        items = len(json.loads(body)["Items"])
+        rows.append({"tracks": size, "pageItems": items, "pageBytes": len(body),
+                     "resourceMs": round(best[0] * 1000, 1), "wireMs": round(best[1] * 1000, 1),
+                     "speedup": round(best[0] / best[1], 2)})
+
+    header = f"{'tracks':>7} {'page items':>11} {'page KB':>8} {'resource ms':>12} {'wire ms':>8} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['tracks']:>7} {r['pageItems']:>11} {r['pageBytes'] / 1024:>8.0f} {r['resourceMs']:>12} "
+              f"{r['wireMs']:>8} {r['speedup']:>7}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+TrackDetails size and latency: nested map vs gzipped blob (vs S3 spill).
+
+    python scripts/bench_details_storage.py --frames 0,100,1000 --reads 50
+
+Builds synthetic sidecars (tags + features + an analysis section of
+--frames per-segment rows, like the rich analyzer exports), stores each one
+in an in-process moto TrackDetails table both ways and reports per
+representation: DynamoDB item size (by the documented sizing rules), the
+RCU/WCU of one read/write, put and get latency, and the client-side decode
+time (TypeDeserializer for maps, gunzip + json for blobs). moto answers
+in-process and is itself slow on large maps, so compare decode ms (pure
+client-side work, which carries over to Lambda) and the RCU/WCU columns
+rather than the absolute put/get times.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [os.path.join(ROOT, "utils", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import boto3  # noqa: E402
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import details_store  # noqa: E402
+
+REGION = os.environ["AWS_DEFAULT_REGION"]
+BUCKET = "bench-details"
+ITEM_LIMIT = 400 * 1024
+
+
+def make_sidecar(frames, rnd):
+    doc = {
+        "meta": {"artist": "Artist", "title": "A long mix title", "genre": "Techno",
+                 "moods": "dark, driving, hypnotic", "year": 2024},
+        "features": {"bpm": 124.5, "key": "Am", "energy": 0.81, "danceability": 0.77},
+        "analysis": {"frames": [
+            {"t": round(i * 0.5, 1), "rms": round(rnd.random(), 6), "centroid": round(rnd.uniform(500, 4000), 2),
+             "onset": rnd.random() > 0.8, "chroma": [round(rnd.random(), 3) for _ in range(12)]}
+            for i in range(frames)
+        ]},
+    }
+    # what details_enricher stores: floats parsed as Decimal
+    return json.loads(json.dumps(doc), parse_float=Decimal)
+
+
+def _value_size(v):
+    """Approximate DynamoDB attribute value size (AWS 'Item sizes' rules)."""
+    (kind, val), = v.items()
+    if kind == "S":
+        return len(val.encode())
+    if kind == "N":
+        digits = len(val.lstrip("-").replace(".", "").lstrip("0")) or 1
+        return math.ceil(digits / 2) + 1
+    if kind == "B":
+        return len(val)
+    if kind in ("BOOL", "NULL"):
+        return 1
+    if kind == "L":
+        return 3 + sum(_value_size(x) + 1 for x in val)
+    if kind == "M":
+        return 3 + sum(len(k.encode()) + _value_size(x) + 1 for k, x in val.items())
+    raise ValueError(kind)
+
+
+def item_size(item):
+    ser = TypeSerializer()
+    return sum(len(k.encode()) + _value_size(ser.serialize(v)) for k, v in item.items())
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return round(statistics.median(samples), 3), round(samples[int(0.95 * (len(samples) - 1))], 3)
+
+
+def bench(frames, reads, table, s3, rnd):
+    doc = make_sidecar(frames, rnd)
+    rows = []
+    variants = {
+        "map": {"details": doc},
+        "blob": details_store.build_item("blob", doc),
+    }
+    if len(details_store.encode(doc)) > details_store.SPILL_BYTES:
+        variants["s3"] = details_store.build_item("s3", doc, s3, BUCKET)
+    for name, attrs in variants.items():
+        item = {"trackId": f"{name}-{frames}", **attrs}
+        size = item_size(item)
+        row = {"frames": frames, "repr": name, "itemBytes": size,
+               "wcu": math.ceil(size / 1024), "rcu": math.ceil(size / 4096)}
+        if size > ITEM_LIMIT:
+            rows.append({**row, "error": "over 400 KB item limit"})
+            continue
+        row["putMs"], row["putP95"] = timed(lambda: table.put_item(Item=item), max(5, reads // 10))
+        row["getMs"], row["getP95"] = timed(
+            lambda: details_store.load_details(table, item["trackId"], s3, BUCKET), reads)
+        stored = table.get_item(Key={"trackId": item["trackId"]})["Item"]
+        if name == "map":  # the map is decoded inside get_item: time that step alone
+            wire = {k: TypeSerializer().serialize(v) for k, v in stored.items()}
+            row["decodeMs"], _ = timed(
+                lambda: {k: TypeDeserializer().deserialize(v) for k, v in wire.items()}, reads)
+        else:
+            row["decodeMs"], _ = timed(lambda: details_store.read_details(stored, s3, BUCKET), reads)
+        assert details_store.read_details(stored, s3, BUCKET) == doc
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", default="0,100,1000", help="comma separated analysis rows per sidecar")
+    parser.add_argument("--reads", type=int, default=50, help="get_item samples per row")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    rows = []
+    with mock_aws():
+        s3 = boto3.client("s3", region_name=REGION)
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+        table = boto3.resource("dynamodb", region_name=REGION).create_table(
+            TableName="TrackDetails",
+            KeySchema=[{"AttributeName": "trackId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "trackId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for frames in (int(f) for f in args.frames.split(",")):
+            rows += bench(frames, args.reads, table, s3, rnd)
+
+    header = (f"{'frames':>7} {'repr':>5} {'item KB':>8} {'WCU':>4} {'RCU':>4} "
+              f"{'put ms':>7} {'get ms':>7} {'get p95':>8} {'decode ms':>10}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        if "error" in r:
+            print(f"{r['frames']:>7} {r['repr']:>5} {r['itemBytes'] / 1024:>8.1f} {r['wcu']:>4} {r['rcu']:>4}  {r['error']}")
+            continue
+        print(f"{r['frames']:>7} {r['repr']:>5} {r['itemBytes'] / 1024:>8.1f} {r['wcu']:>4} {r['rcu']:>4} "
+              f"{r['putMs']:>7} {r['getMs']:>7} {r['getP95']:>8} {r['decodeMs']:>10}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
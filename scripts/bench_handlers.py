@@ -0,0 +1,296 @@
+"""
+Handler latency, peak memory and payload size against a synthetic library.
+
+    python scripts/bench_handlers.py --sizes 1000,10000 --runs 20 --json handlers.json
+    python scripts/bench_handlers.py --sizes 100000 --runs 10 --compare handlers.json
+
+For every --sizes library an in-process moto is seeded with that many
+tracks (realistic learning states spread around today, playback keys for
+every rendition, promoted sidecar fields, a share of pending uploads), the
+due counters item and a pool of meta/ sidecars. Each handler is then invoked
+with a representative event: one warm-up call (client construction is
+bench_cold_start.py's job), --runs timed calls, and one more call under
+tracemalloc for the peak.
+
+  list_tracks / generate_presigned_url_download   GET /tracks (full scan)
+  get_due_tracks                                  GET /tracks/due?limit=40
+  update_stats                                    POST /stats, random learning track and grade
+  lookup_by_filename                              GET /lookup?fileName=<random existing file>
+  details_enricher                                S3 event with --enrich-batch new sidecars
+
+moto runs in this process, so the latency and the peak memory include the
+emulated service side; compare rows of the same size across commits
+(--compare) rather than reading them as Lambda numbers. Payload is the
+response body in bytes. A handler is cut after --max-seconds of timed calls
+(at least 3), which matters for the scans at 100k.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils", "python")]
+for k, v in {
+    "AWS_DEFAULT_REGION": "eu-north-1", "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+    "DYNAMODB_TABLE": "Tracks", "TRACKS_TABLE": "Tracks", "DETAILS_TABLE": "TrackDetails",
+    "STATS_TABLE": "LearningStats", "BUCKET_NAME": "wave-loft-audio-bucket", "S3_BUCKET": "wave-loft-audio-bucket",
+    "TRACE": "off",
+}.items():
+    os.environ.setdefault(k, v)
+
+import boto3  # noqa: E402
+import moto  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import due_counters  # noqa: E402
+
+REGION = os.environ["AWS_DEFAULT_REGION"]
+BUCKET = os.environ["BUCKET_NAME"]
+LEARNING_PK = "DJ"
+
+HANDLERS = ["list_tracks", "get_due_tracks", "update_stats", "lookup_by_filename",
+            "generate_presigned_url_download", "details_enricher"]
+MODULES = {
+    "list_tracks": "tracks.list_tracks", "get_due_tracks": "tracks.get_due_tracks",
+    "update_stats": "tracks.update_stats", "lookup_by_filename": "tracks.lookup_by_filename",
+    "generate_presigned_url_download": "audio.generate_presigned_url_download",
+    "details_enricher": "tracks.details_enricher",
+}
+
+ARTISTS = [f"Artist {i}" for i in range(400)]
+MOODS = ["dark", "driving", "hypnotic", "euphoric", "deep", "melodic", "raw", "warm"]
+STYLES = ["techno", "house", "minimal", "electro", "breaks", "ambient", "trance"]
+
+
+def make_track(i, rnd, now):
+    artist = rnd.choice(ARTISTS)
+    title = f"Track {i} ({rnd.choice(['Original', 'Extended', 'Dub'])} Mix)"
+    tid = f"trk-{i:07d}"
+    file_name = f"{artist} - {title}.flac"
+    item = {
+        "id": tid, "title": title, "artist": artist, "album": f"Album {i // 10}", "fileName": file_name,
+        "uploadedAt": (now - timedelta(days=rnd.uniform(0, 900))).isoformat(),
+        "moods": set(rnd.sample(MOODS, rnd.randint(1, 3))),
+        "style": set(rnd.sample(STYLES, rnd.randint(1, 2))),
+        "danceability": Decimal(str(round(rnd.uniform(0.3, 0.95), 3))),
+        "bpm": Decimal(str(round(rnd.uniform(90, 145), 1))),
+        "year": rnd.randint(1990, 2026),
+    }
+    if rnd.random() < 0.05:  # uploaded, transcode not finished
+        item["audioS3Key"] = "flac/pending"
+    else:
+        item.update(audioS3Key=f"mp3/{tid}.mp3", lowBitrateS3Key=f"aac/{tid}.m4a",
+                    previewS3Key=f"preview/{tid}.mp3", durationSec=Decimal(str(round(rnd.uniform(180, 600), 1))))
+    if rnd.random() < 0.6:
+        item["albumArtS3Key"] = f"album_art/{tid}.jpg"
+    if rnd.random() < 0.85:  # in the learning loop; the rest were never graded
+        reps = rnd.randint(0, 12)
+        item.update(
+            pkLearning=LEARNING_PK,
+            ease=Decimal(str(round(rnd.uniform(1.3, 2.8), 2))),
+            reps=reps,
+            interval=0 if reps == 0 else min(365, int(1.8 ** reps)),
+            nextReviewAt=(now + timedelta(days=rnd.uniform(-30, 60))).replace(microsecond=0).isoformat(),
+            lastGuessAt=(now - timedelta(days=rnd.uniform(0, 60))).isoformat(),
+        )
+    return item
+
+
+def make_sidecar(item, rnd):
+    return {
+        "meta": {"artist": item["artist"], "title": item["title"], "moods": ", ".join(sorted(item["moods"])),
+                 "style": sorted(item["style"]), "year": item["year"]},
+        "features": {"bpm": round(rnd.uniform(90, 145), 2), "danceability": round(rnd.random(), 3),
+                     "energy": round(rnd.random(), 3), "key": rnd.choice(["Am", "Cm", "F#m", "G"])},
+    }
+
+
+def seed(size, sidecars, rnd):
+    ddb = boto3.resource("dynamodb", region_name=REGION)
+    tracks = ddb.create_table(
+        TableName="Tracks", KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"},
+                              {"AttributeName": "pkLearning", "AttributeType": "S"},
+                              {"AttributeName": "nextReviewAt", "AttributeType": "S"}],
+        GlobalSecondaryIndexes=[{"IndexName": "LearningIndex",
+                                 "KeySchema": [{"AttributeName": "pkLearning", "KeyType": "HASH"},
+                                               {"AttributeName": "nextReviewAt", "KeyType": "RANGE"}],
+                                 "Projection": {"ProjectionType": "ALL"}}],
+        BillingMode="PAY_PER_REQUEST")
+    for name, key in (("LearningStats", "id"), ("TrackDetails", "trackId")):
+        ddb.create_table(TableName=name, KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                         AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                         BillingMode="PAY_PER_REQUEST")
+    s3 = boto3.client("s3", region_name=REGION)
+    s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+
+    now = datetime.now(timezone.utc)
+    items, due = [], {}
+    with tracks.batch_writer() as batch:
+        for i in range(size):
+            item = make_track(i, rnd, now)
+            batch.put_item(Item=item)
+            items.append({k: item.get(k) for k in ("id", "fileName", "pkLearning", "artist", "title",
+                                                   "moods", "style", "year")})
+            if due_counters.is_counted(item):
+                b = due_counters.bucket_for(item["nextReviewAt"])
+                due[b] = due.get(b, 0) + 1
+    ddb.Table("LearningStats").put_item(Item={"id": due_counters.DUE_STATS_ID, **due})
+
+    keys = []
+    for item in rnd.sample(items, min(sidecars, len(items))):
+        key = f"meta/{item['id']}.json"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps(make_sidecar(item, rnd)).encode())
+        keys.append(key)
+    return items, keys
+
+
+def make_events(items, sidecar_keys, enrich_batch, rnd):
+    learning = [i["id"] for i in items if i["pkLearning"]]
+    pending = list(sidecar_keys)
+
+    def enrich():
+        batch = [pending.pop() for _ in range(min(enrich_batch, len(pending)))]
+        return {"Records": [{"eventSource": "aws:s3", "s3": {"bucket": {"name": BUCKET}, "object": {"key": k}}}
+                            for k in batch]}
+
+    return {
+        "list_tracks": lambda: {"httpMethod": "GET", "path": "/tracks"},
+        "generate_presigned_url_download": lambda: {"httpMethod": "GET", "path": "/tracks/presigned"},
+        "get_due_tracks": lambda: {"httpMethod": "GET", "queryStringParameters": {"limit": "40"}},
+        "update_stats": lambda: {"httpMethod": "POST", "body": json.dumps(
+            {"trackId": rnd.choice(learning), "grade": rnd.randint(0, 5)})},
+        "lookup_by_filename": lambda: {"httpMethod": "GET", "queryStringParameters": {
+            "fileName": rnd.choice(items)["fileName"]}},
+        "details_enricher": enrich,
+    }
+
+
+def invoke(handler, event):
+    with contextlib.redirect_stdout(io.StringIO()):  # handlers print per call
+        return handler(event, None)
+
+
+def payload_bytes(resp):
+    body = (resp or {}).get("body") if isinstance(resp, dict) else None
+    if body is None:
+        return len(json.dumps(resp, default=str).encode()) if resp is not None else 0
+    return len(body.encode() if isinstance(body, str) else body)
+
+
+def pct(samples, p):
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(p * len(s)))], 2)
+
+
+def bench(name, handler, make_event, runs, max_seconds):
+    invoke(handler, make_event())  # warm-up
+    samples, statuses, payload = [], set(), 0
+    started = time.perf_counter()
+    for i in range(runs):
+        event = make_event()
+        t0 = time.perf_counter()
+        resp = invoke(handler, event)
+        samples.append((time.perf_counter() - t0) * 1000)
+        statuses.add(resp.get("statusCode") if isinstance(resp, dict) else None)
+        payload = max(payload, payload_bytes(resp))
+        if i >= 2 and time.perf_counter() - started > max_seconds:
+            break
+
+    event = make_event()
+    tracemalloc.start()
+    try:
+        invoke(handler, event)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "handler": name, "runs": len(samples), "status": sorted(statuses, key=str),
+        "p50Ms": pct(samples, 0.50), "p95Ms": pct(samples, 0.95), "p99Ms": pct(samples, 0.99),
+        "peakKb": round(peak / 1024), "payloadBytes": payload,
+    }
+
+
+def run_size(size, args):
+    import importlib
+    rnd = random.Random(args.seed)
+    rows = []
+    with mock_aws():
+        t0 = time.perf_counter()
+        sidecars = args.enrich_batch * (args.runs + 2)
+        items, keys = seed(size, sidecars if "details_enricher" in args.handlers else 0, rnd)
+        print(f"seeded {size} tracks + {len(keys)} sidecars in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        events = make_events(items, keys, args.enrich_batch, rnd)
+        for name in args.handlers:
+            handler = importlib.import_module(MODULES[name]).lambda_handler
+            rows.append({"size": size, **bench(name, handler, events[name], args.runs, args.max_seconds)})
+            print(f"  {name}: done", file=sys.stderr)
+    return rows
+
+
+def compare(rows, path):
+    with open(path) as f:
+        old = {(r["size"], r["handler"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {path}")
+    for r in rows:
+        o = old.get((r["size"], r["handler"]))
+        if not o:
+            continue
+        delta = lambda k: f"{(r[k] - o[k]) / o[k]:+.0%}" if o[k] else "n/a"  # noqa: E731
+        print(f"{r['size']:>7} {r['handler']:<32} p50 {delta('p50Ms'):>6}  p95 {delta('p95Ms'):>6}  "
+              f"peak {delta('peakKb'):>6}  payload {delta('payloadBytes'):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="library sizes, e.g. 1000,10000,100000")
+    parser.add_argument("--handlers", default=",".join(HANDLERS))
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-seconds", type=float, default=60, help="time budget of the timed calls per handler")
+    parser.add_argument("--enrich-batch", type=int, default=10, help="sidecars per details_enricher event")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier --json report to diff against")
+    args = parser.parse_args()
+    args.handlers = [h for h in args.handlers.split(",") if h]
+    unknown = set(args.handlers) - set(HANDLERS)
+    if unknown:
+        parser.error(f"unknown handlers: {', '.join(sorted(unknown))}")
+    logging.disable(logging.INFO)
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        rows += run_size(size, args)
+
+    header = (f"{'tracks':>7} {'handler':<32} {'runs':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'peak KB':>8} {'payload B':>10}  status")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['size']:>7} {r['handler']:<32} {r['runs']:>4} {r['p50Ms']:>8} {r['p95Ms']:>8} {r['p99Ms']:>8} "
+              f"{r['peakKb']:>8} {r['payloadBytes']:>10}  {','.join(map(str, r['status']))}")
+    if args.compare:
+        compare(rows, args.compare)
+    if args.json:
+        report = {
+            "createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "boto3": boto3.__version__, "moto": moto.__version__,
+            "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+            "results": rows,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Response encoding: json.dumps(cls=_DecimalEncoder) vs cors_utils.dumps on large track lists.
+
+    python scripts/bench_json.py --sizes 100,1000,5000 --repeat 30
+
+Builds {"tracks": [...]} bodies the way the listing endpoints return them
+(boto3 resource items: Decimal for every number, a presigned URL per item),
+once with only the learning/playback numbers and once with the promoted
+sidecar fields (moods / style string sets), which take the fallback
+encoder. Every variant is checked to be byte-identical to the old output
+before it is timed; reports the best of --repeat runs, interleaved.
+
+The last column encodes the same body with its Decimals already turned
+into floats: the floor for any Decimal-based encoder, i.e. what reading
+numbers as int/float in the first place would save on top.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils", "python"))
+
+import cors_utils  # noqa: E402
+
+
+def make_item(i, rnd, promoted):
+    tid = f"trk-{i:07d}"
+    item = {
+        "id": tid, "title": f"Track {i} (Original Mix)", "artist": f"Artist {rnd.randrange(400)}",
+        "album": f"Album {i // 10}", "fileName": f"Artist - Track {i}.flac", "audioS3Key": f"mp3/{tid}.mp3",
+        "lowBitrateS3Key": f"aac/{tid}.m4a", "previewS3Key": f"preview/{tid}.mp3",
+        "uploadedAt": "2026-03-14T09:26:53.589793+00:00", "pkLearning": "DJ",
+        "ease": Decimal(str(round(rnd.uniform(1.3, 2.8), 4))), "reps": Decimal(rnd.randint(0, 12)),
+        "interval": Decimal(rnd.randint(0, 365)), "nextReviewAt": "2026-10-20T00:00:00+00:00",
+        "lastGuessAt": "2026-10-01T18:02:11.120001+00:00", "durationSec": Decimal(str(round(rnd.uniform(180, 600), 1))),
+        "loudnessLufs": Decimal(str(round(rnd.uniform(-14, -6), 1))), "replayGainDb": Decimal("-8.7"),
+        "presignedUrl": f"https://wave-loft-audio-bucket.s3.amazonaws.com/preview/{tid}.mp3?X-Amz-Algorithm="
+                        f"AWS4-HMAC-SHA256&X-Amz-Signature={'%064x' % rnd.getrandbits(256)}",
+    }
+    if promoted:
+        item.update(bpm=Decimal(str(round(rnd.uniform(90, 145), 1))),
+                    danceability=Decimal(str(round(rnd.random(), 3))), year=Decimal(rnd.randint(1990, 2026)),
+                    moods={"dark", "driving", "hypnotic"}, style={"techno"})
+    return item
+
+
+def best_ms(variants, body, repeat):
+    """Best time per variant, alternating them so machine noise hits all of them alike."""
+    best = [float("inf")] * len(variants)
+    for _ in range(repeat):
+        for i, fn in enumerate(variants):
+            best[i] = min(best[i], timeit.timeit(lambda: fn(body), number=1))
+    return [b * 1000 for b in best]
+
+
+def without_decimals(obj):
+    if isinstance(obj, dict):
+        return {k: without_decimals(v) for k, v in obj.items()}
+    if isinstance(obj, (list, set)):
+        return [without_decimals(v) for v in (sorted(obj) if isinstance(obj, set) else obj)]
+    return float(obj) if isinstance(obj, Decimal) else obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,5000")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    old = lambda body: json.dumps(body, cls=cors_utils._DecimalEncoder)  # noqa: E731
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for promoted in (False, True):
+            rnd = random.Random(size)
+            body = {"tracks": [make_item(i, rnd, promoted) for i in range(size)]}
+            if cors_utils.dumps(body) != old(body):
+                raise SystemExit(f"output differs for size={size} promoted={promoted}")
+            plain = without_decimals(body)
+            before, after, floor = best_ms([old, cors_utils.dumps, lambda _: json.dumps(plain)], body, args.repeat)
+            rows.append({"tracks": size, "promotedSets": promoted, "bytes": len(old(body)),
+                         "decimalEncoderMs": round(before, 2), "dumpsMs": round(after, 2),
+                         "speedup": round(before / after, 2), "noDecimalMs": round(floor, 2)})
+
+    header = (f"{'tracks':>7} {'sets':>5} {'KB':>7} {'_DecimalEncoder ms':>19} {'dumps ms':>9} {'speedup':>8} "
+              f"{'no-Decimal ms':>14}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['tracks']:>7} {'yes' if r['promotedSets'] else 'no':>5} {r['bytes'] / 1024:>7.0f} "
+              f"{r['decimalEncoderMs']:>19} {r['dumpsMs']:>9} {r['speedup']:>7}x {r['noDecimalMs']:>14}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
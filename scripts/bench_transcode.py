@@ -0,0 +1,118 @@
+"""
+Throughput of flac_to_mp3_handler per stage, against an in-process moto S3.
+
+    python scripts/bench_transcode.py --minutes 1,5,20 --modes stream,file
+    python scripts/bench_transcode.py --cpus 2     # ~ a 3538 MB Lambda (1769 MB per vCPU)
+
+Needs moto and a real ffmpeg (FFMPEG_PATH, default "ffmpeg") with libmp3lame.
+FLAC fixtures of the given lengths (stereo 44.1 kHz, pink noise so they
+compress like music) are generated once into --fixtures and reused.
+
+Prints one row per fixture and mode from the per-record "timings" the
+handler returns (the same numbers it emits as EMF metrics in Lambda):
+download MB/s, encode x realtime, upload MB/s, DB update ms and total.
+moto answers in-process, so download/upload rates here are an upper bound;
+encode is the figure that carries over to Lambda.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [os.path.join(ROOT, "transcode"), os.path.join(ROOT, "utils", "python")]
+os.environ.setdefault("DYNAMODB_TABLE", "Tracks")
+os.environ.setdefault("BUCKET_NAME", "bench-audio")
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("FFMPEG_PATH", shutil.which("ffmpeg") or "ffmpeg")
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+import transcode  # noqa: E402
+
+BUCKET = os.environ["BUCKET_NAME"]
+REGION = os.environ["AWS_DEFAULT_REGION"]
+
+
+def make_fixture(path, minutes):
+    if os.path.exists(path):
+        return
+    subprocess.run([transcode.FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.3:sample_rate=44100:d={minutes * 60}",
+                    "-ac", "2", "-c:a", "flac", path], check=True)
+
+
+def run(fixture, mode, s3, table):
+    name = os.path.basename(fixture)
+    key = f"flac/{mode}-{name}"
+    track_id = f"{mode}-{name}"
+    table.put_item(Item={"id": track_id, "audioS3Key": key})
+    s3.upload_file(fixture, BUCKET, key, ExtraArgs={"Metadata": {"trackid": track_id}})
+    transcode.TRANSCODE_MODE = mode
+    event = {"Records": [{"s3": {"bucket": {"name": BUCKET}, "object": {"key": key, "size": 0}}}]}
+    with contextlib.redirect_stdout(io.StringIO()):  # the handler's own log lines
+        result = json.loads(transcode.flac_to_mp3_handler(event, None)["body"])["results"][0]
+    if result["status"] != "ok":
+        raise SystemExit(f"{name} ({mode}) failed: {result.get('error')}")
+    return result["timings"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", default="1,5,20", help="comma separated fixture lengths")
+    parser.add_argument("--modes", default="stream,file", help="TRANSCODE_MODE values to compare")
+    parser.add_argument("--fixtures", default=os.path.join(ROOT, ".bench-fixtures"), help="fixture cache dir")
+    parser.add_argument("--cpus", type=int, help="pin to this many CPUs (Lambda gets one per 1769 MB)")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    if args.cpus:
+        os.sched_setaffinity(0, set(sorted(os.sched_getaffinity(0))[:args.cpus]))
+    transcode.TRANSCODE_WORKERS = 1
+    transcode.TRANSCODE_CACHE_TABLE = None  # every run must really encode
+    os.makedirs(args.fixtures, exist_ok=True)
+    fixtures = []
+    for minutes in (float(m) for m in args.minutes.split(",")):
+        path = os.path.join(args.fixtures, f"noise-{minutes:g}min.flac")
+        make_fixture(path, minutes)
+        fixtures.append(path)
+
+    rows = []
+    with mock_aws():
+        s3 = boto3.client("s3", region_name=REGION)
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+        table = boto3.resource("dynamodb", region_name=REGION).create_table(
+            TableName=os.environ["DYNAMODB_TABLE"],
+            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for fixture in fixtures:
+            for mode in args.modes.split(","):
+                rows.append({"fixture": os.path.basename(fixture),
+                             "sizeMB": round(os.path.getsize(fixture) / 1e6, 1),
+                             **run(fixture, mode, s3, table)})
+
+    print(f"\ncpus={len(os.sched_getaffinity(0))} renditions={','.join(transcode.ENABLED_RENDITIONS) or '-'}")
+    header = (f"{'fixture':<22} {'MB':>6} {'mode':>9} {'dl MB/s':>8} {'enc xRT':>8} "
+              f"{'ul MB/s':>8} {'db ms':>6} {'total s':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['fixture']:<22} {r['sizeMB']:>6} {r['mode']:>9} {r.get('downloadMBps', 0):>8} "
+              f"{r.get('encodeRealtime', 0):>8} {r.get('uploadMBps', 0):>8} "
+              f"{r['dbSeconds'] * 1000:>6.0f} {r['totalSeconds']:>8}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Single-process vs segment-parallel MP3 encode of a long mix, on this machine.
+
+    python scripts/bench_transcode_segments.py --minutes 60 --workers 2,4,8
+    python scripts/bench_transcode_segments.py --source my_mix.flac
+
+Needs a real ffmpeg (FFMPEG_PATH, default "ffmpeg") built with libmp3lame.
+Without --source a stereo test signal (chirp + tone bursts, which make clicks
+at a splice easy to see) is generated as FLAC.
+
+Besides wall time it checks the spliced output against the single-process
+encode: same number of decoded samples once the decoder has trimmed the
+encoder delay and padding each Info frame declares, and around every join
+the difference between the two decodes is no larger than elsewhere in the
+file (a gap, duplicated frame or unprimed encoder shows up as a spike there).
+"""
+import argparse
+import array
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [os.path.join(ROOT, "transcode"), os.path.join(ROOT, "utils", "python")]
+os.environ.setdefault("DYNAMODB_TABLE", "Tracks")
+os.environ.setdefault("BUCKET_NAME", "bench")
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+os.environ.setdefault("FFMPEG_PATH", shutil.which("ffmpeg") or "ffmpeg")
+
+import audio_keys  # noqa: E402
+import transcode  # noqa: E402
+
+WINDOW = 4096  # samples compared around each join
+
+
+def make_source(path, minutes):
+    expr = "0.4*sin(2*PI*(200+t*3)*t)+0.3*sin(2*PI*1000*t)*lt(mod(t,2),0.05)"
+    subprocess.run([transcode.FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"aevalsrc='{expr}|{expr}':s=44100:d={minutes * 60}",
+                    "-c:a", "flac", path], check=True)
+
+
+def decode(mp3_path):
+    """Decoded 16-bit samples (interleaved stereo) of an MP3."""
+    raw = subprocess.run([transcode.FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-i", mp3_path,
+                          "-f", "s16le", "-ac", "2", "-ar", "44100", "pipe:1"],
+                         check=True, capture_output=True).stdout
+    return array.array("h", raw)
+
+
+def max_diff(a, b, frame):
+    lo, hi = max(0, 2 * (frame - WINDOW // 2)), 2 * (frame + WINDOW // 2)
+    return max((abs(x - y) for x, y in zip(a[lo:hi], b[lo:hi])), default=0)
+
+
+def check_joins(single, spliced, plan):
+    """(worst diff at a join, typical diff elsewhere) between the two decodes."""
+    # decoders drop the encoder delay plus their own 529-sample delay from the front
+    trimmed = transcode.LAME_ENCODER_DELAY + 529
+    joins = [seg["start"] + seg["drop"] * transcode.MP3_FRAME_SAMPLES - trimmed for seg in plan[1:]]
+    controls = [(a + b) // 2 for a, b in zip([0] + joins, joins + [len(single) // 2])]
+    at_joins = max((max_diff(single, spliced, j) for j in joins), default=0)
+    elsewhere = sorted(max_diff(single, spliced, c) for c in controls)[len(controls) // 2]
+    return at_joins, elsewhere
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source", help="lossless file to encode (default: generated test signal)")
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--workers", default=",".join(str(n) for n in (2, 4, os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench-segments-")
+    try:
+        src = args.source or os.path.join(work_dir, "source.flac")
+        if not args.source:
+            make_source(src, args.minutes)
+        with open(src, "rb") as f:
+            head = f.read(transcode.PROBE_BYTES)
+        fmt, duration = audio_keys.sniff_format(head), audio_keys.header_duration(head)
+        if not fmt or not duration:
+            sys.exit(f"{src}: not a FLAC/WAV/AIFF with a known duration")
+
+        single_path = os.path.join(work_dir, "single.mp3")
+        cmd = transcode.build_ffmpeg_cmd(src, single_path, {}, fmt)
+        started = time.monotonic()
+        subprocess.run(cmd, check=True)
+        single_s = time.monotonic() - started
+        single = decode(single_path)
+
+        print(f"source: {fmt} {duration / 60:.1f} min, cpus={os.cpu_count()}")
+        print(f"{'workers':>8} {'seconds':>8} {'speedup':>8} {'x realtime':>10} "
+              f"{'samples':>8} {'joinDiff':>9} {'baseDiff':>9}")
+        print(f"{1:>8} {single_s:>8.1f} {1:>8.2f} {duration / single_s:>10.0f} {'ok':>8} {'-':>9} {'-':>9}")
+        for workers in sorted({int(w) for w in args.workers.split(",") if int(w) > 1}):
+            out = os.path.join(work_dir, f"segmented-{workers}.mp3")
+            started = time.monotonic()
+            transcode.encode_segmented(src, out, {}, fmt, duration, workers)
+            elapsed = time.monotonic() - started
+            spliced = decode(out)
+            plan = transcode.plan_segments(int(round(duration * transcode.MP3_RATE)), workers)
+            at_joins, elsewhere = check_joins(single, spliced, plan)
+            samples = "ok" if len(single) == len(spliced) else "DIFF"
+            print(f"{workers:>8} {elapsed:>8.1f} {single_s / elapsed:>8.2f} {duration / elapsed:>10.0f} "
+                  f"{samples:>8} {at_joins:>9} {elsewhere:>9}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Rank endpoints by DynamoDB capacity consumed per request.
+
+    python scripts/capacity_report.py exported-logs/*.log
+    python scripts/capacity_report.py --log-group /aws/lambda/ListTracksFunction \
+        --log-group /aws/lambda/LookupByFileNameFunction --hours 24 --json capacity.json
+
+Reads the per-invocation trace records (UtilsLayer `tracing`, one JSON line
+per invocation with ReadCapacityUnits / WriteCapacityUnits and a per-table
+`capacity` breakdown) from log files, stdin ("-") or CloudWatch log groups,
+groups them by function and, for the API router, by route, and prints
+requests, mean and p95 RCU / WCU per request and each endpoint's share of
+the total. Rows are ordered by mean capacity per request (--by).
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+
+
+def parse_line(line):
+    """The trace record in a log line (plain JSON or Lambda's "ts\\trequestId\\tLEVEL\\t{...}"), else None."""
+    start = line.find("{")
+    if start < 0 or "CapacityUnits" not in line:
+        return None
+    try:
+        record = json.loads(line[start:])
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and "ReadCapacityUnits" in record else None
+
+
+def read_files(paths):
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path)
+        with f:
+            for line in f:
+                record = parse_line(line)
+                if record:
+                    yield record
+
+
+def read_log_groups(groups, hours):
+    if not groups:
+        return
+    import boto3
+    logs = boto3.client("logs")
+    start = int((time.time() - hours * 3600) * 1000)
+    for group in groups:
+        pages = logs.get_paginator("filter_log_events").paginate(
+            logGroupName=group, startTime=start, filterPattern="{ $.ReadCapacityUnits = * }")
+        for page in pages:
+            for event in page["events"]:
+                record = parse_line(event["message"])
+                if record:
+                    yield record
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0
+
+
+def rank(records, by="total"):
+    groups = defaultdict(list)
+    for r in records:
+        endpoint = r.get("Function") or r.get("trace") or "?"
+        if r.get("route"):
+            endpoint += f" {r['route']}"
+        groups[endpoint].append(r)
+
+    grand = sum(r["ReadCapacityUnits"] + r["WriteCapacityUnits"] for r in records) or 1
+    rows = []
+    for endpoint, rs in groups.items():
+        rcu = [r["ReadCapacityUnits"] for r in rs]
+        wcu = [r["WriteCapacityUnits"] for r in rs]
+        tables = defaultdict(float)
+        for r in rs:
+            for table, c in (r.get("capacity") or {}).items():
+                tables[table] += c.get("rcu", 0) + c.get("wcu", 0)
+        rows.append({
+            "endpoint": endpoint, "requests": len(rs),
+            "rcuPerRequest": round(sum(rcu) / len(rs), 2), "rcuP95": round(float(percentile(rcu, 0.95)), 2),
+            "wcuPerRequest": round(sum(wcu) / len(rs), 2), "wcuP95": round(float(percentile(wcu, 0.95)), 2),
+            "share": round((sum(rcu) + sum(wcu)) / grand, 3),
+            "tables": {t: round(v / len(rs), 2) for t, v in sorted(tables.items(), key=lambda kv: -kv[1])},
+        })
+    key = {"rcu": lambda r: r["rcuPerRequest"], "wcu": lambda r: r["wcuPerRequest"],
+           "total": lambda r: r["rcuPerRequest"] + r["wcuPerRequest"], "share": lambda r: r["share"]}[by]
+    return sorted(rows, key=key, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="log files with trace records ('-' for stdin)")
+    parser.add_argument("--log-group", action="append", default=[], help="CloudWatch log group (repeatable)")
+    parser.add_argument("--hours", type=float, default=24, help="how far back to read the log groups")
+    parser.add_argument("--by", choices=("total", "rcu", "wcu", "share"), default="total")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+    if not args.files and not args.log_group:
+        parser.error("give log files, '-' or --log-group")
+
+    records = list(read_files(args.files)) + list(read_log_groups(args.log_group, args.hours))
+    if not records:
+        raise SystemExit("no trace records with consumed capacity found")
+    rows = rank(records, args.by)
+
+    header = (f"{'endpoint':<36} {'requests':>8} {'RCU/req':>8} {'RCU p95':>8} "
+              f"{'WCU/req':>8} {'WCU p95':>8} {'share':>6}  top table")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        top = next(iter(r["tables"].items()), None)
+        print(f"{r['endpoint']:<36} {r['requests']:>8} {r['rcuPerRequest']:>8} {r['rcuP95']:>8} "
+              f"{r['wcuPerRequest']:>8} {r['wcuP95']:>8} {r['share']:>6.1%}  "
+              + (f"{top[0]} ({top[1]}/req)" if top else ""))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Mint the signed header that makes one API request profile itself.
+
+    curl -H "$(python scripts/profile_header.py get_due_tracks)" "$API/tracks/due?limit=40"
+    python scripts/profile_header.py api_router --ttl 300 --param /wave-loft/profile-secret
+
+The function name is the one passed to tracing.traced (the module name; the
+API router when ApiLayout=router). The secret is read from the SSM
+SecureString the stack's ProfileSecretParameter names (--param, or
+PROFILE_SECRET_PARAM), or given directly with --secret / PROFILE_SECRET. The response carries X-Profile-Key; the profile is at
+s3://<PROFILE_BUCKET>/<key>.prof (pstats) and <key>.json (summary and top
+allocation sites).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils", "python"))
+
+import profiling  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("function")
+    parser.add_argument("--secret", default=os.environ.get("PROFILE_SECRET"))
+    parser.add_argument("--param", default=os.environ.get("PROFILE_SECRET_PARAM"),
+                        help="SSM SecureString holding the secret")
+    parser.add_argument("--ttl", type=int, default=900, help=f"seconds the header stays valid (max {profiling.MAX_TTL})")
+    args = parser.parse_args()
+    if not args.secret and args.param:
+        import boto3
+        args.secret = boto3.client("ssm").get_parameter(Name=args.param, WithDecryption=True)["Parameter"]["Value"]
+    if not args.secret:
+        parser.error("--param/PROFILE_SECRET_PARAM or --secret/PROFILE_SECRET is required")
+    print(f"X-Profile: {profiling.sign(args.function, args.secret, min(args.ttl, profiling.MAX_TTL))}")
+
+
+if __name__ == "__main__":
+    main()
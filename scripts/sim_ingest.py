@@ -0,0 +1,353 @@
+"""
+End-to-end ingest simulator: time-to-playable per track and the bottleneck stage.
+
+    python scripts/sim_ingest.py --tracks 40 --rate 2 --size-mb 4
+    python scripts/sim_ingest.py --tracks 200 --rate 10 --transcode-concurrency 4 --json ingest.json
+
+Replays an upload workload against the real handlers on an in-process moto
+backend. Uploads arrive as a Poisson process (--rate per second) and every
+client does what the app does:
+
+  presign   POST /upload-url              generate_presigned_url_upload
+  upload    PUT tracks/<trackId>.flac     (the presigned PUT, replayed as put_object)
+  create    POST /tracks                  create_track (once the PUT returned)
+  sidecar   PUT meta/<trackId>.json       the analyzer's export, --sidecar-delay after the upload
+
+The bucket's notifications are configured as in template.yaml, with moto
+delivering them to SQS queues: tracks/ -> transcode, meta/ -> the sidecar queue.
+An in-process dispatcher polls both queues and invokes the consumers on
+thread pools sized like their Lambda concurrency. transcode.flac_to_mp3_handler
+gets one S3 event per object (as the direct S3 trigger does).
+details_enricher gets SQS batches of up to --batch-size messages, flushed
+after --batch-window seconds.
+
+A track is playable once create_track has written its item and the
+transcoder has swapped in the MP3 (whichever finishes last); the report
+lists time-to-playable and time-to-enriched percentiles, the mean time each
+stage adds to the critical path and the stage that contributes the most.
+
+Without a real ffmpeg on PATH (or --ffmpeg) the unit tests' stand-in is used:
+it copies bytes instead of encoding, so the transcode stage then measures
+S3 streaming + process overhead only.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils", "python")]
+FAKE_FFMPEG = os.path.join(ROOT, "tests", "unit", "transcode", "fake_ffmpeg.py")
+for k, v in {
+    "AWS_DEFAULT_REGION": "eu-north-1", "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+    "DYNAMODB_TABLE": "Tracks", "TRACKS_TABLE": "Tracks", "DETAILS_TABLE": "TrackDetails",
+    "STATS_TABLE": "LearningStats", "BUCKET_NAME": "wave-loft-audio-bucket", "S3_BUCKET": "wave-loft-audio-bucket",
+    "TRACE": "off",
+}.items():
+    os.environ.setdefault(k, v)
+
+REGION = os.environ["AWS_DEFAULT_REGION"]
+BUCKET = os.environ["BUCKET_NAME"]
+
+# critical-path stages, in pipeline order
+STAGES = ["presign", "upload", "create", "transcodeWait", "transcode"]
+
+
+class Timeline:
+    """Per-track wall-clock marks (seconds since the run started), shared by all threads."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.tracks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, tid, name, at=None):
+        at = (time.perf_counter() if at is None else at) - self.t0
+        with self._lock:
+            self.tracks.setdefault(tid, {})[name] = at
+
+    def get(self, tid):
+        with self._lock:
+            return dict(self.tracks.get(tid, {}))
+
+
+def setup_backend():
+    import boto3
+    ddb = boto3.resource("dynamodb", region_name=REGION)
+    ddb.create_table(
+        TableName="Tracks", KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"},
+                              {"AttributeName": "pkLearning", "AttributeType": "S"},
+                              {"AttributeName": "nextReviewAt", "AttributeType": "S"}],
+        GlobalSecondaryIndexes=[{"IndexName": "LearningIndex",
+                                 "KeySchema": [{"AttributeName": "pkLearning", "KeyType": "HASH"},
+                                               {"AttributeName": "nextReviewAt", "KeyType": "RANGE"}],
+                                 "Projection": {"ProjectionType": "ALL"}}],
+        BillingMode="PAY_PER_REQUEST")
+    for name, key in (("LearningStats", "id"), ("TrackDetails", "trackId")):
+        ddb.create_table(TableName=name, KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                         AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                         BillingMode="PAY_PER_REQUEST")
+
+    s3 = boto3.client("s3", region_name=REGION)
+    sqs = boto3.client("sqs", region_name=REGION)
+    s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+    queues = {}
+    for name in ("transcode", "sidecar"):
+        url = sqs.create_queue(QueueName=f"sim-{name}")["QueueUrl"]
+        arn = sqs.get_queue_attributes(QueueUrl=url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+        queues[name] = (url, arn)
+    s3.put_bucket_notification_configuration(Bucket=BUCKET, NotificationConfiguration={"QueueConfigurations": [
+        {"QueueArn": queues[name][1], "Events": ["s3:ObjectCreated:*"],
+         "Filter": {"Key": {"FilterRules": [{"Name": "prefix", "Value": prefix}]}}}
+        for name, prefix in (("transcode", "tracks/"), ("sidecar", "meta/"))
+    ]})
+    return s3, sqs, {name: url for name, (url, _) in queues.items()}
+
+
+class Dispatcher(threading.Thread):
+    """Emulates the S3 -> Lambda trigger (transcode) and the SQS event source mapping (enricher)."""
+
+    def __init__(self, sqs, queues, timeline, args):
+        super().__init__(daemon=True)
+        from tracks import details_enricher
+        from transcode import transcode
+        self.sqs, self.queues, self.timeline, self.args = sqs, queues, timeline, args
+        self.transcode = transcode.flac_to_mp3_handler
+        self.enrich = details_enricher.lambda_handler
+        self.transcoders = ThreadPoolExecutor(args.transcode_concurrency)
+        self.enrichers = ThreadPoolExecutor(args.enrich_concurrency)
+        self.stop = threading.Event()
+        self.errors = []
+
+    def receive(self, name):
+        resp = self.sqs.receive_message(QueueUrl=self.queues[name], MaxNumberOfMessages=10, WaitTimeSeconds=0)
+        messages = resp.get("Messages", [])
+        for m in messages:
+            self.sqs.delete_message(QueueUrl=self.queues[name], ReceiptHandle=m["ReceiptHandle"])
+        return [m for m in messages if json.loads(m["Body"]).get("Event") != "s3:TestEvent"]
+
+    def run(self):
+        pending, first_at = [], None
+        while not self.stop.is_set():
+            for m in self.receive("transcode"):
+                self.transcoders.submit(self.run_transcode, json.loads(m["Body"]))
+            for m in self.receive("sidecar"):
+                pending.append({"messageId": m["MessageId"], "body": m["Body"], "eventSource": "aws:sqs"})
+                first_at = first_at or time.perf_counter()
+            if pending and (len(pending) >= self.args.batch_size
+                            or time.perf_counter() - first_at >= self.args.batch_window):
+                batch, pending = pending[:self.args.batch_size], pending[self.args.batch_size:]
+                first_at = time.perf_counter() if pending else None
+                self.enrichers.submit(self.run_enrich, batch)
+            time.sleep(0.02)
+
+    @staticmethod
+    def _tid(s3_rec):
+        import urllib.parse
+        key = urllib.parse.unquote_plus(s3_rec["s3"]["object"]["key"])
+        return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+    def run_transcode(self, event):
+        tids = [self._tid(r) for r in event.get("Records", [])]
+        for tid in tids:
+            self.timeline.mark(tid, "transcodeStart")
+        try:
+            resp = self.transcode(event, None)
+            if resp.get("statusCode") != 200:
+                self.errors.append(("transcode", tids, resp.get("body", "")[:300]))
+        except Exception as e:
+            self.errors.append(("transcode", tids, str(e)))
+        for tid in tids:
+            self.timeline.mark(tid, "transcodeEnd")
+
+    def run_enrich(self, batch):
+        tids = [self._tid(r) for m in batch for r in json.loads(m["body"]).get("Records", [])]
+        for tid in tids:
+            self.timeline.mark(tid, "enrichStart")
+        try:
+            resp = self.enrich({"Records": batch}, None)
+            if resp.get("batchItemFailures"):
+                self.errors.append(("enrich", tids, resp["batchItemFailures"]))
+        except Exception as e:
+            self.errors.append(("enrich", tids, str(e)))
+        for tid in tids:
+            self.timeline.mark(tid, "enrichEnd")
+
+
+def upload_client(n, s3, timeline, args, rnd_seed, errors):
+    """One app upload: presign, PUT, create_track, then the analyzer's sidecar."""
+    from audio import generate_presigned_url_upload
+    from tracks import create_track
+    rnd = random.Random(rnd_seed)
+    arrived = time.perf_counter()
+    file_name = f"Sim Artist - Track {n}.flac"
+    resp = generate_presigned_url_upload.lambda_handler(
+        {"httpMethod": "POST", "body": json.dumps({"files": [{"fileName": file_name, "contentType": "audio/flac"}]})},
+        None)
+    url = json.loads(resp["body"])["presignedUrls"][0]
+    tid, key = url["trackId"], url["s3Key"]
+    timeline.mark(tid, "arrived", arrived)
+    timeline.mark(tid, "presigned")
+
+    s3.put_object(Bucket=BUCKET, Key=key, ContentType="audio/flac",
+                  Body=b"fLaC" + rnd.randbytes(int(args.size_mb * 1024 * 1024)))
+    timeline.mark(tid, "uploaded")
+
+    created = create_track.lambda_handler(
+        {"httpMethod": "POST", "body": json.dumps({"files": [{"trackId": tid, "fileName": file_name, "s3Key": key}]})},
+        None)
+    if created.get("statusCode") != 200:
+        errors.append(("create", [tid], created.get("body", "")[:300]))
+    timeline.mark(tid, "created")
+
+    delay = args.sidecar_delay - (time.perf_counter() - timeline.t0 - timeline.get(tid)["uploaded"])
+    if delay > 0:
+        time.sleep(delay)
+    sidecar = {"meta": {"artist": "Sim Artist", "title": f"Track {n}", "moods": "dark, driving"},
+               "features": {"bpm": round(rnd.uniform(90, 145), 2), "danceability": round(rnd.random(), 3)}}
+    s3.put_object(Bucket=BUCKET, Key=f"meta/{tid}.json", Body=json.dumps(sidecar).encode())
+    timeline.mark(tid, "sidecar")
+    return tid
+
+
+def pct(values, p):
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(p * len(s)))], 3) if s else None
+
+
+def analyze(timeline, table, tids):
+    per_track, contrib, dominant = [], {s: 0.0 for s in STAGES + ["enrichWait", "enrich"]}, {}
+    for tid in tids:
+        m = timeline.get(tid)
+        item = table.get_item(Key={"id": tid}).get("Item") or {}
+        playable = str(item.get("audioS3Key", "")).startswith("mp3/")
+        row = {"trackId": tid, "playable": playable, "enriched": "metaFingerprint" in item}
+        if not {"arrived", "presigned", "uploaded", "created"} <= set(m):
+            per_track.append(row)
+            continue
+        stages = {"presign": m["presigned"] - m["arrived"], "upload": m["uploaded"] - m["presigned"],
+                  "create": m["created"] - m["uploaded"]}
+        path = ["presign", "upload", "create"]
+        if "transcodeEnd" in m:
+            stages["transcodeWait"] = m["transcodeStart"] - m["uploaded"]
+            stages["transcode"] = m["transcodeEnd"] - m["transcodeStart"]
+            if m["transcodeEnd"] > m["created"]:  # the transcoder finished last: it is the critical path
+                path = ["presign", "upload", "transcodeWait", "transcode"]
+        if playable:
+            row["timeToPlayable"] = round(max(m["created"], m.get("transcodeEnd", 0)) - m["arrived"], 3)
+            for s in path:
+                contrib[s] += stages[s]
+            worst = max(path, key=stages.get)
+            dominant[worst] = dominant.get(worst, 0) + 1
+        if "enrichEnd" in m:
+            stages["enrichWait"] = m["enrichStart"] - m["sidecar"]
+            stages["enrich"] = m["enrichEnd"] - m["enrichStart"]
+            row["timeToEnriched"] = round(m["enrichEnd"] - m["arrived"], 3)
+            contrib["enrichWait"] += stages["enrichWait"]
+            contrib["enrich"] += stages["enrich"]
+        row["stages"] = {k: round(v, 3) for k, v in stages.items()}
+        per_track.append(row)
+
+    playable = [r for r in per_track if r.get("timeToPlayable") is not None]
+    enriched = [r for r in per_track if r.get("timeToEnriched") is not None]
+    path_share = {s: contrib[s] / len(playable) for s in STAGES} if playable else {}
+    summary = {
+        "tracks": len(tids), "playable": len(playable), "enriched": len(enriched),
+        "timeToPlayable": {p: pct([r["timeToPlayable"] for r in playable], q)
+                           for p, q in (("p50", 0.5), ("p95", 0.95), ("max", 1.0))},
+        "timeToEnriched": {p: pct([r["timeToEnriched"] for r in enriched], q)
+                           for p, q in (("p50", 0.5), ("p95", 0.95), ("max", 1.0))},
+        "criticalPathSeconds": {s: round(v, 3) for s, v in path_share.items()},
+        "enrichSeconds": {s: round(contrib[s] / len(enriched), 3) for s in ("enrichWait", "enrich")} if enriched else {},
+        "bottleneck": max(path_share, key=path_share.get) if path_share else None,
+        "dominantStageCounts": dominant,
+    }
+    return summary, per_track
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=2, help="mean upload arrivals per second")
+    parser.add_argument("--size-mb", type=float, default=2, help="size of every uploaded file")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent uploading clients")
+    parser.add_argument("--sidecar-delay", type=float, default=1.0, help="seconds from upload to the meta/ export")
+    parser.add_argument("--transcode-concurrency", type=int, default=10)
+    parser.add_argument("--enrich-concurrency", type=int, default=5, help="SQS mapping MaximumConcurrency")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--batch-window", type=float, default=1.0,
+                        help="sidecar batching window in seconds (template: 10; shorter keeps runs short)")
+    parser.add_argument("--ffmpeg", help="ffmpeg binary (default: ffmpeg on PATH, else the test stand-in)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write summary + per-track rows to this file")
+    args = parser.parse_args()
+
+    ffmpeg = args.ffmpeg or shutil.which("ffmpeg") or FAKE_FFMPEG
+    os.environ["FFMPEG_PATH"] = ffmpeg
+    logging.disable(logging.INFO)
+
+    import contextlib
+    import io
+    from moto import mock_aws
+    rnd = random.Random(args.seed)
+    with mock_aws(), contextlib.redirect_stdout(io.StringIO()):  # handlers print per call
+        s3, sqs, queues = setup_backend()
+        import aws_clients
+        timeline = Timeline()
+        dispatcher = Dispatcher(sqs, queues, timeline, args)
+        dispatcher.start()
+        client_errors = []
+        with ThreadPoolExecutor(args.clients) as clients:
+            futures = []
+            for n in range(args.tracks):
+                futures.append(clients.submit(upload_client, n, s3, timeline, args, rnd.random(), client_errors))
+                time.sleep(rnd.expovariate(args.rate))
+            tids = [f.result() for f in futures]
+
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            marks = [timeline.get(t) for t in tids]
+            if all("transcodeEnd" in m and "enrichEnd" in m for m in marks):
+                break
+            time.sleep(0.1)
+        dispatcher.stop.set()
+        dispatcher.join()
+        dispatcher.transcoders.shutdown()
+        dispatcher.enrichers.shutdown()
+        wall = time.perf_counter() - timeline.t0
+        summary, per_track = analyze(timeline, aws_clients.table("Tracks"), tids)
+
+    errors = client_errors + dispatcher.errors
+    summary.update(wallSeconds=round(wall, 2), throughputPerMin=round(len(tids) / wall * 60, 1),
+                   ffmpeg="stand-in" if ffmpeg == FAKE_FFMPEG else ffmpeg, errors=len(errors))
+    print(f"{summary['tracks']} uploads of {args.size_mb} MB at {args.rate}/s in {wall:.1f}s "
+          f"({summary['throughputPerMin']}/min), ffmpeg: {summary['ffmpeg']}")
+    print(f"playable {summary['playable']}/{summary['tracks']}   time-to-playable "
+          + "  ".join(f"{k} {v}s" for k, v in summary["timeToPlayable"].items()))
+    print(f"enriched {summary['enriched']}/{summary['tracks']}   time-to-enriched "
+          + "  ".join(f"{k} {v}s" for k, v in summary["timeToEnriched"].items()))
+    print("\nmean seconds per track on the critical path:")
+    for stage, secs in sorted(summary["criticalPathSeconds"].items(), key=lambda kv: -kv[1]):
+        print(f"  {stage:<14} {secs:>8.3f}" + ("   <- bottleneck" if stage == summary["bottleneck"] else ""))
+    for stage, secs in summary["enrichSeconds"].items():
+        print(f"  {stage:<14} {secs:>8.3f}   (sidecar path)")
+    for stage, tids_, detail in errors[:10]:
+        print(f"ERROR {stage} {tids_}: {detail}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                       "args": {k: v for k, v in vars(args).items() if k != "json"},
+                       "summary": summary, "tracks": per_track}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
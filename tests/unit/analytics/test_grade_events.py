@@ -0,0 +1,67 @@
+import json
+
+from analytics import grade_events
+from analytics.query_grade_events import read_grade_events
+from datetime import date
+
+BUCKET = "wave-loft-audio-bucket"
+
+
+def _sqs_event(bodies):
+    return {
+        "Records": [
+            {"messageId": f"m{i}", "body": b if isinstance(b, str) else json.dumps(b)}
+            for i, b in enumerate(bodies)
+        ]
+    }
+
+
+def _grade(track_id, grade, graded_at):
+    return {
+        "trackId": track_id,
+        "grade": grade,
+        "gradedAt": graded_at,
+        "prevEase": 2.5, "prevReps": 0, "prevInterval": 0,
+        "ease": 2.6, "reps": 1, "interval": 1,
+        "nextReviewAt": "2026-10-20T10:00:00+00:00",
+    }
+
+
+def test_sink_writes_one_parquet_per_day(setup_s3):
+    event = _sqs_event([
+        _grade("t1", 5, "2026-10-18T23:59:00+00:00"),
+        _grade("t1", 3, "2026-10-19T08:00:00+00:00"),
+        _grade("t2", 1, "2026-10-19T09:00:00+00:00"),
+    ])
+
+    result = grade_events.lambda_handler(event, None)
+    assert result == {"batchItemFailures": []}
+
+    keys = [o["Key"] for o in setup_s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert len(keys) == 2
+    assert any("/dt=2026-10-18/" in k for k in keys)
+    assert any("/dt=2026-10-19/" in k for k in keys)
+
+
+def test_query_helper_prunes_columns(setup_s3):
+    grade_events.lambda_handler(_sqs_event([
+        _grade("t1", 4, "2026-10-19T08:00:00+00:00"),
+        _grade("t2", 2, "2026-10-19T09:00:00+00:00"),
+    ]), None)
+
+    table = read_grade_events(BUCKET, date(2026, 10, 18), date(2026, 10, 19),
+                              columns=["trackId", "grade"], s3=setup_s3)
+
+    assert table.column_names == ["trackId", "grade"]
+    assert sorted(table.to_pylist(), key=lambda r: r["trackId"]) == [
+        {"trackId": "t1", "grade": 4},
+        {"trackId": "t2", "grade": 2},
+    ]
+
+
+def test_bad_messages_are_reported_as_failures(setup_s3):
+    event = _sqs_event(["not json", {"trackId": "t1"}, _grade("t1", 5, "2026-10-19T08:00:00Z")])
+
+    result = grade_events.lambda_handler(event, None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m0"}, {"itemIdentifier": "m1"}]}
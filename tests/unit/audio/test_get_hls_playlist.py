@@ -0,0 +1,42 @@
+from urllib.parse import parse_qs, urlparse
+
+from audio import get_hls_playlist
+
+BUCKET = "wave-loft-audio-bucket"
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4.017052,
+seg_00000.m4s
+#EXTINF:3.993832,
+seg_00001.m4s
+#EXT-X-ENDLIST
+"""
+
+
+def test_playlist_segments_are_presigned(setup_dynamodb, setup_s3):
+    setup_dynamodb.put_item(Item={"id": "t1", "hlsS3Key": "hls/My Mix/index.m3u8"})
+    setup_s3.put_object(Bucket=BUCKET, Key="hls/My Mix/index.m3u8", Body=PLAYLIST.encode())
+
+    response = get_hls_playlist.lambda_handler({"pathParameters": {"id": "t1"}}, None)
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["Content-Type"] == "application/vnd.apple.mpegurl"
+    lines = response["body"].splitlines()
+    assert lines[:3] == PLAYLIST.splitlines()[:3]
+    init_url = lines[3].split('URI="')[1].rstrip('"')
+    segment = urlparse(lines[5])
+    assert urlparse(init_url).path == "/hls/My%20Mix/init.mp4"
+    assert segment.netloc == f"{BUCKET}.s3.eu-north-1.amazonaws.com"
+    assert segment.path == "/hls/My%20Mix/seg_00000.m4s"
+    assert parse_qs(segment.query)["X-Amz-Expires"] == ["3600"]
+    assert "X-Amz-Signature" in parse_qs(segment.query)
+
+
+def test_track_without_hls_is_404(setup_dynamodb, setup_s3):
+    setup_dynamodb.put_item(Item={"id": "t2", "audioS3Key": "mp3/t2.mp3"})
+
+    response = get_hls_playlist.lambda_handler({"pathParameters": {"id": "t2"}}, None)
+
+    assert response["statusCode"] == 404
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+import boto3
+import botocore.auth
+import pytest
+from botocore.config import Config
+
+from presign import presign_get_many
+
+KEYS = ["hls/flac/My Mix/index.m3u8", "hls/flac/My Mix/seg_00000.m4s", "hls/flac/My Mix/seg_00001.m4s"]
+
+
+@pytest.mark.parametrize("bucket, kwargs", [
+    ("wave-loft-audio-bucket", {}),
+    ("wave-loft-audio-bucket", {"config": Config(signature_version="s3v4", s3={"addressing_style": "virtual"})}),
+    ("wave.loft.audio", {"config": Config(signature_version="s3v4")}),
+    ("wave-loft-audio-bucket", {"endpoint_url": "http://localhost:4566",
+                                "config": Config(s3={"addressing_style": "path"})}),
+    ("wave-loft-audio-bucket", {"aws_access_key_id": "other", "aws_secret_access_key": "other"}),
+])
+def test_urls_match_generate_presigned_url(monkeypatch, bucket, kwargs):
+    monkeypatch.setattr(botocore.auth, "get_current_datetime",
+                        lambda: datetime(2026, 10, 19, 12, 0, 0, tzinfo=timezone.utc).replace(tzinfo=None))
+    s3 = boto3.client("s3", region_name="eu-north-1", **kwargs)
+
+    urls = presign_get_many(s3, bucket, KEYS, 900)
+
+    assert urls == {k: s3.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": k}, ExpiresIn=900)
+                    for k in KEYS}
@@ -1,7 +1,24 @@
+import os
+import sys
+
 import pytest
 from moto import mock_aws
 import boto3
 
+# Handlers import cors_utils / sm2 from the UtilsLayer (/opt/python in Lambda)
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "utils", "python"))
+
+# Dummy AWS config so module-level clients can be built outside of Lambda
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-north-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("DYNAMODB_TABLE", "Tracks")
+os.environ.setdefault("BUCKET_NAME", "wave-loft-audio-bucket")
+os.environ.setdefault("S3_BUCKET", "wave-loft-audio-bucket")
+os.environ.setdefault("TRACKS_TABLE", "Tracks")
+os.environ.setdefault("DETAILS_TABLE", "TrackDetails")
+
 @pytest.fixture
 def setup_dynamodb():
     # Mock AWS environment
@@ -17,11 +34,23 @@ def setup_dynamodb():
         except Exception:
             pass  # Ignore if the table doesn't exist
 
-        # Create the table
+        # Create the table (same keys + LearningIndex as template.yaml)
         table = dynamodb.create_table(
             TableName="Tracks",
             KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+            AttributeDefinitions=[
+                {"AttributeName": "id", "AttributeType": "S"},
+                {"AttributeName": "pkLearning", "AttributeType": "S"},
+                {"AttributeName": "nextReviewAt", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "LearningIndex",
+                "KeySchema": [
+                    {"AttributeName": "pkLearning", "KeyType": "HASH"},
+                    {"AttributeName": "nextReviewAt", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }],
             BillingMode="PAY_PER_REQUEST",
         )
         table.wait_until_exists()
@@ -29,4 +58,14 @@ def setup_dynamodb():
 
         # Cleanup after test (not strictly necessary for mock_aws)
         table.delete()
-        table.wait_until_not_exists()
\ No newline at end of file
+        table.wait_until_not_exists()
+
+@pytest.fixture
+def setup_s3():
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="eu-north-1")
+        s3.create_bucket(
+            Bucket=os.environ["BUCKET_NAME"],
+            CreateBucketConfiguration={"LocationConstraint": "eu-north-1"},
+        )
+        yield s3
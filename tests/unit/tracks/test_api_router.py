@@ -0,0 +1,36 @@
+import json
+
+from tracks import api_router
+
+
+def _call(method, resource, path=None, **event):
+    return api_router.lambda_handler({"httpMethod": method, "resource": resource, "path": path or resource,
+                                      **event}, None)
+
+
+def test_router_dispatches_to_the_track_handlers(setup_dynamodb):
+    table = setup_dynamodb
+
+    created = _call("POST", "/trackItems", body=json.dumps({"trackId": "r1", "title": "Routed"}))
+    assert created["statusCode"] == 200 and table.get_item(Key={"id": "r1"})["Item"]["title"] == "Routed"
+
+    updated = _call("PUT", "/tracks/{id}", "/tracks/r1", pathParameters={"id": "r1"},
+                    body=json.dumps({"name": "Renamed", "artist": "A"}))
+    assert json.loads(updated["body"])["message"] == "Track updated"
+
+    table.put_item(Item={"id": "r2", "fileName": "set.flac"})
+    found = _call("GET", "/lookup", queryStringParameters={"fileName": "set.flac"})
+    assert json.loads(found["body"])["id"] == "r2"
+
+    # no `resource` (e.g. a hand-written test event): matched from the path
+    deleted = api_router.lambda_handler({"httpMethod": "DELETE", "path": "/tracks/r1",
+                                         "pathParameters": {"id": "r1"}}, None)
+    assert deleted["statusCode"] == 200 and "Item" not in table.get_item(Key={"id": "r1"})
+
+
+def test_router_rejects_unknown_routes():
+    assert _call("OPTIONS", "/tracks")["statusCode"] == 200
+    assert _call("GET", "/nowhere")["statusCode"] == 404
+    not_allowed = _call("PATCH", "/tracks/{id}", "/tracks/x")
+    assert not_allowed["statusCode"] == 405
+    assert json.loads(not_allowed["body"])["allowed"] == ["DELETE", "PUT"]
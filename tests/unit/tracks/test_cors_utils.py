@@ -0,0 +1,22 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+import cors_utils
+
+
+@pytest.mark.parametrize("body", [
+    {"tracks": [{"id": "a", "ease": Decimal("2.5"), "reps": Decimal(3), "title": "Café Mix"}], "n": 1},
+    {"tracks": [{"moods": {"dark", "deep"}, "bpm": Decimal("124.50"), "nested": {"x": [Decimal("1E+2")]}}]},
+    {"error": "not found"},
+    "already a JSON string",
+])
+def test_dumps_matches_decimal_encoder_byte_for_byte(body):
+    assert cors_utils.dumps(body) == json.dumps(body, cls=cors_utils._DecimalEncoder)
+    assert cors_utils.build_response(200, body)["body"] == cors_utils.dumps(body)
+
+
+def test_dumps_still_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        cors_utils.dumps({"raw": b"1.5"})
@@ -32,4 +32,55 @@ def test_create_track_missing_fields(setup_dynamodb):
     response = lambda_handler(event, context)
 
     # Check for error response (you may need to add error handling in your function)
-    assert response["statusCode"] == 400
\ No newline at end of file
+    assert response["statusCode"] == 400
+
+
+def test_lossless_upload_uses_renditions_that_already_exist(setup_s3):
+    from tracks.create_track import existing_renditions
+    bucket = "wave-loft-audio-bucket"
+    assert existing_renditions("tracks/t9.wav") == {}
+
+    setup_s3.put_object(Bucket=bucket, Key="mp3/t9.mp3", Body=b"mp3")
+    setup_s3.put_object(Bucket=bucket, Key="preview/t9.m4a", Body=b"m4a")
+
+    assert existing_renditions("tracks/t9.wav") == {
+        "audioS3Key": "mp3/t9.mp3",
+        "previewS3Key": "preview/t9.m4a",
+        "sourceS3Key": "tracks/t9.wav",
+    }
+    assert existing_renditions("mp3/t9.mp3") == {}
+
+
+def test_rendition_lookup_errors_are_not_read_as_missing(setup_s3, monkeypatch):
+    import pytest
+    from types import SimpleNamespace
+    from botocore.exceptions import ClientError
+    from tracks import create_track
+
+    def denied(**kwargs):
+        raise ClientError({"Error": {"Code": "403", "Message": "Forbidden"}}, "HeadObject")
+    monkeypatch.setattr(create_track, "s3", SimpleNamespace(head_object=denied))
+
+    with pytest.raises(ClientError):
+        create_track.existing_renditions("tracks/t9.wav")
+
+
+def test_transcode_finishing_before_the_put_is_swapped_in(setup_dynamodb, setup_s3):
+    from tracks.create_track import save_metadata_to_dynamodb_batch, swap_in_late_renditions
+    bucket = "wave-loft-audio-bucket"
+    items = [{"id": "t9", "audioS3Key": "tracks/t9.wav"}, {"id": "t8", "audioS3Key": "tracks/t8.wav"}]
+    save_metadata_to_dynamodb_batch(items)
+    # the transcoder's outputs landed, but its conditional update ran before the put
+    setup_s3.put_object(Bucket=bucket, Key="mp3/t9.mp3", Body=b"mp3")
+    setup_s3.put_object(Bucket=bucket, Key="mp3/t8.mp3", Body=b"mp3")
+    # ... while t8's transcoder update did land after it
+    setup_dynamodb.update_item(Key={"id": "t8"}, UpdateExpression="SET audioS3Key = :k, hlsS3Key = :h",
+                               ExpressionAttributeValues={":k": "mp3/t8.mp3", ":h": "hls/t8/index.m3u8"})
+
+    swap_in_late_renditions(items)
+
+    t9 = setup_dynamodb.get_item(Key={"id": "t9"})["Item"]
+    assert t9["audioS3Key"] == "mp3/t9.mp3" and t9["sourceS3Key"] == "tracks/t9.wav"
+    assert items[0]["audioS3Key"] == "mp3/t9.mp3"
+    t8 = setup_dynamodb.get_item(Key={"id": "t8"})["Item"]
+    assert t8["hlsS3Key"] == "hls/t8/index.m3u8" and "sourceS3Key" not in t8
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+import pytest
+
+import aws_clients
+import ddb_wire
+
+
+def test_decode_item_types():
+    item = {
+        "id": {"S": "t1"}, "reps": {"N": "3"}, "ease": {"N": "2.35"}, "big": {"N": "1E+3"},
+        "done": {"BOOL": False}, "gone": {"NULL": True}, "blob": {"B": "AAE="},
+        "moods": {"SS": ["driving", "dark"]}, "years": {"NS": ["2001", "1999.5"]},
+        "meta": {"M": {"bpm": {"N": "124"}, "tags": {"L": [{"S": "a"}, {"N": "-1"}]}}},
+    }
+    assert ddb_wire.decode_item(item) == {
+        "id": "t1", "reps": 3, "ease": 2.35, "big": 1000.0, "done": False, "gone": None, "blob": "AAE=",
+        "moods": ["dark", "driving"], "years": [1999.5, 2001],
+        "meta": {"bpm": 124, "tags": ["a", -1]},
+    }
+    assert type(ddb_wire.decode({"N": "3"})) is int
+    with pytest.raises(ValueError):
+        ddb_wire.decode({"X": "?"})
+
+
+def test_client_scan_and_query_return_plain_items(setup_dynamodb):
+    for i in range(5):
+        setup_dynamodb.put_item(Item={"id": f"t{i}", "pkLearning": "DJ", "nextReviewAt": f"2026-01-0{i + 1}",
+                                      "ease": Decimal("2.5"), "reps": i, "moods": {"dark"}})
+    dynamodb = ddb_wire.client()
+
+    items, start = [], None
+    while True:
+        kwargs = {"ExclusiveStartKey": start} if start else {}
+        resp = dynamodb.scan(TableName="Tracks", Limit=2, **kwargs)
+        items += resp["Items"]
+        start = resp.get("LastEvaluatedKey")
+        if not start:
+            break
+        assert start == {"id": {"S": items[-1]["id"]}}  # keys stay in wire format
+    assert sorted(i["reps"] for i in items) == [0, 1, 2, 3, 4]
+    assert all(i["ease"] == 2.5 and i["moods"] == ["dark"] for i in items)
+
+    resp = dynamodb.query(TableName="Tracks", IndexName="LearningIndex",
+                          KeyConditionExpression="pkLearning = :pk AND nextReviewAt <= :now",
+                          ExpressionAttributeValues={":pk": {"S": "DJ"}, ":now": {"S": "2026-01-02"}})
+    assert [i["id"] for i in resp["Items"]] == ["t0", "t1"] and resp["Count"] == 2
+
+    # the resource and the shared client are untouched
+    assert setup_dynamodb.scan(Limit=1)["Items"][0]["ease"] == Decimal("2.5")
+    assert aws_clients.client("dynamodb").scan(TableName="Tracks", Limit=1)["Items"][0]["id"].keys() == {"S"}
@@ -33,4 +33,10 @@ def test_delete_track_non_existent(setup_dynamodb):
 
     # DynamoDB delete_item is idempotent; no error for non-existent items
     assert response["statusCode"] == 200
-    assert response_body["message"] == "Track deleted"
\ No newline at end of file
+    assert response_body["message"] == "Track deleted"
+def test_delete_track_reports_aws_errors(setup_s3):
+    # mocked AWS without the Tracks table: DynamoDB answers ResourceNotFoundException
+    response = lambda_handler({"pathParameters": {"id": "123"}}, {})
+
+    assert response["statusCode"] == 500
+    assert "resource not found" in json.loads(response["body"])["error"].lower()
@@ -0,0 +1,228 @@
+import json
+from decimal import Decimal
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+import details_store
+from tracks import details_enricher
+
+BUCKET = "wave-loft-audio-bucket"
+
+
+@pytest.fixture
+def enricher(setup_dynamodb, setup_s3):
+    details = boto3.resource("dynamodb", region_name="eu-north-1").create_table(
+        TableName="TrackDetails",
+        KeySchema=[{"AttributeName": "trackId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "trackId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return setup_s3, setup_dynamodb, details
+
+
+def _sidecar(s3, tid, **meta):
+    s3.put_object(Bucket=BUCKET, Key=f"meta/{tid}.json",
+                  Body=json.dumps({"meta": meta, "features": {"bpm": 124.5}}).encode())
+
+
+def _s3_event(*keys):
+    return {"Records": [{"s3": {"bucket": {"name": BUCKET}, "object": {"key": k}}} for k in keys]}
+
+
+def test_records_are_enriched_in_one_batch(enricher):
+    s3, tracks, details = enricher
+    for i in range(30):  # more than one 25-item batch write
+        tracks.put_item(Item={"id": f"t{i}"})
+        _sidecar(s3, f"t{i}", artist=f"Artist {i}", moods="dark, driving")
+    s3.put_object(Bucket=BUCKET, Key="meta/broken.json", Body=b"{not json")
+
+    keys = [f"meta/t{i}.json" for i in range(30)] + ["meta/broken.json", "meta/missing.json"]
+    response = details_enricher.lambda_handler(_s3_event(*keys), None)
+
+    assert response["statusCode"] == 207
+    assert json.loads(response["body"]) == {"ok": 30, "unchanged": 0, "failed": 2}
+    item = tracks.get_item(Key={"id": "t7"})["Item"]
+    assert item["artist"] == "Artist 7" and item["moods"] == {"dark", "driving"}
+    assert str(item["bpm"]) == "124.5"
+    assert details_store.load_details(details, "t29")["meta"]["artist"] == "Artist 29"
+    assert "Item" not in details.get_item(Key={"trackId": "broken"})
+
+
+def test_failed_details_write_fails_only_its_items(enricher, monkeypatch):
+    s3, tracks, details = enricher
+
+    class FlakyDetails:
+        """TrackDetails that throttles batch writes holding t27 and rejects t27 itself."""
+        def __getattr__(self, name):
+            return getattr(details, name)
+
+        def batch_writer(self):
+            table = self
+
+            class Writer:
+                items = []
+
+                def __enter__(self):
+                    return self
+
+                def put_item(self, Item):
+                    self.items.append(Item)
+
+                def __exit__(self, *exc):
+                    if any(it["trackId"] == "t27" for it in self.items):
+                        raise ClientError({"Error": {"Code": "ThrottlingException"}}, "BatchWriteItem")
+                    for it in self.items:
+                        table.put_item(Item=it)
+
+            return Writer()
+
+        def put_item(self, Item):
+            if Item["trackId"] == "t27":
+                raise ClientError({"Error": {"Code": "ValidationException"}}, "PutItem")
+            return details.put_item(Item=Item)
+
+    monkeypatch.setattr(details_enricher, "details", FlakyDetails())
+    for i in range(30):
+        tracks.put_item(Item={"id": f"t{i}"})
+        _sidecar(s3, f"t{i}", artist=f"Artist {i}")
+
+    results = details_enricher.enrich(BUCKET, [f"meta/t{i}.json" for i in range(30)])
+
+    assert [r["trackId"] for r in results if r["status"] == "failed"] == ["t27"]
+    assert "artist" not in tracks.get_item(Key={"id": "t27"})["Item"]
+    # the rest of t27's chunk was written item by item and promoted
+    assert details_store.load_details(details, "t28")["meta"]["artist"] == "Artist 28"
+    assert tracks.get_item(Key={"id": "t28"})["Item"]["artist"] == "Artist 28"
+
+
+def test_redelivered_and_reexported_sidecars_write_nothing(enricher):
+    s3, tracks, details = enricher
+    tracks.put_item(Item={"id": "t1"})
+    _sidecar(s3, "t1", artist="A", moods="dark, driving")
+    etag = s3.head_object(Bucket=BUCKET, Key="meta/t1.json")["ETag"].strip('"')
+    event = {"Records": [{"s3": {"bucket": {"name": BUCKET},
+                                 "object": {"key": "meta/t1.json", "eTag": etag}}}]}
+
+    assert json.loads(details_enricher.lambda_handler(event, None)["body"])["ok"] == 1
+    written = details.get_item(Key={"trackId": "t1"})["Item"]
+    assert written["sidecarETag"] == etag
+    tracks.update_item(Key={"id": "t1"}, UpdateExpression="SET metaUpdatedAt = :m",
+                       ExpressionAttributeValues={":m": "before"})
+
+    # same event again (S3 at-least-once delivery): skipped on the ETag alone
+    assert json.loads(details_enricher.lambda_handler(event, None)["body"])["unchanged"] == 1
+
+    # re-exported with the same promoted values in a different order: details
+    # stored again, Tracks left alone
+    _sidecar(s3, "t1", moods="driving, dark", artist="A", extra="x")
+    body = json.loads(details_enricher.lambda_handler(_s3_event("meta/t1.json"), None)["body"])
+    assert body == {"ok": 1, "unchanged": 0, "failed": 0}
+    assert details_store.load_details(details, "t1")["meta"]["extra"] == "x"
+    assert tracks.get_item(Key={"id": "t1"})["Item"]["metaUpdatedAt"] == "before"
+
+    # nothing at all changed: reported unchanged even without an ETag
+    body = json.loads(details_enricher.lambda_handler(_s3_event("meta/t1.json"), None)["body"])
+    assert body == {"ok": 0, "unchanged": 1, "failed": 0}
+
+
+def test_sidecar_whose_promotion_failed_is_promoted_on_redelivery(enricher, monkeypatch):
+    s3, tracks, details = enricher
+    tracks.put_item(Item={"id": "t1"})
+    _sidecar(s3, "t1", artist="A")
+    etag = s3.head_object(Bucket=BUCKET, Key="meta/t1.json")["ETag"].strip('"')
+    event = {"Records": [{"s3": {"bucket": {"name": BUCKET},
+                                 "object": {"key": "meta/t1.json", "eTag": etag}}}]}
+    promotion_update = details_enricher.promotion_update
+
+    def throttled(*args):
+        monkeypatch.setattr(details_enricher, "promotion_update", promotion_update)
+        raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "UpdateItem")
+
+    monkeypatch.setattr(details_enricher, "promotion_update", throttled)
+    assert json.loads(details_enricher.lambda_handler(event, None)["body"])["failed"] == 1
+    assert details.get_item(Key={"trackId": "t1"})["Item"]["sidecarETag"] == etag
+    assert "artist" not in tracks.get_item(Key={"id": "t1"})["Item"]
+
+    # same ETag already in TrackDetails, but Tracks does not have it yet
+    assert json.loads(details_enricher.lambda_handler(event, None)["body"])["ok"] == 1
+    assert tracks.get_item(Key={"id": "t1"})["Item"]["artist"] == "A"
+    assert json.loads(details_enricher.lambda_handler(event, None)["body"])["unchanged"] == 1
+
+
+def test_details_are_compressed_and_large_ones_spill_to_s3(enricher, monkeypatch):
+    s3, tracks, details = enricher
+    monkeypatch.setattr(details_store, "SPILL_BYTES", 2_000)
+    tracks.put_item(Item={"id": "small"})
+    tracks.put_item(Item={"id": "big"})
+    _sidecar(s3, "small", artist="A")
+    frames = [{"t": i, "rms": round(i * 0.37 % 1, 6), "label": f"seg-{i * 7919 % 1000}"} for i in range(2_000)]
+    s3.put_object(Bucket=BUCKET, Key="meta/big.json",
+                  Body=json.dumps({"meta": {"artist": "B"}, "analysis": {"frames": frames}}).encode())
+
+    details_enricher.lambda_handler(_s3_event("meta/small.json", "meta/big.json"), None)
+
+    small = details.get_item(Key={"trackId": "small"})["Item"]
+    assert "details" not in small and small["detailsEncoding"] == "gzip+json"
+    assert details_store.read_details(small)["features"]["bpm"] == Decimal("124.5")
+    big = details.get_item(Key={"trackId": "big"})["Item"]
+    assert big["detailsS3Key"] == "details/big.json.gz" and "detailsBlob" not in big
+    doc = details_store.load_details(details, "big", s3, BUCKET)
+    assert doc["analysis"]["frames"][1999]["label"] == frames[1999]["label"]
+    assert tracks.get_item(Key={"id": "big"})["Item"]["artist"] == "B"
+
+    # items written before the blob format still read back
+    assert details_store.read_details({"trackId": "old", "details": {"meta": {}}}) == {"meta": {}}
+
+
+def test_sidecar_queue_batch_reports_failed_messages(enricher):
+    s3, tracks, details = enricher
+    sqs = boto3.client("sqs", region_name="eu-north-1")
+    queue_url = sqs.create_queue(QueueName="sidecars")["QueueUrl"]
+    queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+    s3.put_bucket_notification_configuration(Bucket=BUCKET, NotificationConfiguration={
+        "QueueConfigurations": [{"QueueArn": queue_arn, "Events": ["s3:ObjectCreated:*"],
+                                 "Filter": {"Key": {"FilterRules": [{"Name": "prefix", "Value": "meta/"}]}}}],
+    })
+    for i in range(3):
+        tracks.put_item(Item={"id": f"q{i}"})
+        _sidecar(s3, f"q{i}", title=f"Queued {i}")
+    s3.put_object(Bucket=BUCKET, Key="meta/bad.json", Body=b"{nope")
+
+    messages = []
+    while batch := sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages"):
+        messages += batch
+    event = {"Records": [{"messageId": m["MessageId"], "body": m["Body"], "eventSource": "aws:sqs"}
+                         for m in messages]}
+    bad = [m["MessageId"] for m in messages if "bad.json" in m["Body"]]
+
+    assert details_enricher.lambda_handler(event, None) == {
+        "batchItemFailures": [{"itemIdentifier": mid} for mid in bad]}
+    assert tracks.get_item(Key={"id": "q2"})["Item"]["title"] == "Queued 2"
+
+    test_event = {"Records": [{"messageId": "t", "eventSource": "aws:sqs",
+                               "body": json.dumps({"Event": "s3:TestEvent", "Bucket": BUCKET})}]}
+    assert details_enricher.lambda_handler(test_event, None) == {"batchItemFailures": []}
+
+
+def test_backfill_walks_the_prefix_and_resumes(enricher, monkeypatch):
+    s3, tracks, details = enricher
+    for i in range(7):
+        tracks.put_item(Item={"id": f"b{i}"})
+        _sidecar(s3, f"b{i}", title=f"Song {i}")
+
+    class Ctx:
+        calls = 0
+
+        def get_remaining_time_in_millis(self):
+            Ctx.calls += 1
+            return 60_000 if Ctx.calls == 1 else 1_000  # out of time after the 2nd batch
+
+    first = json.loads(details_enricher.lambda_handler({"backfill": {"batchSize": 3}}, Ctx())["body"])
+    assert (first["ok"], first["nextStartAfter"]) == (6, "meta/b5.json")
+
+    rest = json.loads(details_enricher.lambda_handler(
+        {"backfill": {"batchSize": 3, "startAfter": first["nextStartAfter"]}}, Ctx())["body"])
+    assert (rest["ok"], rest["failed"], rest["nextStartAfter"]) == (1, 0, None)
+    assert tracks.get_item(Key={"id": "b6"})["Item"]["title"] == "Song 6"
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+
+from tracks import delete_track, get_due_stats, rebuild_due_counters, update_stats
+
+
+@pytest.fixture
+def stats_table(setup_dynamodb):
+    dynamodb = boto3.resource("dynamodb", region_name="eu-north-1")
+    table = dynamodb.create_table(
+        TableName="LearningStats",
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    yield table
+
+
+def _due_stats(days=7):
+    response = get_due_stats.lambda_handler({"queryStringParameters": {"days": str(days)}}, {})
+    assert response["statusCode"] == 200
+    return json.loads(response["body"])
+
+
+def test_grade_moves_track_between_buckets(setup_dynamodb, stats_table):
+    setup_dynamodb.put_item(Item={
+        "id": "123", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:00Z",
+        "ease": 2, "reps": 1, "interval": 1,
+    })
+    stats_table.put_item(Item={"id": "due", "d_1970-01-01": 1})
+
+    update_stats.lambda_handler({"body": json.dumps({"trackId": "123", "grade": 5})}, {})
+
+    stats = _due_stats()
+    due_day = (datetime.now(timezone.utc) + timedelta(days=6)).date().isoformat()
+    assert stats["overdue"] == 0
+    assert stats["total"] == 1
+    assert {"date": due_day, "count": 1} in stats["histogram"]
+    assert stats["dueThisWeek"] == 1
+
+
+def test_delete_decrements_bucket(setup_dynamodb, stats_table):
+    setup_dynamodb.put_item(Item={"id": "123", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:00Z"})
+    stats_table.put_item(Item={"id": "due", "d_1970-01-01": 2})
+
+    delete_track.lambda_handler({"pathParameters": {"id": "123"}}, {})
+
+    assert _due_stats()["overdue"] == 1
+
+
+def test_rebuild_replaces_counters(setup_dynamodb, stats_table):
+    tracks = setup_dynamodb
+    today = datetime.now(timezone.utc).date().isoformat()
+    tracks.put_item(Item={"id": "a", "pkLearning": "DJ", "nextReviewAt": "2020-01-01T00:00:00+00:00"})
+    tracks.put_item(Item={"id": "b", "pkLearning": "DJ", "nextReviewAt": f"{today}T23:00:00+00:00"})
+    tracks.put_item(Item={"id": "c", "pkLearning": "DJ", "nextReviewAt": f"{today}T23:30:00+00:00"})
+    tracks.put_item(Item={"id": "d", "title": "not in the learning index"})
+    stats_table.put_item(Item={"id": "due", "d_1999-01-01": -4})
+
+    rebuild_due_counters.lambda_handler({}, None)
+
+    stats = _due_stats()
+    assert stats["overdue"] == 1
+    assert stats["dueToday"] == 3  # per-day counters: 23:00 today counts as today
+    assert stats["total"] == 3
+    assert stats["rebuiltAt"]
+
+
+def test_summary_does_not_depend_on_days(setup_dynamodb, stats_table):
+    today = datetime.now(timezone.utc).date()
+    stats_table.put_item(Item={"id": "due", "d_1970-01-01": 1, f"d_{today.isoformat()}": 2,
+                               f"d_{(today + timedelta(days=1)).isoformat()}": 3,
+                               f"d_{(today + timedelta(days=6)).isoformat()}": 4,
+                               f"d_{(today + timedelta(days=7)).isoformat()}": 5})
+
+    stats = _due_stats(days=1)
+    assert len(stats["histogram"]) == 1
+    assert (stats["overdue"], stats["dueToday"], stats["dueByTomorrow"], stats["dueThisWeek"]) == (1, 3, 6, 10)
+    assert stats["total"] == 15
+    assert {k: v for k, v in _due_stats(days=30).items() if k != "histogram"} == \
+        {k: v for k, v in stats.items() if k != "histogram"}
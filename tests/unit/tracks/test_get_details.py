@@ -0,0 +1,101 @@
+import json
+
+import boto3
+import pytest
+
+import ddb_batch
+import details_store
+from tracks import get_details
+
+BUCKET = "wave-loft-audio-bucket"
+
+
+@pytest.fixture
+def details_table(setup_s3):
+    table = boto3.resource("dynamodb", region_name="eu-north-1").create_table(
+        TableName="TrackDetails",
+        KeySchema=[{"AttributeName": "trackId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "trackId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    with table.batch_writer() as batch:
+        for i in range(250):
+            doc = {"meta": {"artist": f"Artist {i}", "title": f"Song {i}"}, "features": {"bpm": 120 + i % 10}}
+            batch.put_item(Item={"trackId": f"t{i}", "updatedAt": "2026-10-19T00:00:00+00:00",
+                                 **details_store.build_item(f"t{i}", doc)})
+    table.put_item(Item={"trackId": "legacy", "details": {"meta": {"artist": "Old"}}})
+    spilled = {"meta": {"artist": "Big"}, "analysis": {"frames": list(range(50))}}
+    key = details_store.spill_key("spilled")
+    setup_s3.put_object(Bucket=BUCKET, Key=key, Body=details_store.encode(spilled))
+    table.put_item(Item={"trackId": "spilled", "detailsS3Key": key, "detailsEncoding": details_store.ENCODING})
+    return table
+
+
+def _get(**qs):
+    return get_details.lambda_handler({"httpMethod": "GET", "queryStringParameters": qs}, None)
+
+
+def test_post_resolves_hundreds_of_ids_with_projection(details_table):
+    ids = [f"t{i}" for i in range(250)] + ["legacy", "spilled", "nope"]
+    response = get_details.lambda_handler(
+        {"httpMethod": "POST", "body": json.dumps({"trackIds": ids, "fields": ["meta.artist"]})}, None)
+
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert list(body["details"]) == ids[:-1]  # request order
+    assert body["details"]["t42"] == {"meta": {"artist": "Artist 42"}}
+    assert body["details"]["legacy"] == {"meta": {"artist": "Old"}}
+    assert body["details"]["spilled"] == {"meta": {"artist": "Big"}}
+    assert body["missing"] == ["nope"]
+
+
+def test_get_with_query_string_and_limits(details_table, monkeypatch):
+    body = json.loads(_get(ids="t1,t2", fields="features")["body"])
+    assert body["details"] == {"t1": {"features": {"bpm": 121}}, "t2": {"features": {"bpm": 122}}}
+    assert type(body["details"]["t1"]["features"]["bpm"]) is int
+    assert json.loads(_get(ids="t3")["body"])["details"]["t3"]["meta"]["title"] == "Song 3"
+
+    assert _get()["statusCode"] == 400
+    monkeypatch.setattr(get_details, "MAX_IDS", 2)
+    assert _get(ids="t1,t2,t3")["statusCode"] == 400
+
+
+def test_malformed_requests_and_unreadable_spilled_documents(details_table, setup_s3):
+    def post(body):
+        return get_details.lambda_handler({"httpMethod": "POST", "body": json.dumps(body)}, None)
+
+    assert post(["t1"])["statusCode"] == 400
+    assert post({"trackIds": ["t1"], "fields": "meta"})["statusCode"] == 400
+    assert post({"trackIds": ["t1"], "fields": [["meta"]]})["statusCode"] == 400
+
+    setup_s3.delete_object(Bucket=BUCKET, Key=details_store.spill_key("spilled"))
+    response = post({"trackIds": ["t1", "spilled", "nope"]})
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert list(body["details"]) == ["t1"] and body["missing"] == ["nope"]
+    assert list(body["errors"]) == ["spilled"]
+
+
+def test_batch_get_retries_unprocessed_keys(details_table, monkeypatch):
+    client = get_details.dynamodb.meta.client
+    real = client.batch_get_item
+    calls = []
+
+    def flaky(RequestItems):
+        calls.append(len(RequestItems["TrackDetails"]["Keys"]))
+        resp = real(RequestItems=RequestItems)
+        if len(calls) == 1:  # throttle half of the first chunk
+            keys = RequestItems["TrackDetails"]["Keys"]
+            kept = {json.dumps(k, sort_keys=True) for k in keys[:50]}
+            resp["Responses"]["TrackDetails"] = [
+                it for it in resp["Responses"]["TrackDetails"]
+                if json.dumps({"trackId": it["trackId"]}, sort_keys=True) in kept]
+            resp["UnprocessedKeys"] = {"TrackDetails": {**RequestItems["TrackDetails"], "Keys": keys[50:]}}
+        return resp
+
+    monkeypatch.setattr(client, "batch_get_item", flaky)
+    monkeypatch.setattr(ddb_batch.time, "sleep", lambda s: None)
+    items = ddb_batch.batch_get(get_details.dynamodb, "TrackDetails",
+                                [{"trackId": f"t{i}"} for i in range(100)], projection="trackId")
+    assert sorted(it["trackId"] for it in items) == sorted(f"t{i}" for i in range(100))
+    assert calls == [100, 50]
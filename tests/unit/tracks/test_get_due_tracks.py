@@ -0,0 +1,43 @@
+import json
+
+from tracks.get_due_tracks import lambda_handler
+
+
+def _due(qs=None):
+    response = lambda_handler({"queryStringParameters": qs}, {})
+    assert response["statusCode"] == 200
+    return {t["id"]: t for t in json.loads(response["body"])["tracks"]}
+
+
+def test_due_prefers_preview_rendition(setup_dynamodb):
+    table = setup_dynamodb
+    table.put_item(Item={
+        "id": "with-preview", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:00Z",
+        "audioS3Key": "mp3/a.mp3", "lowBitrateS3Key": "aac/a.m4a", "previewS3Key": "preview/a.m4a",
+    })
+    table.put_item(Item={
+        "id": "mp3-only", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:01Z",
+        "audioS3Key": "mp3/b.mp3",
+    })
+    table.put_item(Item={
+        "id": "pending", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:02Z",
+        "audioS3Key": "flac/pending",
+    })
+
+    tracks = _due()
+    assert set(tracks) == {"with-preview", "mp3-only"}
+    assert tracks["with-preview"]["presignedKey"] == "previewS3Key"
+    assert "/preview/a.m4a?" in tracks["with-preview"]["presignedUrl"]
+    assert tracks["mp3-only"]["presignedKey"] == "audioS3Key"
+
+    full = _due({"full": "1"})
+    assert "/mp3/a.mp3?" in full["with-preview"]["presignedUrl"]
+
+
+def test_due_serializes_promoted_sets(setup_dynamodb):
+    setup_dynamodb.put_item(Item={
+        "id": "promoted", "pkLearning": "DJ", "nextReviewAt": "1970-01-01T00:00:00Z",
+        "audioS3Key": "mp3/p.mp3", "moods": {"dark", "driving"}, "bpm": 124,
+    })
+    track = _due()["promoted"]
+    assert track["moods"] == ["dark", "driving"] and track["bpm"] == 124.0
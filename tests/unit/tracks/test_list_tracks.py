@@ -21,4 +21,11 @@ def test_list_tracks(setup_dynamodb):
     assert "tracks" in response_body
     assert len(response_body["tracks"]) == 2
     assert {"id": "1", "name": "Track 1", "artist": "Artist 1"} in response_body["tracks"]
-    assert {"id": "2", "name": "Track 2", "artist": "Artist 2"} in response_body["tracks"]
\ No newline at end of file
+    assert {"id": "2", "name": "Track 2", "artist": "Artist 2"} in response_body["tracks"]
+
+def test_list_tracks_error_body_is_encoded_once(setup_s3):
+    # mocked AWS without the Tracks table: the scan fails with ResourceNotFoundException
+    response = lambda_handler({}, {})
+
+    assert response["statusCode"] == 500
+    assert "resource not found" in json.loads(response["body"])["error"].lower()
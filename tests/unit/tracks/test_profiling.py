@@ -0,0 +1,63 @@
+import json
+import marshal
+
+import profiling
+import tracing
+from tracks import update_stats
+
+BUCKET = "wave-loft-audio-bucket"
+
+
+def test_signed_header_is_bound_to_function_and_expiry():
+    value = profiling.sign("update_stats", "s3cret", ttl=60, now=1000)
+    assert profiling.verify("update_stats", value, "s3cret", now=1000)
+    assert not profiling.verify("update_stats", value, "s3cret", now=1061)  # expired
+    assert not profiling.verify("get_due_tracks", value, "s3cret", now=1000)
+    assert not profiling.verify("update_stats", value, "other", now=1000)
+    assert not profiling.verify("update_stats", profiling.sign("update_stats", "s3cret", ttl=7200, now=1000),
+                                "s3cret", now=1000)  # beyond MAX_TTL
+    assert not profiling.verify("update_stats", "garbage", "s3cret")
+
+
+def _grade(headers=None):
+    return update_stats.lambda_handler({"headers": headers or {}, "body": json.dumps({"trackId": "p1", "grade": 4})},
+                                       None)
+
+
+def test_signed_request_uploads_profile(setup_dynamodb, setup_s3, monkeypatch):
+    setup_dynamodb.put_item(Item={"id": "p1"})
+    monkeypatch.setattr(tracing, "PROFILING", True)
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_BUCKET", BUCKET)
+
+    plain = _grade({"X-Profile": "1.bad"})
+    assert plain["statusCode"] == 200 and "X-Profile-Key" not in plain["headers"]
+    assert "Contents" not in setup_s3.list_objects_v2(Bucket=BUCKET, Prefix="diagnostics/")
+
+    resp = _grade({"X-Profile": profiling.sign("update_stats", "s3cret")})
+    assert resp["statusCode"] == 200
+    key = resp["headers"]["X-Profile-Key"]
+    assert key.startswith("diagnostics/profiles/update_stats/")
+    assert "X-Profile-Key" in resp["headers"]["Access-Control-Expose-Headers"].split(", ")
+    summary = json.loads(setup_s3.get_object(Bucket=BUCKET, Key=key + ".json")["Body"].read())
+    assert summary["function"] == "update_stats" and summary["topAllocations"]
+    assert "update_stats.py" in summary["cumulative"]
+    stats = marshal.loads(setup_s3.get_object(Bucket=BUCKET, Key=key + ".prof")["Body"].read())
+    assert any(fn[2] == "lambda_handler" for fn in stats)
+
+
+def test_secret_is_read_from_ssm_once_a_signed_request_arrives(setup_s3, monkeypatch):
+    import boto3
+    boto3.client("ssm", region_name="eu-north-1").put_parameter(
+        Name="/wave-loft/profile-secret", Value="s3cret", Type="SecureString")
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "")
+    monkeypatch.setattr(profiling, "PROFILE_SECRET_PARAM", "/wave-loft/profile-secret")
+
+    assert not profiling.requested("update_stats", {"headers": {}})
+    assert profiling.PROFILE_SECRET == ""  # unsigned requests never fetch it
+    assert profiling.requested("update_stats", {"headers": {"X-Profile": profiling.sign("update_stats", "s3cret")}})
+    assert profiling.PROFILE_SECRET == "s3cret"
+
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "")
+    monkeypatch.setattr(profiling, "PROFILE_SECRET_PARAM", "/wave-loft/missing")
+    assert not profiling.requested("update_stats", {"headers": {"X-Profile": profiling.sign("update_stats", "s3cret")}})
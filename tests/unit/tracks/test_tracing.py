@@ -0,0 +1,51 @@
+import json
+
+import tracing
+from tracks import api_router
+
+
+def _records(out):
+    lines = [json.loads(line) for line in out.splitlines() if line.startswith("{")]
+    return [r for r in lines if "_aws" in r and r.get("Function")]
+
+
+def test_one_record_per_invocation_with_aws_calls(setup_dynamodb, capsys):
+    table = setup_dynamodb
+    table.put_item(Item={"id": "t1", "title": "Old"})
+    capsys.readouterr()
+
+    # the router and the routed handler are both traced: one record, from the outer one
+    resp = api_router.lambda_handler({"httpMethod": "PUT", "resource": "/tracks/{id}", "pathParameters": {"id": "t1"},
+                                      "body": json.dumps({"name": "New", "artist": "A"})}, None)
+    assert resp["statusCode"] == 200
+
+    [record] = _records(capsys.readouterr().out)
+    assert record["Function"] == "api_router" and record["route"] == "PUT /tracks/{id}"
+    assert record["status"] == 200
+    assert record["AwsCalls"] >= 1 and record["AwsErrors"] == 0 and record["BytesOut"] > 0 and record["BytesIn"] > 0
+    assert record["ops"]["dynamodb.UpdateItem"]["n"] == 1
+    metrics = {m["Name"] for m in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert {"DurationMs", "AwsCalls", "AwsMs", "Retries", "BytesIn", "BytesOut"} <= metrics
+    assert tracing.current() is None
+
+
+def test_calls_outside_an_invocation_are_not_recorded(setup_dynamodb, capsys):
+    setup_dynamodb.put_item(Item={"id": "t2"})
+    import aws_clients
+    aws_clients.table("Tracks").get_item(Key={"id": "t2"})
+    assert _records(capsys.readouterr().out) == []
+
+
+def test_consumed_capacity_is_requested_and_aggregated(setup_dynamodb, capsys, monkeypatch):
+    from tracks import update_stats
+    monkeypatch.setattr(tracing, "CAPACITY_HEADER", True)
+    setup_dynamodb.put_item(Item={"id": "t3", "ease": 2, "intervalDays": 0, "repetitions": 0})
+    capsys.readouterr()
+
+    resp = update_stats.lambda_handler({"body": json.dumps({"trackId": "t3", "grade": 4})}, None)
+
+    [record] = _records(capsys.readouterr().out)
+    assert record["ReadCapacityUnits"] > 0 and record["WriteCapacityUnits"] > 0
+    assert record["capacity"]["Tracks"]["wcu"] == record["WriteCapacityUnits"]
+    assert record["ops"]["dynamodb.GetItem"]["rcu"] > 0
+    assert resp["headers"]["X-Consumed-Capacity"].startswith(f"rcu={record['ReadCapacityUnits']:g}; ")
@@ -0,0 +1,36 @@
+import json
+
+import boto3
+
+from tracks import update_stats
+
+
+def test_grade_publishes_event(setup_dynamodb, monkeypatch):
+    table = setup_dynamodb
+    table.put_item(Item={"id": "123", "title": "Track", "ease": 2, "reps": 2, "interval": 6})
+
+    sqs = boto3.client("sqs", region_name="eu-north-1")
+    queue_url = sqs.create_queue(QueueName="grade-events")["QueueUrl"]
+    monkeypatch.setattr(update_stats, "GRADE_EVENTS_QUEUE_URL", queue_url)
+
+    event = {"body": json.dumps({"trackId": "123", "grade": 4})}
+    response = update_stats.lambda_handler(event, {})
+    assert response["statusCode"] == 200
+
+    messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)["Messages"]
+    assert len(messages) == 1
+    published = json.loads(messages[0]["Body"])
+    assert published["trackId"] == "123"
+    assert published["grade"] == 4
+    assert published["prevReps"] == 2
+    assert published["reps"] == 3
+    assert published["nextReviewAt"] == json.loads(response["body"])["nextReviewAt"]
+
+
+def test_grade_without_queue_skips_publish(setup_dynamodb, monkeypatch):
+    setup_dynamodb.put_item(Item={"id": "123", "title": "Track"})
+    monkeypatch.setattr(update_stats, "GRADE_EVENTS_QUEUE_URL", None)
+
+    response = update_stats.lambda_handler({"body": json.dumps({"trackId": "123", "grade": 1})}, {})
+
+    assert response["statusCode"] == 200
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Stand-in for /opt/ffmpeg in unit tests.
+
+Reads the input (after -i; pipe:0 = stdin) once and copies it to every
+output (pipe:1 = stdout, or any later argument that is a path), prefixed
+with b"FAKE" + the output's extension (MP3 for stdout) so tests can tell
+the renditions apart. An .m3u8 output gets a one-segment HLS directory and the
+analysis branch (ametadata file=) a canned loudness log.
+
+Segment encodes (-reservoir 0) instead write one 1044-byte MPEG-1 Layer III
+frame per 1152 samples of the atrim range (after an input -ss, in whole
+seconds at 44.1 kHz), each carrying its frame number in the whole-file
+timeline; FAKE_TOTAL_FRAMES bounds an open-ended last segment. With
+FAKE_MP3_FRAMES set, stdout gets a 30-byte ID3v2 tag and that many such frames
+instead of the copied input (what a real encode to a pipe looks like: no Info
+frame).
+"""
+import os
+import re
+import struct
+import sys
+
+args = sys.argv[1:]
+if "-reservoir" in args:
+    trim = re.search(r"start_sample=(\d+)(?::end_sample=(\d+))?", args[args.index("-af") + 1])
+    seek = int(args[args.index("-ss") + 1]) * 44100 if "-ss" in args[:args.index("-i")] else 0
+    first = (seek + int(trim.group(1))) // 1152
+    last = (seek + int(trim.group(2))) // 1152 if trim.group(2) else int(os.environ["FAKE_TOTAL_FRAMES"])
+    with open(args[-1], "wb") as fout:
+        for n in range(first, last):
+            fout.write(b"\xff\xfb\xe0\x00" + struct.pack(">I", n) + bytes(1036))
+    sys.exit(0)
+
+i = args.index("-i")
+src = args[i + 1]
+outputs = [a for n, a in enumerate(args[i + 2:], i + 2)
+           if (a.startswith("pipe:") or "/" in a) and args[n - 1] not in ("-hls_segment_filename", "-af")]
+analysis = re.search(r"ametadata=mode=print:file=(\S+)", " ".join(args))
+
+fin = sys.stdin.buffer if src == "pipe:0" else open(src, "rb")
+data = fin.read()
+
+if analysis:  # last frame of a 90 s, 48 kHz analysis log
+    with open(analysis.group(1), "w") as f:
+        f.write("frame:899  pts:4315200 pts_time:89.9\nlavfi.r128.I=-9.300\nlavfi.r128.LRA=4.100\n"
+                "lavfi.r128.true_peak=1.122\nlavfi.astats.Overall.Number_of_samples=4320000.000000\n")
+
+for dst in outputs:
+    if dst.endswith(".m3u8"):  # HLS: init segment + one media segment + playlist
+        seg_dir = os.path.dirname(dst)
+        for name, body in (("init.mp4", b"FAKEINIT"), ("seg_00000.m4s", b"FAKEM4S" + data)):
+            with open(os.path.join(seg_dir, name), "wb") as f:
+                f.write(body)
+        with open(dst, "w") as f:
+            f.write('#EXTM3U\n#EXT-X-MAP:URI="init.mp4"\n#EXTINF:4.0,\nseg_00000.m4s\n#EXT-X-ENDLIST\n')
+        continue
+    if dst == "pipe:1" and os.environ.get("FAKE_MP3_FRAMES"):
+        sys.stdout.buffer.write(b"ID3\x04\x00\x00\x00\x00\x00\x14" + bytes(20))
+        for n in range(int(os.environ["FAKE_MP3_FRAMES"])):
+            sys.stdout.buffer.write(b"\xff\xfb\xe0\x00" + struct.pack(">I", n) + bytes(1036))
+        sys.stdout.buffer.flush()
+        continue
+    tag = b"MP3" if dst == "pipe:1" else os.path.splitext(dst)[1][1:].upper().encode()
+    fout = sys.stdout.buffer if dst == "pipe:1" else open(dst, "wb")
+    fout.write(b"FAKE" + tag + data)
+    fout.flush()
@@ -0,0 +1,354 @@
+import base64
+import hashlib
+import json
+import os
+import struct
+import zlib
+from decimal import Decimal
+
+import boto3
+import pytest
+
+from transcode import transcode
+
+BUCKET = "wave-loft-audio-bucket"
+FAKE_FFMPEG = os.path.join(os.path.dirname(__file__), "fake_ffmpeg.py")
+WAV_HEADER = b"RIFF\x24\x00\x00\x00WAVEfmt "
+
+
+def _wav(seconds, rate=44100):
+    """Header of a 16-bit stereo PCM WAV declaring `seconds` of audio (no samples)."""
+    fmt = struct.pack("<HHIIHH", 1, 2, rate, rate * 4, 4, 16)
+    return b"RIFF\0\0\0\0WAVEfmt " + struct.pack("<I", 16) + fmt + b"data" + struct.pack("<I", int(seconds * rate * 4))
+
+
+def _s3_event(*keys):
+    return {"Records": [
+        {"s3": {"bucket": {"name": BUCKET}, "object": {"key": k, "size": 0}}} for k in keys
+    ]}
+
+
+@pytest.fixture
+def transcoder(setup_dynamodb, setup_s3, monkeypatch):
+    monkeypatch.setattr(transcode, "FFMPEG_BIN", FAKE_FFMPEG)
+    monkeypatch.setattr(transcode, "PART_SIZE", 5 * 1024 * 1024)
+    setup_dynamodb.put_item(Item={"id": "t1", "audioS3Key": "flac/My+Song.flac"})
+    return setup_s3, setup_dynamodb
+
+
+@pytest.mark.parametrize("mode", ["stream", "file"])
+def test_transcode_uploads_mp3_and_updates_track(transcoder, monkeypatch, mode):
+    s3, table = transcoder
+    monkeypatch.setattr(transcode, "TRANSCODE_MODE", mode)
+    source = b"fLaC" + os.urandom(11 * 1024 * 1024)  # spans several multipart parts
+    s3.put_object(Bucket=BUCKET, Key="flac/My Song.flac", Body=source, Metadata={"trackid": "t1"})
+
+    transcode.flac_to_mp3_handler(_s3_event("flac/My+Song.flac"), None)
+
+    mp3 = s3.get_object(Bucket=BUCKET, Key="mp3/My Song.mp3")["Body"].read()
+    assert mp3 == b"FAKEMP3" + source
+    item = table.get_item(Key={"id": "t1"})["Item"]
+    assert item["audioS3Key"] == "mp3/My Song.mp3"
+    assert item["lowBitrateS3Key"] == "aac/My Song.m4a"
+    assert item["previewS3Key"] == "preview/My Song.m4a"
+    assert (item["loudnessLufs"], item["replayGainDb"], item["truePeakDbtp"]) == (
+        Decimal("-9.3"), Decimal("-8.7"), Decimal("1"))
+    assert (item["durationSec"], item["sampleRate"]) == (90, 48000)
+    preview = s3.get_object(Bucket=BUCKET, Key="preview/My Song.m4a")
+    assert preview["ContentType"] == "audio/mp4"
+    assert preview["Body"].read() == b"FAKEM4A" + source
+
+
+def test_single_ffmpeg_invocation_for_all_renditions(tmp_path):
+    outputs = transcode.rendition_outputs("flac/Mix.flac", str(tmp_path))
+    cmd = transcode.build_ffmpeg_cmd("pipe:0", "pipe:1", outputs)
+
+    assert cmd.count("-i") == 1
+    assert cmd[-1] == outputs["preview"]["path"]
+    preview_args = cmd[cmd.index(outputs["low"]["path"]) + 1:]
+    assert preview_args[preview_args.index("-ss") + 1] == "60"
+    assert preview_args[preview_args.index("-t") + 1] == "30"
+    assert outputs["low"]["key"] == "aac/Mix.m4a"
+
+
+def test_streaming_failure_aborts_upload(transcoder, monkeypatch):
+    s3, table = transcoder
+    monkeypatch.setattr(transcode, "FFMPEG_BIN", "/bin/false")
+    s3.put_object(Bucket=BUCKET, Key="flac/bad.flac", Body=b"x" * 1024, Metadata={"trackid": "t1"})
+
+    transcode.flac_to_mp3_handler(_s3_event("flac/bad.flac"), None)
+
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET, Prefix="mp3/")
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+    assert table.get_item(Key={"id": "t1"})["Item"]["audioS3Key"] == "flac/My+Song.flac"
+
+
+def test_streaming_failure_is_reported_even_if_the_abort_is_denied(transcoder, monkeypatch):
+    s3, table = transcoder
+    monkeypatch.setattr(transcode, "FFMPEG_BIN", "/bin/false")
+
+    def denied(**kwargs):
+        raise RuntimeError("AccessDenied")
+
+    monkeypatch.setattr(transcode.s3.resolve(), "abort_multipart_upload", denied)
+    s3.put_object(Bucket=BUCKET, Key="flac/bad.flac", Body=b"fLaC" + bytes(1024), Metadata={"trackid": "t1"})
+
+    body = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/bad.flac"), None)["body"])
+
+    assert body["failed"] == 1 and "ffmpeg exited 1" in body["results"][0]["error"]
+
+
+def test_streamed_mp3_gets_an_info_frame(transcoder, monkeypatch):
+    s3, table = transcoder
+    total_frames = 6000  # ~6.3 MB: two parts, a frame cut by the part boundary
+    samples = total_frames * 1152 - transcode.LAME_ENCODER_DELAY - 1000
+    monkeypatch.setenv("FAKE_MP3_FRAMES", str(total_frames))
+    s3.put_object(Bucket=BUCKET, Key="tracks/t1.wav", Body=_wav(samples / 44100))
+
+    transcode.flac_to_mp3_handler(_s3_event("tracks/t1.wav"), None)
+
+    mp3 = s3.get_object(Bucket=BUCKET, Key="mp3/t1.mp3")["Body"].read()
+    (info, size), *audio = transcode.mp3_frames(mp3)
+    assert info == 30 and [struct.unpack_from(">I", mp3, off + 4)[0] for off, _ in audio] == list(range(6000))
+    assert mp3[info + 36:info + 40] == b"Info"
+    assert struct.unpack_from(">II", mp3, info + 44) == (total_frames, len(mp3) - info)
+    delay_padding = int.from_bytes(mp3[info + 177:info + 180], "big")
+    assert (delay_padding >> 12, delay_padding & 0xFFF) == (transcode.LAME_ENCODER_DELAY, 1000)
+
+
+def test_records_are_processed_concurrently_with_per_record_results(transcoder, monkeypatch):
+    s3, _ = transcoder
+    monkeypatch.setattr(transcode, "TRANSCODE_WORKERS", 4)
+    for i in range(3):
+        s3.put_object(Bucket=BUCKET, Key=f"flac/{i}.flac", Body=f"fLaCtrack {i}".encode())
+
+    response = transcode.flac_to_mp3_handler(
+        _s3_event("flac/0.flac", "flac/1.flac", "flac/2.flac", "flac/missing.flac", "meta/0.json"), None
+    )
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 207
+    assert (body["ok"], body["skipped"], body["failed"]) == (3, 1, 1)
+    assert [r["status"] for r in body["results"]] == ["ok", "ok", "ok", "failed", "skipped"]
+    for i in range(3):
+        mp3 = s3.get_object(Bucket=BUCKET, Key=f"mp3/{i}.mp3")["Body"].read()
+        assert mp3 == f"FAKEMP3fLaCtrack {i}".encode()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    table = boto3.resource("dynamodb", region_name="eu-north-1").create_table(
+        TableName="TranscodeCache",
+        KeySchema=[{"AttributeName": "contentHash", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "contentHash", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    monkeypatch.setattr(transcode, "TRANSCODE_CACHE_TABLE", "TranscodeCache")
+    return table
+
+
+def test_duplicate_source_is_copied_from_cache(transcoder, cache, monkeypatch):
+    s3, table = transcoder
+    table.put_item(Item={"id": "t2", "audioS3Key": "flac/pending"})
+    source = b"fLaC" + os.urandom(64 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="flac/first.flac", Body=source, Metadata={"trackid": "t1"})
+    s3.put_object(Bucket=BUCKET, Key="flac/again.flac", Body=source, Metadata={"trackid": "t2"})
+
+    first = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/first.flac"), None)["body"])
+    assert first["results"][0]["cache"] == "miss"
+
+    # a second encode would fail: the hit must not run ffmpeg at all
+    monkeypatch.setattr(transcode, "FFMPEG_BIN", "/bin/false")
+    again = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/again.flac"), None)["body"])
+
+    assert again["results"][0]["cache"] == "hit"
+    assert s3.get_object(Bucket=BUCKET, Key="mp3/again.mp3")["Body"].read() == b"FAKEMP3" + source
+    item = table.get_item(Key={"id": "t2"})["Item"]
+    assert item["audioS3Key"] == "mp3/again.mp3"
+    assert item["previewS3Key"] == "preview/again.m4a"
+
+
+def test_cache_entry_with_overwritten_output_is_dropped(transcoder, cache):
+    s3, table = transcoder
+    source = b"fLaC" + os.urandom(64 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="flac/first.flac", Body=source)
+    transcode.flac_to_mp3_handler(_s3_event("flac/first.flac"), None)
+    # the cached MP3 now holds other audio (its source was replaced and re-encoded)
+    s3.put_object(Bucket=BUCKET, Key="mp3/first.mp3", Body=b"other audio")
+    s3.put_object(Bucket=BUCKET, Key="flac/again.flac", Body=source)
+
+    again = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/again.flac"), None)["body"])
+
+    assert again["results"][0]["cache"] == "stale"
+    assert s3.get_object(Bucket=BUCKET, Key="mp3/again.mp3")["Body"].read() == b"FAKEMP3" + source
+    entries = cache.scan()["Items"]
+    assert entries and all(e["mp3Key"] == "mp3/again.mp3" for e in entries)
+
+
+def test_stale_cache_entry_is_deleted_even_if_the_encode_fails(transcoder, cache, monkeypatch):
+    s3, table = transcoder
+    source = b"fLaC" + os.urandom(64 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="flac/first.flac", Body=source)
+    transcode.flac_to_mp3_handler(_s3_event("flac/first.flac"), None)
+    s3.delete_object(Bucket=BUCKET, Key="mp3/first.mp3")
+    s3.put_object(Bucket=BUCKET, Key="flac/again.flac", Body=source)
+    monkeypatch.setattr(transcode, "FFMPEG_BIN", "/bin/false")
+
+    again = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/again.flac"), None)["body"])
+
+    assert again["failed"] == 1
+    assert cache.scan()["Items"] == []
+
+
+def test_multipart_source_is_found_by_a_full_object_checksum(transcoder, cache):
+    s3, table = transcoder
+    source = b"fLaC" + os.urandom(6 * 1024 * 1024)
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key="flac/big.flac")["UploadId"]
+    parts = [{"PartNumber": n, "ETag": s3.upload_part(Bucket=BUCKET, Key="flac/big.flac", UploadId=upload_id,
+                                                      PartNumber=n, Body=body)["ETag"]}
+             for n, body in ((1, source[:5 * 1024 * 1024]), (2, source[5 * 1024 * 1024:]))]
+    s3.complete_multipart_upload(Bucket=BUCKET, Key="flac/big.flac", UploadId=upload_id,
+                                 MultipartUpload={"Parts": parts})
+
+    first = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/big.flac"), None)["body"])
+    assert first["results"][0]["cache"] == "miss"  # no content hash from S3: the streamed ones are stored
+
+    # a multipart re-upload is found by whichever full-object checksum S3 reports for it
+    crc32 = base64.b64encode(zlib.crc32(source).to_bytes(4, "big")).decode()
+    sha256 = base64.b64encode(hashlib.sha256(source).digest()).decode()
+    for head in ({"ETag": '"x-2"', "ChecksumCRC32": crc32, "ChecksumType": "FULL_OBJECT", "ContentLength": len(source)},
+                 {"ETag": '"x-2"', "ChecksumSHA256": sha256, "ChecksumType": "FULL_OBJECT"}):
+        assert transcode.cache_lookup(transcode.source_hashes(head))["mp3Key"] == "mp3/big.mp3"
+    assert transcode.source_hashes({"ETag": '"x-2"', "ChecksumCRC32": crc32, "ChecksumType": "COMPOSITE",
+                                    "ContentLength": len(source)}) == []
+
+
+def test_presigned_wav_upload_is_transcoded_and_keeps_source(transcoder):
+    s3, table = transcoder
+    source = WAV_HEADER + os.urandom(4096)
+    s3.put_object(Bucket=BUCKET, Key="tracks/t1.wav", Body=source)  # no trackid metadata
+
+    transcode.flac_to_mp3_handler(_s3_event("tracks/t1.wav"), None)
+
+    assert s3.get_object(Bucket=BUCKET, Key="mp3/t1.mp3")["Body"].read() == b"FAKEMP3" + source
+    item = table.get_item(Key={"id": "t1"})["Item"]
+    assert item["audioS3Key"] == "mp3/t1.mp3"
+    assert item["sourceS3Key"] == "tracks/t1.wav"
+    assert item["sourceFormat"] == "wav"
+
+
+def test_sources_with_the_same_name_keep_separate_renditions(transcoder):
+    s3, _ = transcoder
+    sources = {"flac/Song.flac": b"fLaC" + os.urandom(2048), "wav/Song.wav": WAV_HEADER + os.urandom(2048),
+               "tracks/0b7c1e52.flac": b"fLaC" + os.urandom(2048)}
+    for key, body in sources.items():
+        s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+    body = json.loads(transcode.flac_to_mp3_handler(_s3_event(*sources), None)["body"])
+
+    assert [r["mp3Key"] for r in body["results"]] == ["mp3/Song.mp3", "mp3/wav/Song.mp3", "mp3/0b7c1e52.mp3"]
+    for result, source in zip(body["results"], sources.values()):
+        assert s3.get_object(Bucket=BUCKET, Key=result["mp3Key"])["Body"].read() == b"FAKEMP3" + source
+        assert s3.get_object(Bucket=BUCKET, Key=result["previewS3Key"])["Body"].read() == b"FAKEM4A" + source
+
+
+def test_input_format_is_sniffed_not_taken_from_extension(transcoder):
+    s3, _ = transcoder
+    s3.put_object(Bucket=BUCKET, Key="wav/fake.wav", Body=b"ID3\x04" + os.urandom(64))
+
+    body = json.loads(transcode.flac_to_mp3_handler(_s3_event("wav/fake.wav"), None)["body"])
+
+    assert body["results"][0]["status"] == "skipped"
+    assert transcode.build_ffmpeg_cmd("pipe:0", "pipe:1", {}, "aiff")[5:9] == ["-f", "aiff", "-i", "pipe:0"]
+
+
+def test_header_duration_from_flac_wav_and_aiff():
+    from audio_keys import header_duration
+    streaminfo = (48000 << 44 | 1 << 41 | 23 << 36 | 48000 * 90).to_bytes(8, "big")
+    flac = b"fLaC" + b"\0" * 14 + streaminfo
+    comm = struct.pack(">hIh", 2, 44100 * 30, 16) + struct.pack(">HQ", 16383 + 15, 44100 << 48)
+    aiff = b"FORM\0\0\0\0AIFF" + b"COMM" + struct.pack(">I", len(comm)) + comm
+
+    assert header_duration(flac) == 90
+    assert header_duration(_wav(3600)) == 3600
+    assert header_duration(aiff) == 30
+    assert header_duration(b"fLaC" + bytes(30)) is None
+
+
+def test_segments_are_frame_aligned_and_cover_every_frame():
+    plan = transcode.plan_segments(1152 * 100 + 7, 3)
+
+    assert [s["start"] % 1152 for s in plan] == [0, 0, 0]
+    assert plan[0]["drop"] == 0 and plan[1]["drop"] == transcode.SEGMENT_LEAD_FRAMES
+    assert sum(s["keep"] for s in plan[:-1]) == plan[-1]["start"] // 1152 + plan[-1]["drop"]
+    assert plan[-1]["end"] is None and plan[-1]["keep"] is None
+
+
+def test_long_mix_is_encoded_in_parallel_segments_and_spliced(transcoder, monkeypatch):
+    s3, table = transcoder
+    monkeypatch.setattr(transcode, "SEGMENT_MIN_SECONDS", 600)
+    monkeypatch.setattr(transcode, "SEGMENT_WORKERS", 4)
+    total_frames = -(-3600 * 44100 // 1152)
+    monkeypatch.setenv("FAKE_TOTAL_FRAMES", str(total_frames))
+    s3.put_object(Bucket=BUCKET, Key="tracks/t1.wav", Body=_wav(3600))
+
+    body = json.loads(transcode.flac_to_mp3_handler(_s3_event("tracks/t1.wav"), None)["body"])
+
+    assert body["ok"] == 1
+    mp3 = s3.get_object(Bucket=BUCKET, Key="mp3/t1.mp3")["Body"].read()
+    (info, size), *audio = transcode.mp3_frames(mp3)
+    frames = [struct.unpack_from(">I", mp3, off + 4)[0] for off, _ in audio]
+    assert frames == list(range(total_frames))  # no gap, no duplicate at the 3 joins
+    assert table.get_item(Key={"id": "t1"})["Item"]["audioS3Key"] == "mp3/t1.mp3"
+
+    # Info frame: frame / byte counts and the LAME tag's delay + padding, checksummed
+    assert mp3[36:40] == b"Info" and struct.unpack_from(">II", mp3, 44) == (total_frames, len(mp3))
+    assert mp3[156:160] == b"LAME"
+    delay_padding = int.from_bytes(mp3[177:180], "big")
+    assert delay_padding >> 12 == transcode.LAME_ENCODER_DELAY
+    assert delay_padding & 0xFFF == total_frames * 1152 - transcode.LAME_ENCODER_DELAY - 3600 * 44100
+    assert struct.unpack_from(">H", mp3, 190)[0] == transcode._crc16(mp3[:190])
+
+
+def test_segments_seek_the_input_instead_of_decoding_from_the_start():
+    first, later = transcode.plan_segments(3600 * 44100, 4)[:2]
+
+    assert "-ss" not in transcode.build_segment_cmd("in.flac", "out.mp3", first)
+    cmd = transcode.build_segment_cmd("in.flac", "out.mp3", later)
+    seek = int(cmd[cmd.index("-ss") + 1])
+    assert cmd.index("-ss") < cmd.index("-i") and 0 < seek * 44100 < later["start"]
+    assert f"start_sample={later['start'] - seek * 44100}:" in cmd[cmd.index("-af") + 1]
+
+
+def test_hls_rendition_uploads_playlist_and_segments(transcoder, monkeypatch):
+    s3, table = transcoder
+    monkeypatch.setattr(transcode, "ENABLED_RENDITIONS", ["hls"])
+    source = b"fLaC" + os.urandom(2048)
+    s3.put_object(Bucket=BUCKET, Key="flac/Long Mix.flac", Body=source, Metadata={"trackid": "t1"})
+
+    transcode.flac_to_mp3_handler(_s3_event("flac/Long+Mix.flac"), None)
+
+    listed = s3.list_objects_v2(Bucket=BUCKET, Prefix="hls/Long Mix/")["Contents"]
+    assert sorted(o["Key"] for o in listed) == [
+        "hls/Long Mix/index.m3u8", "hls/Long Mix/init.mp4", "hls/Long Mix/seg_00000.m4s"]
+    playlist = s3.get_object(Bucket=BUCKET, Key="hls/Long Mix/index.m3u8")
+    assert playlist["ContentType"] == "application/vnd.apple.mpegurl"
+    assert table.get_item(Key={"id": "t1"})["Item"]["hlsS3Key"] == "hls/Long Mix/index.m3u8"
+
+
+def test_every_record_reports_stage_timings(transcoder, monkeypatch, capsys):
+    s3, _ = transcoder
+    monkeypatch.setattr(transcode, "TRANSCODE_MODE", "file")
+    source = b"fLaC" + os.urandom(256 * 1024)
+    s3.put_object(Bucket=BUCKET, Key="flac/Timed.flac", Body=source, Metadata={"trackid": "t1"})
+
+    body = json.loads(transcode.flac_to_mp3_handler(_s3_event("flac/Timed.flac"), None)["body"])
+
+    timings = body["results"][0]["timings"]
+    assert timings["mode"] == "file"
+    assert timings["downloadBytes"] == len(source)
+    assert timings["uploadBytes"] >= len(source)  # MP3 + renditions
+    assert timings["encodeRealtime"] > 0 and timings["dbSeconds"] > 0
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+    assert emf[0]["Mode"] == "file" and emf[0]["downloadBytes"] == len(source)
+    assert emf[0]["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "WaveLoft/Transcode"
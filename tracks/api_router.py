@@ -0,0 +1,73 @@
+import importlib
+import logging
+import re
+
+from cors_utils import build_response
+import tracing
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# (method, API Gateway resource) -> module whose lambda_handler serves it.
+# Modules are imported on their first request, so a container that only
+# ever lists tracks never loads the upload code.
+ROUTES = {
+    ("GET", "/tracks"): "tracks.list_tracks",
+    ("PUT", "/tracks/{id}"): "tracks.update_track",
+    ("DELETE", "/tracks/{id}"): "tracks.delete_track",
+    ("GET", "/lookup"): "tracks.lookup_by_filename",
+    ("POST", "/trackItems"): "tracks.create_track_item",
+    ("POST", "/upload"): "audio.upload_audio",
+}
+
+_PATTERNS = [(re.compile("^" + re.sub(r"\{[^/]+\}", "[^/]+", resource) + "/?$"), resource)
+             for resource in {r for _, r in ROUTES}]
+_handlers = {}
+_invocations = 0
+
+
+def resource_of(event):
+    """The API Gateway resource template ("/tracks/{id}") of a proxy event."""
+    if event.get("resource"):
+        return event["resource"]
+    path = event.get("path") or ""
+    return next((resource for pattern, resource in _PATTERNS if pattern.match(path)), path)
+
+
+def handler_for(method, resource):
+    module = ROUTES.get((method, resource))
+    if module is None:
+        return None
+    if module not in _handlers:
+        _handlers[module] = importlib.import_module(module).lambda_handler
+    return _handlers[module]
+
+
+@tracing.traced("api_router")
+def lambda_handler(event, context):
+    """
+    One function for the lightweight track endpoints (ApiLayout=router).
+
+    Dispatches on method + resource to the same handler modules the split
+    layout deploys one by one. They all resolve their tables and clients
+    through aws_clients, so one warm container serves every route with one
+    set of connections, and the app pays one cold start per session
+    instead of one per endpoint.
+    """
+    global _invocations
+    _invocations += 1
+    method = (event.get("httpMethod") or "").upper()
+    resource = resource_of(event)
+    tracing.annotate(route=f"{method} {resource}", cold=_invocations == 1)
+    if _invocations == 1:
+        log.info("api_router cold start: %s %s", method, resource)
+    if method == "OPTIONS":
+        return build_response(200, {"ok": True})
+
+    handler = handler_for(method, resource)
+    if handler is None:
+        known = sorted(m for m, r in ROUTES if r == resource)
+        if known:
+            return build_response(405, {"error": f"{method} not allowed on {resource}", "allowed": known})
+        return build_response(404, {"error": f"No route for {method} {resource}"})
+    return handler(event, context)
@@ -1,26 +1,26 @@
 from decimal import Decimal
 
-import boto3
 import os
 import json
 import uuid
-from mutagen import File
-from mutagen.flac import FLAC
-from mutagen.id3 import ID3, APIC
-from mutagen.mp3 import MP3
 from datetime import datetime, timezone
 from cors_utils import build_response
-from cors_utils import _DecimalEncoder
+import aws_clients
+import tracing
+import due_counters
+import audio_keys
 
-dynamodb = boto3.resource('dynamodb')
-s3 = boto3.client('s3')
+dynamodb = aws_clients.lazy_resource('dynamodb')
+s3 = aws_clients.lazy_client('s3')
 
 # Environment Variables
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']  # e.g. "Tracks"
 AUDIO_BUCKET = os.environ['S3_BUCKET']         # e.g. "wave-loft-audio-bucket"
 DEFAULT_ALBUM_ART_S3_KEY = "album_art/default_album_art.png"
+STATS_TABLE = os.environ.get("STATS_TABLE", "LearningStats")
 
 
+@tracing.traced("create_track")
 def lambda_handler(event, context):
     """
     AWS Lambda, triggered by POST /tracks from API Gateway.
@@ -64,7 +64,7 @@ def lambda_handler(event, context):
             track_id = file_data['trackId']
             file_name = file_data['fileName']
             audio_s3_key = file_data['s3Key']
-            print(f"\n[create_track] Handling fileName={file_name}, s3Key={audio_s3_key}, trackId={track_id}")
+            print(f"[create_track] Handling fileName={file_name}, s3Key={audio_s3_key}, trackId={track_id}")
 
             # Actually process & extract
             metadata = process_audio_file(track_id, file_name, audio_s3_key)
@@ -73,6 +73,8 @@ def lambda_handler(event, context):
         # Finally, do a single batch write to DynamoDB
         save_metadata_to_dynamodb_batch(responses)
         print("All files processed & saved to DynamoDB successfully.")
+        swap_in_late_renditions(responses)
+        count_new_due_tracks(responses)
 
         return build_response(200, {
             "success": True,
@@ -82,7 +84,7 @@ def lambda_handler(event, context):
 
     except Exception as e:
         print(f"[create_track] ERROR: {str(e)}")
-        return build_response(500, json.dumps({"error": str(e)}))
+        return build_response(500, {"error": str(e)})
 
 DEFAULT_LEARNING = {
     "ease": Decimal("2.5"),
@@ -125,13 +127,11 @@ def process_audio_file(track_id, file_name, audio_s3_key):
         }
 
         full_metadata.update(DEFAULT_LEARNING)
+        # the transcoder may have finished before this item existed
+        full_metadata.update(existing_renditions(audio_s3_key))
 
-        print(
-            "File",
-            file_name,
-            "->",
-            json.dumps(full_metadata, indent=2, cls=_DecimalEncoder),
-        )
+        print(f"File {file_name} -> trackId={track_id} title={full_metadata['title']!r} "
+              f"artist={full_metadata['artist']!r} fields={len(full_metadata)}")
         return full_metadata
 
     except Exception as e:
@@ -148,6 +148,67 @@ def process_audio_file(track_id, file_name, audio_s3_key):
                 print(f"Error removing local file: {cleanupErr}")
 
 
+def existing_renditions(audio_s3_key):
+    """
+    For a lossless upload, return the playback keys (MP3 / AAC / preview) that
+    already exist in S3, plus sourceS3Key pointing at the original.
+    The transcoder only updates items that exist, so without this a fast
+    transcode would leave the track playing the lossless file forever.
+    Anything other than a missing object (throttling, AccessDenied) raises.
+    """
+    if not audio_keys.is_lossless_key(audio_s3_key):
+        return {}
+    from botocore.exceptions import ClientError  # imports botocore; keep it off the init path
+    found = {}
+    for attr in audio_keys.PLAYBACK_KEYS:
+        key = audio_keys.rendition_key(audio_s3_key, attr)
+        try:
+            s3.head_object(Bucket=AUDIO_BUCKET, Key=key)
+            found[attr] = key
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+    if "audioS3Key" in found:
+        found["sourceS3Key"] = audio_s3_key
+    else:
+        found = {}  # not transcoded yet; the transcoder will swap the keys in
+    return found
+
+
+def swap_in_late_renditions(metadata_list):
+    """
+    A transcode that finishes between existing_renditions() and the batch write
+    has its Tracks update rejected (the item didn't exist yet), and its outputs
+    were missed by the HEADs. Look again now that the items exist; the update
+    only applies while the item still points at the lossless upload, so it never
+    undoes a transcoder update that did land.
+    """
+    from botocore.exceptions import ClientError  # imports botocore; keep it off the init path
+    table = dynamodb.Table(DYNAMODB_TABLE)
+    for item in metadata_list:
+        if "sourceS3Key" in item:
+            continue
+        found = existing_renditions(item["audioS3Key"])
+        if not found:
+            continue
+        names = {f"#{attr}": attr for attr in found}
+        values = {f":{attr}": key for attr, key in found.items()}
+        values[":lossless"] = item["audioS3Key"]
+        try:
+            table.update_item(
+                Key={"id": item["id"]},
+                UpdateExpression="SET " + ", ".join(f"#{attr} = :{attr}" for attr in found),
+                ConditionExpression="#audioS3Key = :lossless",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            continue  # the transcoder got there first
+        item.update(found)
+
+
 def download_file_from_s3(s3_key):
     """Download the file from S3 to a random /tmp path and return that path."""
     local_path = os.path.join("/tmp", str(uuid.uuid4()))
@@ -163,6 +224,7 @@ def extract_audio_metadata(file_path, fallback_name):
     If any step fails or is missing, fallback to the file name as title, 'Unknown Artist', etc.
     """
     try:
+        from mutagen import File  # deferred: only requests with files to tag pay for mutagen
         audio = File(file_path, easy=True)
         result = {
             "title": audio.get("title", [fallback_name])[0],
@@ -187,6 +249,9 @@ def upload_album_art(file_path, original_file_name):
     Else return DEFAULT_ALBUM_ART_S3_KEY
     """
     try:
+        from mutagen.flac import FLAC
+        from mutagen.id3 import ID3, APIC
+        from mutagen.mp3 import MP3
         album_art_data = None
         file_ext = "jpg"
 
@@ -247,9 +312,24 @@ def save_metadata_to_dynamodb_batch(metadata_list):
         print(f"Saving {len(metadata_list)} tracks to DynamoDB table {DYNAMODB_TABLE} via batch_writer...")
         with table.batch_writer() as batch:
             for item in metadata_list:
-                print(f"batch.put_item => {item}")
                 batch.put_item(Item=item)
         print("DynamoDB batch write completed.")
     except Exception as e:
         print(f"save_metadata_to_dynamodb_batch error: {e}")
         raise
+
+
+def count_new_due_tracks(metadata_list):
+    """
+    New tracks start in the LearningIndex (DEFAULT_LEARNING), so bump the
+    per-day due counters. Re-creating an existing trackId counts it twice;
+    the nightly rebuild_due_counters job corrects that drift.
+    """
+    deltas = {}
+    for item in metadata_list:
+        if due_counters.is_counted(item):
+            deltas[item["nextReviewAt"]] = deltas.get(item["nextReviewAt"], 0) + 1
+    try:
+        due_counters.adjust(dynamodb.Table(STATS_TABLE), deltas)
+    except Exception as e:
+        print(f"count_new_due_tracks error: {e}")
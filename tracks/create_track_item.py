@@ -3,18 +3,19 @@
 import json
 import os
 import uuid
-import boto3
 from datetime import datetime, timezone
 
+import aws_clients
+import tracing
+
 DYNAMODB_TABLE = os.environ["DYNAMODB_TABLE"]  # e.g. Tracks
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(DYNAMODB_TABLE)
+table = aws_clients.lazy_table(DYNAMODB_TABLE)
 
 CORS_HEADERS = {
     "Content-Type": "application/json",
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "OPTIONS,POST",
-    "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token",
+    "Access-Control-Allow-Headers": "Content-Type,Authorization,X-Amz-Date,X-Api-Key,X-Amz-Security-Token,X-Profile",
 }
 
 def _resp(status_code: int, body: dict):
@@ -24,6 +25,7 @@ def _resp(status_code: int, body: dict):
         "body": json.dumps(body),
     }
 
+@tracing.traced("create_track_item")
 def lambda_handler(event, context):
     try:
         method = (event.get("httpMethod") or "").upper()
@@ -1,22 +1,33 @@
 import json
 import logging
+import os
 
-import boto3
-from botocore.exceptions import ClientError
+import aws_clients
+import tracing
+import due_counters
 
-dynamodb = boto3.resource("dynamodb", region_name="eu-north-1")
-table = dynamodb.Table("Tracks")
+table = aws_clients.lazy_table("Tracks", region_name="eu-north-1")
+stats_table = aws_clients.lazy_table(os.environ.get("STATS_TABLE", "LearningStats"), region_name="eu-north-1")
 
+@tracing.traced("delete_track")
 def lambda_handler(event, context):
     try:
         track_id = event["pathParameters"]["id"]
 
         # Delete the item
-        table.delete_item(
+        resp = table.delete_item(
             Key={"id": track_id},
             ReturnValues="ALL_OLD"
         )
 
+        # Drop it from its due-day bucket (counters are best effort)
+        old = resp.get("Attributes")
+        if due_counters.is_counted(old):
+            try:
+                due_counters.adjust(stats_table, {old["nextReviewAt"]: -1})
+            except aws_clients.ClientError as e:
+                logging.warning("due counter update failed for %s: %s", track_id, e)
+
         # Always return success for delete
         return {
             "statusCode": 200,
@@ -28,7 +39,7 @@ def lambda_handler(event, context):
             "statusCode": 400,
             "body": json.dumps({"error": f"Missing path parameter: {str(e)}"})
         }
-    except ClientError as e:
+    except aws_clients.ClientError as e:
         return {
             "statusCode": 500,
             "body": json.dumps({"error": e.response['Error']['Message']})
@@ -1,18 +1,36 @@
-import boto3
+import hashlib
 import json
 import os
+import time
 import urllib.parse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from datetime import datetime, timezone
 
+import aws_clients
+import tracing
+import ddb_batch
+import details_store
+
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
-dynamo  = boto3.resource("dynamodb")
-tracks  = dynamo.Table(os.environ["TRACKS_TABLE"])
-details = dynamo.Table(os.environ["DETAILS_TABLE"])
-s3      = boto3.client("s3")
+dynamo  = aws_clients.lazy_resource("dynamodb")
+tracks  = aws_clients.lazy_table(os.environ["TRACKS_TABLE"])
+details = aws_clients.lazy_table(os.environ["DETAILS_TABLE"])
+s3      = aws_clients.lazy_client("s3")
+
+META_PREFIX = os.environ.get("META_PREFIX", "meta/")
+# Sidecar GETs / Tracks updates in flight at once (I/O bound, so well above vCPU count)
+FETCH_WORKERS  = int(os.environ.get("ENRICH_FETCH_WORKERS", "32"))
+UPDATE_WORKERS = int(os.environ.get("ENRICH_UPDATE_WORKERS", "16"))
+# Backfill: keys per batch, and stop early when less than this is left of the invocation
+BACKFILL_BATCH = int(os.environ.get("BACKFILL_BATCH", "500"))
+BACKFILL_RESERVE_MS = 20_000
+
+# Items per TrackDetails BatchWriteItem (the DynamoDB limit)
+DETAILS_WRITE_CHUNK = 25
 
 # Promote these fields into the hot Tracks table for fast filtering + GuessTheTrack display.
 # Each dest has candidate dotted paths (first match wins) and a target type.
@@ -98,74 +116,321 @@ def _coerce_value(v, dtype):
         return _to_string_set(v)
     return None
 
-def lambda_handler(event, _context):
-    for rec in event.get("Records", []):
+def track_id_for(key):
+    """meta/<trackId>.json -> trackId"""
+    return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+def load_sidecar(bucket, key):
+    """(parsed JSON, sha256 of the raw bytes, ETag)"""
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    raw = obj["Body"].read()
+    # Parse floats as Decimal (prevents DynamoDB float error)
+    data = json.loads(raw.decode("utf-8"), parse_float=Decimal)
+    return data, hashlib.sha256(raw).hexdigest(), (obj.get("ETag") or "").strip('"')
+
+def promoted_values(data):
+    """{dest: coerced value} for every PROMOTE field the sidecar has."""
+    out = {}
+    for dest, rule in PROMOTE.items():
+        v = _coerce_value(_first_value(data, rule["paths"]), rule["type"])
+        if v is not None:
+            out[dest] = v
+    return out
+
+def fingerprint(values):
+    """Stable hash of promoted values (sets sorted, Decimals normalized)."""
+    canon = {k: sorted(v) if isinstance(v, set) else str(v.normalize()) if isinstance(v, Decimal) else v
+             for k, v in values.items()}
+    return hashlib.sha256(json.dumps(canon, sort_keys=True).encode()).hexdigest()[:32]
+
+def promotion_update(tid, key, data, now_iso):
+    """
+    update_item kwargs that promote PROMOTE fields (+ ingestion debug fields)
+    into Tracks. The write is conditional on the promoted values having
+    changed (metaFingerprint), so a re-export doesn't touch Tracks or its GSI.
+    """
+    set_parts = []
+    names = {}
+    values = {}
+    i = 0
+
+    promoted = promoted_values(data)
+    for dest, v in promoted.items():
+        nk = f"#f{i}"
+        vk = f":v{i}"
+        names[nk] = dest
+        values[vk] = v
+        set_parts.append(f"{nk} = {vk}")
+        i += 1
+
+    # Always update these debug fields so you can see ingestion state in Tracks
+    fp = fingerprint(promoted)
+    for dest, v in (("metaS3Key", key), ("metaUpdatedAt", now_iso), ("metaFingerprint", fp)):
+        nk = f"#f{i}"; vk = f":v{i}"
+        names[nk] = dest
+        values[vk] = v
+        set_parts.append(f"{nk} = {vk}")
+        i += 1
+
+    return {
+        "Key": {"id": tid},
+        "UpdateExpression": "SET " + ", ".join(set_parts),
+        "ConditionExpression": f"attribute_not_exists(#f{i - 1}) OR #f{i - 1} <> :v{i - 1}",
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+def stored_fingerprints(track_ids):
+    """
+    {trackId: {"sidecarETag", "sidecarHash", "metaFingerprint", "promoted"}}: what
+    TrackDetails last stored for each track and, under "promoted", the
+    metaFingerprint Tracks holds (one BatchGetItem per 100 keys and table).
+    """
+    items = ddb_batch.batch_get(dynamo, details.name, [{"trackId": t} for t in track_ids],
+                                projection="trackId, sidecarETag, sidecarHash, metaFingerprint")
+    stored = {it["trackId"]: it for it in items}
+    promoted = ddb_batch.batch_get(dynamo, tracks.name, [{"id": t} for t, it in stored.items() if "sidecarETag" in it],
+                                   projection="id, metaFingerprint")
+    for it in promoted:
+        stored[it["id"]]["promoted"] = it.get("metaFingerprint")
+    return stored
+
+def store_details(changed, now_iso):
+    """
+    Write the changed sidecars to TrackDetails, one BatchWriteItem per
+    DETAILS_WRITE_CHUNK items. A chunk whose batch write fails is written again
+    item by item, so only the items that cannot be written fail. Several
+    sidecars for one track would be rejected as duplicate keys: the last one
+    wins. Returns {trackId: error} for the items that were not written.
+    """
+    latest = list({r["trackId"]: r for r in changed}.values())
+    errors = {}
+    for start in range(0, len(latest), DETAILS_WRITE_CHUNK):
+        chunk = [{
+            "trackId": r["trackId"],
+            **r["stored"],
+            "metaS3Key": r["key"],
+            "updatedAt": now_iso,
+            "sidecarETag": r["etag"],
+            "sidecarHash": r["hash"],
+            "metaFingerprint": fingerprint(promoted_values(r["data"])),
+        } for r in latest[start:start + DETAILS_WRITE_CHUNK]]
         try:
-            key = urllib.parse.unquote_plus(rec["s3"]["object"]["key"])
-            bucket = rec["s3"]["bucket"]["name"]
-
-            # Expect meta/<trackId>.json
-            tid = key.rsplit("/", 1)[1].split(".", 1)[0]
-
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            raw = obj["Body"].read()
-
-            # Parse floats as Decimal (prevents DynamoDB float error)
-            data = json.loads(raw.decode("utf-8"), parse_float=Decimal)
-
-            now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
-
-            # 1) Store full JSON in TrackDetails
-            details.put_item(Item={
-                "trackId": tid,
-                "details": data,
-                "metaS3Key": key,
-                "updatedAt": now_iso,
-            })
-
-            # 2) Promote selected fields into Tracks (overwrite to allow manual corrections)
-            set_parts = []
-            names = {}
-            values = {}
-            i = 0
-
-            for dest, rule in PROMOTE.items():
-                v_raw = _first_value(data, rule["paths"])
-                v = _coerce_value(v_raw, rule["type"])
-                if v is None:
-                    continue
-
-                nk = f"#f{i}"
-                vk = f":v{i}"
-                names[nk] = dest
-                values[vk] = v
-                set_parts.append(f"{nk} = {vk}")
-                i += 1
-
-            # Always update these debug fields so you can see ingestion state in Tracks
-            nk = f"#f{i}"; vk = f":v{i}"
-            names[nk] = "metaS3Key"
-            values[vk] = key
-            set_parts.append(f"{nk} = {vk}")
-            i += 1
-
-            nk = f"#f{i}"; vk = f":v{i}"
-            names[nk] = "metaUpdatedAt"
-            values[vk] = now_iso
-            set_parts.append(f"{nk} = {vk}")
-            i += 1
-
-            if set_parts:
-                tracks.update_item(
-                    Key={"id": tid},
-                    UpdateExpression="SET " + ", ".join(set_parts),
-                    ExpressionAttributeNames=names,
-                    ExpressionAttributeValues=values,
-                )
-
-            log.info("details_enricher OK trackId=%s key=%s promoted=%d", tid, key, len(set_parts))
+            with details.batch_writer() as batch:
+                for item in chunk:
+                    batch.put_item(Item=item)
+        except Exception as e:
+            log.warning("details_enricher TrackDetails batch write failed, writing %d items one by one: %s",
+                        len(chunk), e)
+            for item in chunk:
+                try:
+                    details.put_item(Item=item)
+                except Exception as e:
+                    log.exception("details_enricher TrackDetails put failed trackId=%s: %s", item["trackId"], e)
+                    errors[item["trackId"]] = str(e)
+    return errors
 
+def enrich(bucket, keys, etags=None):
+    """
+    Ingest many sidecars at once:
+      0) skip sidecars whose ETag (from the S3 event / listing) is already stored
+         and whose promoted values are already in Tracks
+      1) GET + parse the rest concurrently (FETCH_WORKERS)
+      2) store the changed ones (by content hash) in TrackDetails with batch writes
+         (item by item for a chunk that fails), as a gzipped blob, or in S3 behind a pointer when large (details_store)
+      3) promote fields into Tracks with UPDATE_WORKERS parallel conditional update_items
+    Returns one {"key", "trackId", "status": "ok" | "unchanged" | "failed", "error"?}
+    per key, in order; "unchanged" means nothing was written.
+    """
+    etags = etags or {}
+    results = [{"key": k, "trackId": track_id_for(k), "status": "ok",
+                "etag": (etags.get(k) or "").strip('"')} for k in keys]
+    now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+    try:
+        stored = stored_fingerprints({r["trackId"] for r in results})
+    except Exception as e:  # fingerprints only save work; never block ingestion on them
+        log.warning("details_enricher could not read fingerprints: %s", e)
+        stored = {}
+    for r in results:
+        prev = stored.get(r["trackId"], {})
+        # TrackDetails is written before the promotion: a sidecar whose promotion
+        # failed is stored but not in Tracks yet, and must be fetched again
+        if (r["etag"] and "-" not in r["etag"] and prev.get("sidecarETag") == r["etag"]
+                and prev.get("metaFingerprint") and prev.get("promoted") == prev["metaFingerprint"]):
+            r["status"] = "unchanged"
+
+    def fetch(r):
+        try:
+            r["data"], r["hash"], r["etag"] = load_sidecar(bucket, r["key"])
+        except Exception as e:
+            r.update(status="failed", error=f"read: {e}")
+            return
+        prev = stored.get(r["trackId"], {})
+        if prev.get("sidecarHash") == r["hash"] and prev.get("metaFingerprint"):
+            return  # stored already; the promotion still runs (it is conditional)
+        try:  # compress (and spill) here, in parallel, rather than in the batch loop
+            r["stored"] = details_store.build_item(r["trackId"], r["data"], s3, bucket)
+        except Exception as e:
+            r.update(status="failed", error=f"details: {e}")
+
+    pending = [r for r in results if r["status"] == "ok"]
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(pending)))) as pool:
+            list(pool.map(fetch, pending))
+    loaded = [r for r in pending if r["status"] == "ok"]
+    changed = [r for r in loaded if "stored" in r]
+
+    # 1) Store full JSON in TrackDetails
+    errors = store_details(changed, now_iso)
+    for r in changed:
+        if r["trackId"] in errors:
+            r.update(status="failed", error=f"details: {errors[r['trackId']]}")
+    loaded = [r for r in loaded if r["status"] == "ok"]
+
+    # 2) Promote selected fields into Tracks (overwrite to allow manual corrections)
+    def promote(r):
+        try:
+            # the resource's client: same type serialization, and safe to share between threads
+            dynamo.meta.client.update_item(TableName=tracks.name,
+                                           **promotion_update(r["trackId"], r["key"], r["data"], now_iso))
+            r["wrote"] = True
+        except aws_clients.ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                r.update(status="failed", error=f"tracks: {e}")
+        except Exception as e:
+            r.update(status="failed", error=f"tracks: {e}")
+
+    if loaded:
+        with ThreadPoolExecutor(max_workers=max(1, min(UPDATE_WORKERS, len(loaded)))) as pool:
+            list(pool.map(promote, loaded))
+
+    changed_ids = {id(r) for r in changed}
+    for r in results:
+        r.pop("data", None)
+        r.pop("hash", None)
+        r.pop("stored", None)
+        r.pop("etag", None)
+        if r["status"] == "ok" and id(r) not in changed_ids and not r.pop("wrote", False):
+            r["status"] = "unchanged"  # same bytes, same promoted values: nothing written
+        r.pop("wrote", None)
+        if r["status"] == "unchanged":
+            log.info("details_enricher UNCHANGED trackId=%s key=%s", r["trackId"], r["key"])
+        elif r["status"] == "ok":
+            log.info("details_enricher OK trackId=%s key=%s", r["trackId"], r["key"])
+        else:
+            log.error("details_enricher FAILED key=%s err=%s", r["key"], r["error"])
+    return results
+
+def backfill(bucket, prefix=META_PREFIX, batch_size=BACKFILL_BATCH, start_after=None, context=None):
+    """
+    Re-ingest every sidecar under `prefix`, batch_size keys at a time, logging
+    progress after each batch. Stops early when the invocation is about to
+    time out and returns `nextStartAfter` to resume from.
+    """
+    started = time.monotonic()
+    done = {"ok": 0, "unchanged": 0, "failed": 0}
+    failed_keys = []
+    last_key = None
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+
+    def run(batch):
+        nonlocal last_key
+        for r in enrich(bucket, batch, etags):
+            done[r["status"]] += 1
+            if r["status"] == "failed":
+                failed_keys.append(r["key"])
+        last_key = batch[-1]
+        elapsed = time.monotonic() - started
+        total = sum(done.values())
+        log.info("backfill progress: %d sidecars (%d unchanged, %d failed) in %.1fs, %.0f/s, last=%s",
+                 total, done["unchanged"], done["failed"], elapsed, total / elapsed if elapsed else 0, last_key)
+        etags.clear()
+
+    batch = []
+    etags = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(**kwargs):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith(".json"):
+                continue
+            batch.append(obj["Key"])
+            etags[obj["Key"]] = obj.get("ETag")
+            if len(batch) >= batch_size:
+                run(batch)
+                batch = []
+                if context and context.get_remaining_time_in_millis() < BACKFILL_RESERVE_MS:
+                    return {**done, "failedKeys": failed_keys[:100], "nextStartAfter": last_key,
+                            "seconds": round(time.monotonic() - started, 1)}
+    if batch:
+        run(batch)
+    return {**done, "failedKeys": failed_keys[:100], "nextStartAfter": None,
+            "seconds": round(time.monotonic() - started, 1)}
+
+def s3_records(event):
+    """
+    (s3 record, SQS messageId or None) pairs: the handler is fed by the
+    sidecar queue (each message body is an S3 event notification) and still
+    accepts direct S3 invocations.
+    """
+    for rec in event.get("Records", []):
+        if rec.get("eventSource") != "aws:sqs":
+            yield rec, None
+            continue
+        body = json.loads(rec["body"])
+        if body.get("Event") == "s3:TestEvent":  # sent once when the notification is configured
+            continue
+        for s3_rec in body.get("Records", []):
+            yield s3_rec, rec["messageId"]
+
+@tracing.traced("details_enricher")
+def lambda_handler(event, context):
+    """
+    Sidecar queue batch (S3 ObjectCreated on meta/<trackId>.json -> SQS) ->
+    enrich every record of the batch at once. Messages with a record that
+    failed are returned as batchItemFailures, so only those are retried and,
+    after maxReceiveCount, land in the dead-letter queue.
+
+    Backfill: invoke with {"backfill": {"bucket"?, "prefix"?, "batchSize"?, "startAfter"?}}
+    to re-ingest the whole prefix; re-invoke with the returned nextStartAfter
+    until it is null.
+    """
+    if "backfill" in event:
+        opts = event["backfill"] or {}
+        bucket = opts.get("bucket") or os.environ["BUCKET_NAME"]
+        result = backfill(bucket, opts.get("prefix", META_PREFIX), int(opts.get("batchSize", BACKFILL_BATCH)),
+                          opts.get("startAfter"), context)
+        return {"statusCode": 200, "body": json.dumps(result)}
+
+    by_bucket = {}
+    etags = {}
+    messages = {}  # (bucket, key) -> SQS messageIds carrying it
+    failed_messages = set()
+    records = event.get("Records", [])
+    for rec in records:
+        try:
+            for s3_rec, message_id in s3_records({"Records": [rec]}):
+                bucket = s3_rec["s3"]["bucket"]["name"]
+                key = urllib.parse.unquote_plus(s3_rec["s3"]["object"]["key"])
+                by_bucket.setdefault(bucket, []).append(key)
+                etags[key] = s3_rec["s3"]["object"].get("eTag")
+                if message_id:
+                    messages.setdefault((bucket, key), set()).add(message_id)
         except Exception as e:
             log.exception("details_enricher FAILED record=%s err=%s", json.dumps(rec)[:5000], str(e))
+            if rec.get("messageId"):
+                failed_messages.add(rec["messageId"])
+
+    results = []
+    for bucket, keys in by_bucket.items():
+        for r in enrich(bucket, keys, etags):
+            results.append(r)
+            if r["status"] == "failed":
+                failed_messages |= messages.get((bucket, r["key"]), set())
 
-    return {"statusCode": 200, "body": "ok"}
+    counts = {s: sum(r["status"] == s for r in results) for s in ("ok", "unchanged", "failed")}
+    if records and records[0].get("eventSource") == "aws:sqs":
+        log.info("details_enricher batch: %s, %d messages to retry", counts, len(failed_messages))
+        return {"batchItemFailures": [{"itemIdentifier": mid} for mid in sorted(failed_messages)]}
+    return {"statusCode": 200 if not counts["failed"] else 207, "body": json.dumps(counts)}
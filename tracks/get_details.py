@@ -0,0 +1,125 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cors_utils import build_response
+import aws_clients
+import tracing
+import ddb_batch
+import details_store
+
+DETAILS_TABLE = os.environ["DETAILS_TABLE"]
+BUCKET_NAME = os.environ["BUCKET_NAME"]
+# Upper bound on ids per request (a crate is a few hundred tracks)
+MAX_IDS = int(os.environ.get("DETAILS_MAX_IDS", "500"))
+# BatchGetItem calls (100 keys each) / spilled-document GETs in flight at once
+GET_WORKERS = int(os.environ.get("DETAILS_GET_WORKERS", "8"))
+
+dynamodb = aws_clients.lazy_resource("dynamodb")
+s3 = aws_clients.lazy_client("s3")
+
+STORED_ATTRS = ("trackId", "updatedAt", "detailsBlob", "detailsS3Key", "details")
+
+
+def parse_request(event):
+    """(trackIds, fields) from ?ids=a,b&fields=meta.artist,features or a POST {"trackIds", "fields"} body."""
+    if (event.get("httpMethod") or "").upper() == "POST":
+        body = json.loads(event.get("body") or "{}")
+        if not isinstance(body, dict):
+            raise ValueError("Body must be a JSON object")
+        ids, fields = body.get("trackIds") or [], body.get("fields") or []
+    else:
+        qs = event.get("queryStringParameters") or {}
+        ids = [i for i in (qs.get("ids") or "").split(",") if i]
+        fields = [f for f in (qs.get("fields") or "").split(",") if f]
+    if not isinstance(ids, list) or not all(isinstance(i, str) and i for i in ids):
+        raise ValueError("trackIds must be a list of strings")
+    if not isinstance(fields, list) or not all(isinstance(f, str) and f for f in fields):
+        raise ValueError("fields must be a list of strings")
+    return list(dict.fromkeys(ids)), fields
+
+
+def project(doc, fields):
+    """Keep only the dotted `fields` paths of `doc` (all of it when no fields are given)."""
+    if not fields or doc is None:
+        return doc
+    out = {}
+    for path in fields:
+        src, dst = doc, out
+        parts = path.split(".")
+        for i, part in enumerate(parts):
+            if not isinstance(src, dict) or part not in src:
+                break
+            if i == len(parts) - 1:
+                dst[part] = src[part]
+            else:
+                src = src[part]
+                dst = dst.setdefault(part, {})
+    return out
+
+
+@tracing.traced("get_details")
+def lambda_handler(event, context):
+    """
+    GET /details?ids=a,b,c[&fields=meta.artist,features.bpm]
+    POST /details {"trackIds": [...], "fields": [...]}
+
+    -> {"details": {trackId: document, ...}, "updatedAt": {trackId: iso}, "missing": [...],
+        "errors": {trackId: message}}
+
+    Resolves up to DETAILS_MAX_IDS tracks with concurrent BatchGetItem calls,
+    so a details pane or a whole crate loads in one round trip. `fields`
+    trims each document to the given dotted paths before it is serialized.
+    A spilled document that cannot be read is reported under `errors` rather
+    than failing the other ids.
+    Responses are gzipped by API Gateway for clients that send Accept-Encoding.
+    """
+    try:
+        if (event.get("httpMethod") or "").upper() == "OPTIONS":
+            return build_response(200, {"ok": True})
+        try:
+            ids, fields = parse_request(event)
+        except ValueError as e:
+            return build_response(400, {"error": str(e)})
+        if not ids:
+            return build_response(400, {"error": "No trackIds given"})
+        if len(ids) > MAX_IDS:
+            return build_response(400, {"error": f"At most {MAX_IDS} trackIds per request"})
+
+        items = ddb_batch.batch_get(
+            dynamodb, DETAILS_TABLE, [{"trackId": i} for i in ids],
+            projection=", ".join(f"#a{n}" for n in range(len(STORED_ATTRS))),
+            names={f"#a{n}": a for n, a in enumerate(STORED_ATTRS)},
+            workers=GET_WORKERS,
+        )
+
+        def decode(item):
+            return item["trackId"], project(details_store.read_details(item, s3, BUCKET_NAME), fields)
+
+        def decode_spilled(item):
+            try:
+                return decode(item)
+            except Exception as e:
+                return item["trackId"], e
+
+        spilled = [it for it in items if "detailsS3Key" in it]
+        docs = dict(decode(it) for it in items if "detailsS3Key" not in it)
+        errors = {}
+        if spilled:
+            with ThreadPoolExecutor(max_workers=min(GET_WORKERS, len(spilled))) as pool:
+                for track_id, doc in pool.map(decode_spilled, spilled):
+                    if isinstance(doc, Exception):
+                        errors[track_id] = str(doc)
+                    else:
+                        docs[track_id] = doc
+
+        return build_response(200, {
+            "details": {i: docs[i] for i in ids if i in docs},
+            "updatedAt": {it["trackId"]: it.get("updatedAt") for it in items},
+            "missing": [i for i in ids if i not in docs and i not in errors],
+            "errors": errors,
+        })
+    except aws_clients.ClientError as e:
+        return build_response(500, {"error": e.response["Error"]["Message"]})
+    except Exception as e:
+        return build_response(500, {"error": str(e)})
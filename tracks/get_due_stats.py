@@ -0,0 +1,45 @@
+# tracks/get_due_stats.py
+import os
+from datetime import datetime, timezone
+
+from cors_utils import build_response
+import aws_clients
+import tracing
+import due_counters
+
+STATS_TABLE = os.environ.get("STATS_TABLE", "LearningStats")
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 60
+
+stats_table = aws_clients.lazy_table(STATS_TABLE)
+
+
+@tracing.traced("get_due_stats")
+def lambda_handler(event, _ctx):
+    """
+    GET /stats/due?days=N
+
+    Review-load forecast for the home screen, served from the per-day due
+    counters with a single GetItem (no LearningIndex paging).
+    """
+    try:
+        if (event.get("httpMethod") or "").upper() == "OPTIONS":
+            return build_response(200, {"ok": True})
+
+        qs = event.get("queryStringParameters") or {}
+        try:
+            days = min(max(int(qs.get("days", DEFAULT_DAYS)), 1), MAX_DAYS)
+        except Exception:
+            days = DEFAULT_DAYS
+
+        item = stats_table.get_item(Key={"id": due_counters.DUE_STATS_ID}).get("Item") or {}
+        now = datetime.now(timezone.utc)
+
+        body = due_counters.forecast(item, now.date(), days)
+        body["now"] = now.replace(microsecond=0).isoformat()
+        body["rebuiltAt"] = item.get("rebuiltAt")
+        return build_response(200, body)
+
+    except Exception as e:
+        return build_response(500, {"error": str(e)})
@@ -2,10 +2,10 @@
 import os
 from datetime import datetime, timezone
 
-import boto3
-from boto3.dynamodb.conditions import Key
-
 from cors_utils import build_response
+import aws_clients
+import ddb_wire
+import tracing
 
 TABLE_NAME = os.environ["DYNAMODB_TABLE"]
 BUCKET_NAME = os.environ["BUCKET_NAME"]
@@ -15,9 +15,8 @@ DEFAULT_LIMIT = 40
 # Keep this <= your Lambda role credential lifetime; 3600 is safe.
 PRESIGN_EXPIRES_SEC = int(os.environ.get("PRESIGN_EXPIRES_SEC", "3600"))
 
-ddb = boto3.resource("dynamodb")
-table = ddb.Table(TABLE_NAME)
-s3 = boto3.client("s3")
+dynamodb = ddb_wire.lazy_client()  # Items come back as plain JSON values
+s3 = aws_clients.lazy_client("s3")
 
 
 def _is_pending_key(key: str) -> bool:
@@ -30,6 +29,21 @@ def _looks_like_mp3(key: str) -> bool:
     return k.endswith(".mp3") or k.startswith("mp3/")
 
 
+# Guess The Track only plays a few seconds: hand out the smallest rendition
+# the transcoder produced (see transcode.RENDITIONS), the full MP3 as fallback.
+PLAYBACK_KEY_PREFERENCE = ("previewS3Key", "lowBitrateS3Key", "audioS3Key")
+
+
+def _playback_key(item, full=False):
+    if full:
+        return item.get("audioS3Key"), "audioS3Key"
+    for attr in PLAYBACK_KEY_PREFERENCE:
+        if item.get(attr):
+            return item[attr], attr
+    return None, None
+
+
+@tracing.traced("get_due_tracks")
 def lambda_handler(event, _ctx):
     try:
         # Preflight safety (in case your API forwards OPTIONS)
@@ -41,6 +55,8 @@ def lambda_handler(event, _ctx):
             limit = int(qs.get("limit", DEFAULT_LIMIT))
         except Exception:
             limit = DEFAULT_LIMIT
+        # ?full=1 -> always presign the full 320k MP3
+        want_full = str(qs.get("full", "")).lower() in ("1", "true", "yes")
 
         # ISO string compare works because all are UTC ISO8601
         now_iso = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
@@ -55,16 +71,17 @@ def lambda_handler(event, _ctx):
 
         while len(playable) < limit:
             kwargs = {
+                "TableName": TABLE_NAME,
                 "IndexName": "LearningIndex",
-                "KeyConditionExpression": Key("pkLearning").eq(LEARNING_PK)
-                & Key("nextReviewAt").lte(now_iso),
+                "KeyConditionExpression": "pkLearning = :pk AND nextReviewAt <= :now",
+                "ExpressionAttributeValues": {":pk": {"S": LEARNING_PK}, ":now": {"S": now_iso}},
                 "Limit": page_limit,
                 "ScanIndexForward": True,
             }
             if start_key:
-                kwargs["ExclusiveStartKey"] = start_key
+                kwargs["ExclusiveStartKey"] = start_key  # wire format, passed back as is
 
-            resp = table.query(**kwargs)
+            resp = dynamodb.query(**kwargs)
             items = resp.get("Items", [])
 
             for it in items:
@@ -79,13 +96,14 @@ def lambda_handler(event, _ctx):
                     skipped["not_mp3"] += 1
                     continue
 
-                # Attach presigned URL
-                it = dict(it)  # avoid mutating the DDB response object
+                # Attach presigned URL (preview clip when available)
+                play_key, play_attr = _playback_key(it, want_full)
                 it["presignedUrl"] = s3.generate_presigned_url(
                     "get_object",
-                    Params={"Bucket": BUCKET_NAME, "Key": key},
+                    Params={"Bucket": BUCKET_NAME, "Key": play_key},
                     ExpiresIn=PRESIGN_EXPIRES_SEC,
                 )
+                it["presignedKey"] = play_attr
                 playable.append(it)
                 if len(playable) >= limit:
                     break
@@ -1,21 +1,21 @@
 import os
 
-import boto3
-import json
-from botocore.exceptions import ClientError
 from cors_utils import build_response  # Import from your Lambda Layer
+import aws_clients
+import ddb_wire
+import tracing
 
 TABLE_NAME = os.environ['DYNAMODB_TABLE']
 BUCKET_NAME = os.environ['BUCKET_NAME']
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(TABLE_NAME)
-s3_client = boto3.client('s3')
+dynamodb = ddb_wire.lazy_client()  # Items come back as plain JSON values
+s3_client = aws_clients.lazy_client('s3')
 
+@tracing.traced("list_tracks")
 def lambda_handler(event, context):
     try:
         # Scan all items in the DynamoDB table
-        response = table.scan()
+        response = dynamodb.scan(TableName=TABLE_NAME)
         items = response.get("Items", [])
 
         # Generate pre-signed URLs for each track
@@ -30,10 +30,10 @@ def lambda_handler(event, context):
             )
             item['presignedUrl'] = presigned_url  # Add pre-signed URL to response
 
-        return build_response(200, json.dumps({"tracks": items}))
+        return build_response(200, {"tracks": items})
 
-    except ClientError as e:
-        return build_response(500, json.dumps({"error": e.response['Error']['Message']}))
+    except aws_clients.ClientError as e:
+        return build_response(500, {"error": e.response['Error']['Message']})
 
     except Exception as e:
-        return build_response(500, json.dumps({"error": str(e)}))
\ No newline at end of file
+        return build_response(500, {"error": str(e)})
\ No newline at end of file
@@ -1,19 +1,20 @@
 import os
 import json
-import boto3
 import logging
-from boto3.dynamodb.conditions import Attr
+
+import aws_clients
+import tracing
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
-table = boto3.resource("dynamodb").Table(os.environ["DYNAMODB_TABLE"])
+table = aws_clients.lazy_table(os.environ["DYNAMODB_TABLE"])
 
 CORS_HEADERS = {
     "Content-Type": "application/json",
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, X-Amz-Date, Authorization, X-Api-Key, X-Amz-Security-Token",
+    "Access-Control-Allow-Headers": "Content-Type, X-Amz-Date, Authorization, X-Api-Key, X-Amz-Security-Token, X-Profile",
 }
 
 def _resp(status_code: int, body):
@@ -24,6 +25,7 @@ def _resp(status_code: int, body):
         out = json.dumps(body)
     return {"statusCode": status_code, "headers": CORS_HEADERS, "body": out}
 
+@tracing.traced("lookup_by_filename")
 def lambda_handler(event, _ctx):
     # OPTIONS preflight (in case API Gateway forwards it)
     if event.get("httpMethod") == "OPTIONS":
@@ -41,6 +43,8 @@ def lambda_handler(event, _ctx):
     start_key = None
 
     try:
+        from boto3.dynamodb.conditions import Attr  # imports boto3; keep it off the init path
+
         while True:
             scan_kwargs = {
                 "ProjectionExpression": "id, fileName",
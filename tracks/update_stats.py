@@ -4,19 +4,35 @@ import json
 import os
 from datetime import datetime, timezone
 
-import boto3
-
 from sm2 import apply_sm2, next_review_at
 from cors_utils import build_response
+import aws_clients
+import tracing
+import due_counters
 
 TABLE_NAME = os.environ["DYNAMODB_TABLE"]
 LEARNING_PK = os.environ.get("LEARNING_PK", "DJ")
+# Optional: append every grade to the analytics event log (see analytics/grade_events.py)
+GRADE_EVENTS_QUEUE_URL = os.environ.get("GRADE_EVENTS_QUEUE_URL")
 
-table = boto3.resource("dynamodb").Table(TABLE_NAME)
+table = aws_clients.lazy_table(TABLE_NAME)
+stats_table = aws_clients.lazy_table(os.environ.get("STATS_TABLE", "LearningStats"))
+sqs = aws_clients.lazy_client("sqs")
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
 
+def _publish_grade_event(event):
+    """Best effort: a lost analytics event must never fail the grade itself."""
+    if not GRADE_EVENTS_QUEUE_URL:
+        return
+    try:
+        sqs.send_message(QueueUrl=GRADE_EVENTS_QUEUE_URL, MessageBody=json.dumps(event))
+    except Exception:
+        log.exception("grade event publish failed trackId=%s", event.get("trackId"))
+
+
+@tracing.traced("update_stats")
 def lambda_handler(event, _ctx):
     try:
         # CORS preflight
@@ -67,6 +83,28 @@ def lambda_handler(event, _ctx):
             },
         )
 
+        # Move the track to its new due-day bucket (best effort, see rebuild_due_counters)
+        deltas = {next_at: 1}
+        if due_counters.is_counted(item):
+            deltas[item["nextReviewAt"]] = deltas.get(item["nextReviewAt"], 0) - 1
+        try:
+            due_counters.adjust(stats_table, deltas)
+        except Exception:
+            log.exception("due counter update failed trackId=%s", track_id)
+
+        _publish_grade_event({
+            "trackId": track_id,
+            "grade": grade,
+            "gradedAt": now_iso,
+            "prevEase": ease,
+            "prevReps": reps,
+            "prevInterval": inter,
+            "ease": round(new_ease, 4),
+            "reps": new_reps,
+            "interval": new_int,
+            "nextReviewAt": next_at,
+        })
+
         return build_response(200, {"ok": True, "trackId": track_id, "nextReviewAt": next_at})
 
     except Exception as e:
@@ -1,16 +1,16 @@
-import boto3
 import json
 
-from botocore.exceptions import ClientError
-
 import logging
 
+import aws_clients
+import tracing
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table("Tracks")
+table = aws_clients.lazy_table("Tracks")
 
+@tracing.traced("update_track")
 def lambda_handler(event, context):
     try:
         track_id = event["pathParameters"]["id"]
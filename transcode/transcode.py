@@ -1,121 +1,1106 @@
+import base64
+import hashlib
 import json
+import math
 import os
+import shutil
+import struct
 import subprocess
-import boto3
+import tempfile
+import threading
+import time
 import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import audio_keys
+import aws_clients
+import metrics
+import tracing
 
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']  # e.g. "Tracks"
 BUCKET_NAME = os.environ['BUCKET_NAME']        # e.g. "wave-loft-audio-bucket"
 
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(DYNAMODB_TABLE)
-s3 = boto3.client('s3')
+FFMPEG_BIN = os.environ.get('FFMPEG_PATH', '/opt/ffmpeg')  # or 'ffmpeg' if baked into the Lambda environment
+# "stream": S3 GET -> ffmpeg stdin, ffmpeg stdout -> S3 multipart upload (no /tmp staging)
+# "file":   download to /tmp, transcode, upload (the original behaviour)
+TRANSCODE_MODE = os.environ.get('TRANSCODE_MODE', 'stream')
+PART_SIZE = int(os.environ.get('MULTIPART_PART_MB', '8')) * 1024 * 1024  # S3 minimum is 5 MB
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '4'))
+READ_CHUNK = 256 * 1024
+# Records of one S3 event are transcoded in parallel, one ffmpeg per vCPU by default
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS') or os.cpu_count() or 1)
 
-def flac_to_mp3_handler(event, context):
+# 320 kbps CBR, 44.1 kHz stereo
+MP3_ARGS = ['-vn', '-ar', '44100', '-ac', '2', '-b:a', '320k']
+MP3_RATE = 44100
+MP3_FRAME_SAMPLES = 1152  # MPEG-1 Layer III
+
+# Segment mode for long mixes: sources longer than SEGMENT_MIN_SECONDS are cut
+# at MP3-frame boundaries, encoded by SEGMENT_WORKERS ffmpeg processes at once
+# and spliced frame by frame into one MP3 (see encode_segmented). The spliced
+# stream gets its own Info frame (Xing header + LAME tag), so players see the
+# frame count and trim the encoder delay and padding like on a single encode.
+SEGMENT_MIN_SECONDS = float(os.environ.get('SEGMENT_MIN_SECONDS', '1200'))
+SEGMENT_WORKERS = int(os.environ.get('SEGMENT_WORKERS') or os.cpu_count() or 1)
+# Each segment is encoded with this many extra frames on both sides; they prime
+# the encoder (MDCT overlap) and are dropped when splicing.
+SEGMENT_LEAD_FRAMES = 2
+SEGMENT_TAIL_FRAMES = 2
+# Independent frames (no bit reservoir), no Xing/ID3 headers: splice-safe
+SEGMENT_MP3_ARGS = ['-c:a', 'libmp3lame', '-reservoir', '0', '-write_xing', '0',
+                    '-id3v2_version', '0', '-map_metadata', '-1']
+# Priming samples libmp3lame puts in front of the audio (what its LAME tag reports)
+LAME_ENCODER_DELAY = 576
+# Bytes fetched up front to sniff the format and read the duration
+PROBE_BYTES = 64 * 1024
+
+# Companion renditions, produced by the same ffmpeg invocation as the MP3
+# (one decode, several outputs). Comma separated subset of RENDITIONS.
+ENABLED_RENDITIONS = [r for r in os.environ.get('RENDITIONS', 'low,preview').split(',') if r]
+LOW_BITRATE = os.environ.get('LOW_BITRATE', '96k')
+PREVIEW_OFFSET_SEC = float(os.environ.get('PREVIEW_OFFSET_SEC', '60'))
+PREVIEW_DURATION_SEC = float(os.environ.get('PREVIEW_DURATION_SEC', '30'))
+AAC_ARGS = ['-vn', '-ac', '2', '-c:a', 'aac', '-b:a', LOW_BITRATE, '-movflags', '+faststart']
+# HLS: HLS_SEGMENT_SEC fMP4 chunks (~80 KB at 160k), so playback starts after
+# the first one and a seek only fetches the segment it lands in
+HLS_BITRATE = os.environ.get('HLS_BITRATE', '160k')
+HLS_SEGMENT_SEC = float(os.environ.get('HLS_SEGMENT_SEC', '4'))
+HLS_ARGS = ['-vn', '-ac', '2', '-c:a', 'aac', '-b:a', HLS_BITRATE, '-f', 'hls',
+            '-hls_time', f'{HLS_SEGMENT_SEC:g}', '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4']
+HLS_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.mp4': 'audio/mp4', '.m4s': 'audio/mp4'}
+
+RENDITIONS = {
+    # full-length low-bitrate rendition
+    'low': {
+        'attr': 'lowBitrateS3Key', 'ext': '.m4a', 'content_type': 'audio/mp4',
+        'args': AAC_ARGS,
+    },
+    # short clip for Guess The Track (output-side seek: only this output is trimmed)
+    'preview': {
+        'attr': 'previewS3Key', 'ext': '.m4a', 'content_type': 'audio/mp4',
+        'args': ['-ss', f'{PREVIEW_OFFSET_SEC:g}', '-t', f'{PREVIEW_DURATION_SEC:g}', *AAC_ARGS],
+    },
+    # HLS playlist; the key is the playlist, its segments sit next to it
+    'hls': {
+        'attr': 'hlsS3Key', 'ext': '.m3u8', 'content_type': HLS_CONTENT_TYPES['.m3u8'],
+        'args': HLS_ARGS, 'segmented': True,
+    },
+}
+# An output smaller than this has no audio (e.g. preview offset past the end)
+MIN_RENDITION_BYTES = 1024
+
+# Analysis tee: one more branch of the same decode runs EBU R128 (integrated
+# loudness, LRA, true peak) and a sample counter; results land on the track.
+ANALYZE = os.environ.get('ANALYZE', '1') not in ('0', 'false', 'no')
+REPLAYGAIN_REFERENCE_LUFS = -18.0  # ReplayGain 2.0
+ANALYSIS_FILTER = ('ebur128=peak=true:metadata=1,'
+                   'astats=metadata=1:measure_perchannel=none:measure_overall=Number_of_samples,'
+                   'ametadata=mode=print:file={path}')
+
+# Optional content-hash -> renditions index; duplicate sources are copied, not re-encoded
+TRANSCODE_CACHE_TABLE = os.environ.get('TRANSCODE_CACHE_TABLE')
+# Cache entries are only valid for the encoder settings that produced them;
+# a segmented encode is not byte-identical to a single-process one, so the two
+# modes have separate profiles.
+ENCODING_PROFILE = hashlib.sha1(json.dumps(
+    [MP3_ARGS, {n: RENDITIONS[n]['args'] for n in ENABLED_RENDITIONS}]
+).encode()).hexdigest()[:12]
+SEGMENTED_PROFILE = hashlib.sha1(json.dumps(
+    [ENCODING_PROFILE, SEGMENT_MP3_ARGS, SEGMENT_LEAD_FRAMES, SEGMENT_TAIL_FRAMES]
+).encode()).hexdigest()[:12]
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'WaveLoft/Transcode')
+
+# Records run on worker threads, so DynamoDB goes through the resource's client
+# (thread-safe, same type serialization as a Table) rather than shared Tables
+dynamodb = aws_clients.lazy_resource('dynamodb')
+# every record in flight holds a GET stream plus UPLOAD_CONCURRENCY part uploads
+s3 = aws_clients.lazy_client(
+    's3', max_pool_connections=max(aws_clients.MAX_POOL_CONNECTIONS, TRANSCODE_WORKERS * (UPLOAD_CONCURRENCY + 2))
+)
+
+
+class StageStats:
     """
-    Triggered by S3 PutObject for *.flac in 'flac/' prefix.
+    Seconds and bytes per stage (download / encode / upload / db) of one record.
 
-    We'll:
-      1) Download the FLAC file to /tmp
-      2) Run ffmpeg => produce /tmp/output.mp3 (320 kbps)
-      3) Upload MP3 to S3 -> 'mp3/' prefix
-      4) Using the object metadata (trackId), we update that DB item so audioS3Key = "mp3/..."
+    In stream mode the stages overlap: download is time spent waiting on S3
+    reads, upload is the summed busy time of the part uploads (they run
+    UPLOAD_CONCURRENCY at a time), encode is the ffmpeg wall time.
     """
-    print("==== Received S3 Event ====")
-    print(json.dumps(event, indent=2))
+    STAGES = ('download', 'encode', 'upload', 'db')
 
-    # Each record is an S3 event
-    records = event.get('Records', [])
-    for record in records:
-        bucket = record['s3']['bucket']['name']
-        raw_key = record['s3']['object']['key']
-        size_bytes = record['s3']['object'].get('size', 0)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.bytes = dict.fromkeys(self.STAGES, 0)
+
+    def add(self, stage, seconds, nbytes=0):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.bytes[stage] += nbytes
+
+    def timed(self, stage, nbytes=0):
+        return _Timed(self, stage, nbytes)
+
+    def summary(self, audio_seconds=None):
+        """Flat dict for the result / metrics: durations, bytes and the derived rates."""
+        out = {f'{s}Seconds': round(v, 3) for s, v in self.seconds.items()}
+        out['downloadBytes'] = self.bytes['download']
+        out['uploadBytes'] = self.bytes['upload']
+        if self.seconds['download'] and self.bytes['download']:
+            out['downloadMBps'] = round(self.bytes['download'] / 1e6 / self.seconds['download'], 2)
+        if self.seconds['upload'] and self.bytes['upload']:
+            out['uploadMBps'] = round(self.bytes['upload'] / 1e6 / self.seconds['upload'], 2)
+        if audio_seconds and self.seconds['encode']:
+            out['encodeRealtime'] = round(audio_seconds / self.seconds['encode'], 1)
+        return out
+
+
+class _Timed:
+    def __init__(self, stats, stage, nbytes):
+        self.stats, self.stage, self.nbytes = stats, stage, nbytes
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add(self.stage, time.monotonic() - self.started, self.nbytes)
+
+
+def rendition_outputs(key, work_dir):
+    """
+    Plan the companion outputs for a source key:
+    {name: {"path": local file, "key": S3 key, **RENDITIONS[name]}}
+    """
+    outputs = {}
+    for name in ENABLED_RENDITIONS:
+        spec = RENDITIONS[name]
+        outputs[name] = {
+            **spec,
+            'path': os.path.join(work_dir, f'{name}{spec["ext"]}'),
+            'key': audio_keys.rendition_key(key, spec['attr']),
+        }
+        if spec.get('segmented'):
+            seg_dir = os.path.join(work_dir, name)
+            os.makedirs(seg_dir, exist_ok=True)
+            outputs[name]['path'] = os.path.join(seg_dir, 'index.m3u8')
+            outputs[name]['args'] = [*spec['args'], '-hls_segment_filename',
+                                     os.path.join(seg_dir, 'seg_%05d.m4s')]
+    return outputs
 
-        # decode any URL-encoded chars like spaces
-        key = urllib.parse.unquote_plus(raw_key)
 
-        # We only transcode .flac files in the "flac/" prefix
-        if not key.lower().endswith('.flac') or not key.startswith('flac/'):
-            print(f"Skipping object {key} (not in 'flac/' prefix or not .flac).")
+def build_ffmpeg_cmd(src, mp3_out, outputs, input_format=None, analysis_path=None):
+    """
+    One input, the 320k MP3 first (unless mp3_out is None), then every
+    companion rendition, then (with analysis_path) the analysis branch.
+    """
+    cmd = [FFMPEG_BIN, '-hide_banner', '-loglevel', 'error', '-y']
+    if input_format:
+        cmd += ['-f', input_format]  # pipes can't be probed by extension
+    cmd += ['-i', src]
+    if mp3_out:
+        cmd += ['-map', '0:a', *MP3_ARGS, '-f', 'mp3', mp3_out]
+    for out in outputs.values():
+        cmd += ['-map', '0:a', *out['args'], out['path']]
+    if analysis_path:
+        cmd += ['-map', '0:a', '-af', ANALYSIS_FILTER.format(path=analysis_path), '-f', 'null', '-']
+    return cmd
+
+
+def _tail(path, size=4096):
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - size))
+        return f.read().decode(errors='replace')
+
+
+def parse_analysis(path):
+    """
+    Read the last frame of the ametadata log (the values are cumulative) into
+    Tracks attributes: loudnessLufs, loudnessRangeLu, truePeakDbtp,
+    replayGainDb, durationSec, sampleRate. Returns {} if there is no log.
+    """
+    if not path or not os.path.exists(path) or not os.path.getsize(path):
+        return {}
+    frame, values = None, {}
+    for line in _tail(path).splitlines():
+        if line.startswith('frame:'):
+            frame, values = dict(f.split(':', 1) for f in line.split()), {}
+        elif '=' in line:
+            k, v = line.split('=', 1)
+            values[k] = v
+    if not frame or 'lavfi.r128.I' not in values:
+        return {}
+
+    def dec(x, places=2):
+        return Decimal(str(round(x, places)))
+
+    result = {}
+    loudness = float(values['lavfi.r128.I'])
+    if math.isfinite(loudness) and loudness > -70:  # -70 LUFS = absolute gate (silence)
+        result['loudnessLufs'] = dec(loudness)
+        result['replayGainDb'] = dec(REPLAYGAIN_REFERENCE_LUFS - loudness)
+    if 'lavfi.r128.LRA' in values:
+        result['loudnessRangeLu'] = dec(float(values['lavfi.r128.LRA']))
+    peak = float(values.get('lavfi.r128.true_peak', 0))
+    if peak > 0:
+        result['truePeakDbtp'] = dec(20 * math.log10(peak))
+    pts, pts_time = int(frame.get('pts', 0)), float(frame.get('pts_time', 0))
+    samples = float(values.get('lavfi.astats.Overall.Number_of_samples', 0))
+    if pts and pts_time:
+        rate = round(pts / pts_time)
+        result['sampleRate'] = rate
+        if samples:
+            result['durationSec'] = dec(samples / rate, 3)
+    return result
+
+
+def upload_renditions(bucket, outputs, stats=None):
+    """Upload the companion files that were produced; return {attr: key}."""
+    stats = stats or StageStats()
+    keys = {}
+    for name, out in outputs.items():
+        if out.get('segmented'):
+            if not os.path.exists(out['path']):
+                print(f"Rendition {name} has no playlist, not uploading {out['key']}")
+                continue
+            with stats.timed('upload', _dir_size(os.path.dirname(out['path']))):
+                upload_segmented(bucket, out)
+        elif not os.path.exists(out['path']) or os.path.getsize(out['path']) < MIN_RENDITION_BYTES:
+            print(f"Rendition {name} is empty, not uploading {out['key']}")
             continue
+        else:
+            with stats.timed('upload', os.path.getsize(out['path'])):
+                s3.upload_file(out['path'], bucket, out['key'], ExtraArgs={'ContentType': out['content_type']})
+        keys[out['attr']] = out['key']
+    return keys
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, n)) for n in os.listdir(path))
+
+
+def upload_segmented(bucket, out):
+    """Upload an HLS directory: segments first, the playlist last (it's what the API looks for)."""
+    seg_dir = os.path.dirname(out['path'])
+    prefix = os.path.dirname(out['key'])
+    names = sorted(n for n in os.listdir(seg_dir) if n != os.path.basename(out['path']))
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+        list(pool.map(lambda n: s3.upload_file(
+            os.path.join(seg_dir, n), bucket, f'{prefix}/{n}',
+            ExtraArgs={'ContentType': HLS_CONTENT_TYPES.get(os.path.splitext(n)[1], 'application/octet-stream')},
+        ), names))
+    s3.upload_file(out['path'], bucket, out['key'], ExtraArgs={'ContentType': out['content_type']})
+    print(f"Uploaded HLS playlist + {len(names)} files to s3://{bucket}/{prefix}/")
+
+
+def transcode_to_file(bucket, key, mp3_key, work_dir, outputs, input_format, analysis_path=None,
+                      stats=None):
+    """
+    Stage the source and the MP3 in work_dir (needs 2x the file size of
+    ephemeral storage). Returns the source's content hashes (SourceHasher).
+    """
+    stats = stats or StageStats()
+    local_src_path = os.path.join(work_dir, f'source.{input_format}')
+    local_mp3_path = os.path.join(work_dir, 'output.mp3')
+
+    # Step 1) Download the lossless source
+    print(f"Downloading s3://{bucket}/{key} -> {local_src_path}")
+    with stats.timed('download') as t:
+        s3.download_file(bucket, key, local_src_path)
+        t.nbytes = os.path.getsize(local_src_path)
+    hasher = SourceHasher()
+    with open(local_src_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            hasher.update(chunk)
 
-        print(f"Processing FLAC file: {bucket}/{key}, size={size_bytes} bytes")
+    # Step 2) Transcode with ffmpeg => 320 kbps MP3 + companion renditions
+    cmd = build_ffmpeg_cmd(local_src_path, local_mp3_path, outputs, input_format, analysis_path)
+    print(f"Running FFmpeg command: {' '.join(cmd)}")
+    with stats.timed('encode'):
+        subprocess.run(cmd, check=True)
 
-        # Attempt to read the object's user metadata to get trackId
+    # Step 3) Upload to mp3/
+    print(f"Uploading MP3 to s3://{bucket}/{mp3_key}")
+    with stats.timed('upload', os.path.getsize(local_mp3_path)):
+        s3.upload_file(local_mp3_path, bucket, mp3_key)
+    return hasher.hashes()
+
+
+def transcode_streaming(bucket, key, mp3_key, outputs, input_format, analysis_path=None, stats=None,
+                        duration=None):
+    """
+    Pipe the S3 object through ffmpeg straight into a multipart upload.
+
+    Download, encode and upload overlap, so wall time is roughly the slowest
+    of the three instead of their sum. Memory stays bounded by
+    UPLOAD_CONCURRENCY in-flight parts of PART_SIZE, plus the first part: it
+    is uploaded last, with the Info frame (frame count, encoder delay and
+    padding, from `duration`) that a file-mode encode gets from ffmpeg.
+    The (small) companion renditions are written to their work-dir paths.
+    Returns the source's content hashes (SourceHasher), computed on the fly.
+    """
+    stats = stats or StageStats()
+    cmd = build_ffmpeg_cmd('pipe:0', 'pipe:1', outputs, input_format, analysis_path)
+    print(f"Streaming s3://{bucket}/{key} through: {' '.join(cmd)}")
+
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    feed_error = []
+    stderr_tail = bytearray()
+    hasher = SourceHasher()
+
+    def feed():
         try:
-            head_resp = s3.head_object(Bucket=bucket, Key=key)
-            user_meta = head_resp.get('Metadata', {})
-            track_id = user_meta.get('trackid')  # case-insensitive, but best to keep lower
-        except Exception as e:
-            print(f"ERROR: Could not head_object or read metadata for {key}: {e}")
-            track_id = None
+            with stats.timed('download'):
+                body = s3.get_object(Bucket=bucket, Key=key)['Body']
+            chunks = body.iter_chunks(READ_CHUNK)
+            while True:
+                # only the S3 read counts as download, not waiting on ffmpeg's stdin
+                read_started = time.monotonic()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                stats.add('download', time.monotonic() - read_started, len(chunk))
+                hasher.update(chunk)
+                proc.stdin.write(chunk)
+        except Exception as e:  # includes BrokenPipeError if ffmpeg dies early
+            feed_error.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except Exception:
+                pass
 
-        if not track_id:
-            print("WARNING: No trackId metadata found. We can't do direct DB update. We'll skip DB update.")
-        else:
-            print(f"Found trackId={track_id} in object metadata.")
+    def drain_stderr():
+        # ffmpeg blocks if nobody reads stderr; keep only the tail for error messages
+        for line in proc.stderr:
+            stderr_tail.extend(line)
+            del stderr_tail[:-8192]
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    drainer = threading.Thread(target=drain_stderr, daemon=True)
+    feeder.start()
+    drainer.start()
 
-        # local paths
-        local_flac_path = '/tmp/source.flac'
-        local_mp3_path  = '/tmp/output.mp3'
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=mp3_key, ContentType='audio/mpeg')['UploadId']
+    in_flight = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
 
-        # Step 1) Download FLAC
-        print(f"Downloading s3://{bucket}/{key} -> {local_flac_path}")
+    def upload_part(number, data):
         try:
-            s3.download_file(bucket, key, local_flac_path)
-        except Exception as e:
-            print(f"ERROR: S3 download failed for {key}: {e}")
+            with stats.timed('upload', len(data)):
+                resp = s3.upload_part(Bucket=bucket, Key=mp3_key, UploadId=upload_id,
+                                      PartNumber=number, Body=data)
+            return {'PartNumber': number, 'ETag': resp['ETag']}
+        finally:
+            in_flight.release()
+
+    try:
+        futures = []
+        total = 0
+        first = None
+        counter = FrameCounter()
+        with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+            while True:
+                data = proc.stdout.read(PART_SIZE)
+                if not data:
+                    break
+                total += len(data)
+                counter.feed(data)
+                if first is None:
+                    first = data  # part 1 waits for the frame count
+                    continue
+                in_flight.acquire()
+                futures.append(pool.submit(upload_part, len(futures) + 2, data))
+            if first is not None:
+                total_samples = int(round(duration * MP3_RATE)) if duration else None
+                in_flight.acquire()
+                futures.insert(0, pool.submit(upload_part, 1, with_info_frame(first, counter, total_samples)))
+            parts = [f.result() for f in futures]
+
+        returncode = proc.wait()
+        stats.add('encode', time.monotonic() - started)
+        feeder.join()
+        drainer.join()
+        if feed_error:
+            raise RuntimeError(f"S3 read failed: {feed_error[0]}")
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited {returncode}: {stderr_tail.decode(errors='replace').strip()}")
+        if not total:
+            raise RuntimeError("ffmpeg produced no output")
+
+        s3.complete_multipart_upload(Bucket=bucket, Key=mp3_key, UploadId=upload_id,
+                                     MultipartUpload={'Parts': parts})
+        print(f"Streamed {total} bytes in {len(parts)} parts to s3://{bucket}/{mp3_key}")
+        return hasher.hashes()
+    except Exception:
+        proc.kill()
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=mp3_key, UploadId=upload_id)
+        except Exception as e:  # the lifecycle rule cleans up after a day; report what actually failed
+            print(f"WARNING: could not abort the multipart upload of {mp3_key}: {e}")
+        raise
+
+
+def plan_segments(total_samples, workers):
+    """
+    Split total_samples (at MP3_RATE) into `workers` frame-aligned segments.
+
+    Returns [{"start", "end", "drop", "keep"}]: encode samples [start, end)
+    (end None = to the end), drop the first `drop` frames of the output and
+    keep the next `keep` (None = all). Because every segment starts a whole
+    number of frames before its boundary, frame k of every segment lines up
+    with a frame of the single-process encode.
+    """
+    frames = -(-total_samples // MP3_FRAME_SAMPLES)
+    bounds = [round(frames * i / workers) for i in range(workers + 1)]
+    plan = []
+    for i in range(workers):
+        first, last = bounds[i], bounds[i + 1]
+        if last <= first:
             continue
+        lead = min(SEGMENT_LEAD_FRAMES, first)
+        is_last = i == workers - 1
+        plan.append({
+            'start': (first - lead) * MP3_FRAME_SAMPLES,
+            'end': None if is_last else (last + SEGMENT_TAIL_FRAMES) * MP3_FRAME_SAMPLES,
+            'drop': lead,
+            'keep': None if is_last else last - first,
+        })
+    return plan
+
 
-        # Step 2) Transcode with ffmpeg => 320 kbps MP3
-        cmd = [
-            '/opt/ffmpeg',  # or 'ffmpeg' if baked into the Lambda environment
-            '-y',
-            '-i', local_flac_path,
-            '-vn',
-            '-ar', '44100',
-            '-ac', '2',
-            '-b:a', '320k',
-            local_mp3_path
-        ]
-        print(f"Running FFmpeg command: {' '.join(cmd)}")
+def build_segment_cmd(src, out, segment, input_format=None):
+    """
+    Input-seek to a whole second at least one second before the segment (a
+    sample boundary at any source rate, and room for the resampler to settle),
+    then atrim the rest sample-exactly, so segment N doesn't decode the N
+    segments before it.
+    """
+    seek = max(0, segment['start'] // MP3_RATE - 1)
+    offset = seek * MP3_RATE
+    trim = f"atrim=start_sample={segment['start'] - offset}"
+    if segment['end'] is not None:
+        trim += f":end_sample={segment['end'] - offset}"
+    cmd = [FFMPEG_BIN, '-hide_banner', '-loglevel', 'error', '-y']
+    if seek:
+        cmd += ['-ss', str(seek)]
+    if input_format:
+        cmd += ['-f', input_format]
+    return cmd + ['-i', src, '-map', '0:a:0',
+                  '-af', f'aresample={MP3_RATE},{trim},asetpts=PTS-STARTPTS',
+                  *MP3_ARGS, *SEGMENT_MP3_ARGS, '-f', 'mp3', out]
+
+
+_MP3_BITRATES = {  # kbps by (MPEG-1?, index)
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def id3v2_size(data):
+    """Length of the ID3v2 tag data starts with (0 if none); needs the first 10 bytes."""
+    if data[:3] != b'ID3':
+        return 0
+    return 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+
+
+def frame_length(header):
+    """Length of the Layer III frame with this 4-byte header; ValueError if it is not one."""
+    b0, b1, b2 = header[0], header[1], header[2]
+    version = (b1 >> 3) & 3
+    if (b0 != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1
+            or b2 >> 4 in (0, 15) or (b2 >> 2) & 3 == 3):
+        raise ValueError("not an MP3 frame header")
+    bitrate = _MP3_BITRATES[version == 3][b2 >> 4] * 1000
+    rate = _MP3_RATES[version][(b2 >> 2) & 3]
+    return (144 if version == 3 else 72) * bitrate // rate + ((b2 >> 1) & 1)
+
+
+def mp3_frames(data):
+    """Yield (offset, length) of every Layer III frame in data (ID3v2 tag skipped)."""
+    pos = id3v2_size(data)
+    while pos + 4 <= len(data):
+        if data[pos:pos + 3] == b'TAG':  # ID3v1 trailer
+            return
         try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"FFmpeg failed for {key}: {e}")
+            length = frame_length(data[pos:pos + 4])
+        except ValueError:
+            raise ValueError(f"not an MP3 frame header at byte {pos}") from None
+        yield pos, length
+        pos += length
+
+
+class FrameCounter:
+    """
+    mp3_frames for a stream that arrives in chunks (ffmpeg's stdout): counts
+    the frames and their bytes and keeps the first frame's header and the
+    length of the leading ID3v2 tag. `valid` turns False at the first bytes
+    that are not a frame, and the counts are meaningless from then on.
+    """
+
+    def __init__(self):
+        self.frames = self.audio_bytes = 0
+        self.header = None
+        self.tag_bytes = None
+        self.valid = True
+        self._skip = 0     # bytes of the current frame (or tag) still to come
+        self._tail = b''   # start of a header cut off by the end of a chunk
+
+    def feed(self, data):
+        if not self.valid:
+            return
+        if self._skip >= len(data):
+            self._skip -= len(data)
+            return
+        data, pos = self._tail + data[self._skip:], 0
+        self._skip, self._tail = 0, b''
+        if self.tag_bytes is None:
+            if len(data) < 10:
+                self._tail = data
+                return
+            self.tag_bytes = pos = id3v2_size(data)
+        while pos + 4 <= len(data):
+            if data[pos:pos + 3] == b'TAG':  # ID3v1 trailer: nothing after it
+                self.valid = self.valid and pos + 128 >= len(data)
+                return
+            try:
+                length = frame_length(data[pos:pos + 4])
+            except ValueError:
+                self.valid = False
+                return
+            if self.header is None:
+                self.header = data[pos:pos + 4]
+            self.frames += 1
+            self.audio_bytes += length
+            pos += length
+        if pos > len(data):
+            self._skip = pos - len(data)
+        else:
+            self._tail = data[pos:]
+
+
+def with_info_frame(first_part, counter, total_samples=None):
+    """
+    The first bytes of a streamed MP3 with an Info frame (info_frame) put
+    after its ID3v2 tag. ffmpeg cannot write one to a pipe: it fills it in
+    by seeking back at the end. Without total_samples the end padding is
+    taken as 0. Returns first_part unchanged if the stream did not parse.
+    """
+    if not counter.valid or counter.header is None or counter.tag_bytes > len(first_part):
+        print("WARNING: streamed MP3 did not parse as Layer III frames, not adding an Info frame")
+        return first_part
+    if not total_samples:
+        total_samples = counter.frames * MP3_FRAME_SAMPLES - LAME_ENCODER_DELAY
+    try:
+        frame = info_frame(counter.header, counter.frames, counter.audio_bytes, total_samples)
+    except ValueError as e:
+        print(f"WARNING: not adding an Info frame to the streamed MP3: {e}")
+        return first_part
+    return first_part[:counter.tag_bytes] + frame + first_part[counter.tag_bytes:]
+
+
+def _crc16(data):
+    """CRC-16/ARC, as used for the LAME tag checksum."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def info_frame(header, frames, audio_bytes, total_samples):
+    """
+    A CBR "Info" frame (Xing header + LAME tag) to put in front of a spliced
+    stream: frame and byte counts, a seek TOC, and the encoder delay and end
+    padding in samples, which players use to cut the priming and padding
+    (gapless playback, exact duration). `header` is the first audio frame's
+    header; the Info frame has the same bitrate, so it is also a valid frame.
+    """
+    b1, b2, b3 = header[1] | 0x01, header[2] & ~0x02, header[3]  # no CRC, no padding slot
+    if (b1 >> 1) & 3 != 1 or (b1 >> 3) & 3 != 3:
+        raise ValueError("Info frame: only MPEG-1 Layer III streams are supported")
+    bitrate = _MP3_BITRATES[True][b2 >> 4] * 1000
+    size = 144 * bitrate // _MP3_RATES[3][(b2 >> 2) & 3]
+    padding = min(max(frames * MP3_FRAME_SAMPLES - LAME_ENCODER_DELAY - total_samples, 0), 0xFFF)
+    stream_bytes = size + audio_bytes
+    xing = (b'Info' + struct.pack('>III', 0x0F, frames, stream_bytes)  # frames, bytes, TOC, quality
+            + bytes(i * 256 // 100 for i in range(100)) + struct.pack('>I', 0))
+    lame = (b'LAME3.100' + bytes((0x01, 0))                # tag revision 0 / CBR, lowpass unknown
+            + struct.pack('>IHHBB', 0, 0, 0, 0, min(bitrate // 1000, 255))  # no peak / gains, CBR kbps
+            + (LAME_ENCODER_DELAY << 12 | padding).to_bytes(3, 'big')
+            + struct.pack('>BBHIH', 0, 0, 0, stream_bytes, 0))  # music length; music CRC not computed
+    frame = bytearray(size)
+    frame[:4] = bytes((0xFF, b1, b2, b3))
+    pos = 4 + (17 if b3 >> 6 == 3 else 32)  # after the (zeroed) side info
+    body = xing + lame
+    frame[pos:pos + len(body)] = body
+    pos += len(body)
+    frame[pos:pos + 2] = struct.pack('>H', _crc16(frame[:pos]))
+    return bytes(frame)
+
+
+def join_segments(segment_paths, plan, out_path, total_samples):
+    """
+    Splice the segment encodes frame by frame behind an Info frame for the
+    whole stream (written last, into the space reserved for it); returns the
+    number of audio frames written.
+    """
+    written = audio_bytes = 0
+    header = None
+    with open(out_path, 'wb') as out:
+        for path, segment in zip(segment_paths, plan):
+            with open(path, 'rb') as f:
+                data = f.read()
+            frames = list(mp3_frames(data))[segment['drop']:]
+            if segment['keep'] is not None:
+                if len(frames) < segment['keep']:
+                    raise RuntimeError(f"segment {path} has {len(frames)} frames, expected {segment['keep']}")
+                frames = frames[:segment['keep']]
+            if header is None and frames:
+                header = data[frames[0][0]:frames[0][0] + 4]
+                out.write(bytes(len(info_frame(header, 0, 0, 0))))
+            for offset, length in frames:
+                out.write(data[offset:offset + length])
+                audio_bytes += length
+            written += len(frames)
+        if header is not None:
+            out.seek(0)
+            out.write(info_frame(header, written, audio_bytes, total_samples))
+    return written
+
+
+def encode_segmented(src, mp3_out, outputs, input_format, duration, workers, analysis_path=None):
+    """
+    Encode src into mp3_out with `workers` parallel ffmpeg processes, plus one
+    more process for the companion renditions and the analysis branch. Each
+    segment seeks close to its start and trims sample-exactly from there
+    (build_segment_cmd).
+    """
+    total_samples = int(round(duration * MP3_RATE))
+    plan = plan_segments(total_samples, workers)
+    work_dir = os.path.dirname(mp3_out)
+    paths = [os.path.join(work_dir, f'segment-{i:03d}.mp3') for i in range(len(plan))]
+    cmds = [build_segment_cmd(src, path, seg, input_format) for path, seg in zip(paths, plan)]
+    if outputs or analysis_path:
+        cmds.append(build_ffmpeg_cmd(src, None, outputs, input_format, analysis_path))
+    with ThreadPoolExecutor(max_workers=len(cmds)) as pool:
+        for proc in pool.map(lambda c: subprocess.run(c, capture_output=True), cmds):
+            if proc.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited {proc.returncode}: {proc.stderr.decode(errors='replace').strip()}")
+    frames = join_segments(paths, plan, mp3_out, total_samples)
+    for path in paths:
+        os.remove(path)
+    return frames
+
+
+def transcode_segmented(bucket, key, mp3_key, work_dir, outputs, input_format, duration, analysis_path=None,
+                        stats=None):
+    """File mode, but the MP3 encode is split across SEGMENT_WORKERS processes."""
+    stats = stats or StageStats()
+    local_src_path = os.path.join(work_dir, f'source.{input_format}')
+    local_mp3_path = os.path.join(work_dir, 'output.mp3')
+
+    print(f"Downloading s3://{bucket}/{key} -> {local_src_path}")
+    with stats.timed('download') as t:
+        s3.download_file(bucket, key, local_src_path)
+        t.nbytes = os.path.getsize(local_src_path)
+    hasher = SourceHasher()
+    with open(local_src_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            hasher.update(chunk)
+
+    with stats.timed('encode') as t:
+        frames = encode_segmented(local_src_path, local_mp3_path, outputs, input_format, duration,
+                                  SEGMENT_WORKERS, analysis_path)
+    print(f"Segmented encode of {duration:.0f}s on {SEGMENT_WORKERS} workers: "
+          f"{frames} frames in {time.monotonic() - t.started:.1f}s")
+
+    print(f"Uploading MP3 to s3://{bucket}/{mp3_key}")
+    with stats.timed('upload', os.path.getsize(local_mp3_path)):
+        s3.upload_file(local_mp3_path, bucket, mp3_key, ExtraArgs={'ContentType': 'audio/mpeg'})
+    return hasher.hashes()
+
+
+def probe_source(bucket, key):
+    """
+    Sniff the container from the first bytes instead of trusting the extension,
+    and read the duration from its header. Returns (format | None, seconds | None).
+    """
+    head = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{PROBE_BYTES - 1}')['Body'].read()
+    return audio_keys.sniff_format(head), audio_keys.header_duration(head)
+
+
+class SourceHasher:
+    """
+    The hashes a cache entry is stored under, computed while the source is
+    read for the encode: MD5 (a single-part ETag), and SHA-256 and CRC32 in
+    the form S3 reports full-object checksums (base64; CRC32 with the size,
+    it is no content hash on its own). So however the first copy arrived,
+    a later one is found by whichever of these S3 has for it.
+    """
+
+    def __init__(self):
+        self.md5, self.sha256 = hashlib.md5(), hashlib.sha256()
+        self.crc32 = self.size = 0
+
+    def update(self, chunk):
+        self.md5.update(chunk)
+        self.sha256.update(chunk)
+        self.crc32 = zlib.crc32(chunk, self.crc32)
+        self.size += len(chunk)
+
+    def hashes(self):
+        crc32 = base64.b64encode(self.crc32.to_bytes(4, 'big')).decode()
+        return [f'md5:{self.md5.hexdigest()}', f'sha256:{base64.b64encode(self.sha256.digest()).decode()}',
+                f'crc32:{crc32}:{self.size}']
+
+
+def source_hashes(head_resp):
+    """
+    Content hashes S3 already knows for the source, without reading it
+    (the keys SourceHasher stores entries under): a full-object SHA-256 or
+    CRC32 checksum, and the ETag of a single-part upload (= MD5 of the bytes).
+    A multipart upload only has the first two when the uploader asked for a
+    full-object checksum; with none, or a composite or CRC64NVME one, the
+    source is always encoded.
+    """
+    hashes = []
+    full_object = head_resp.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT'
+    sha256 = head_resp.get('ChecksumSHA256')
+    if sha256 and '-' not in sha256 and full_object:
+        hashes.append(f'sha256:{sha256}')
+    crc32 = head_resp.get('ChecksumCRC32')
+    if crc32 and '-' not in crc32 and full_object and head_resp.get('ContentLength') is not None:
+        hashes.append(f"crc32:{crc32}:{head_resp['ContentLength']}")
+    etag = (head_resp.get('ETag') or '').strip('"')
+    if etag and '-' not in etag:
+        hashes.append(f'md5:{etag}')
+    return hashes
+
+
+def cache_lookup(hashes, profile=ENCODING_PROFILE):
+    if not TRANSCODE_CACHE_TABLE:
+        return None
+    for h in hashes:
+        entry = dynamodb.meta.client.get_item(TableName=TRANSCODE_CACHE_TABLE,
+                                              Key={'contentHash': f'{h}#{profile}'}).get('Item')
+        if entry:
+            return entry
+    return None
+
+
+class StaleCacheEntry(Exception):
+    """A cached output was overwritten or deleted after its cache entry was stored."""
+
+
+def output_etags(bucket, mp3_key, rendition_keys, outputs):
+    """ETag of every object a cache entry points at: the MP3, each rendition and every HLS file."""
+    etags = {mp3_key: s3.head_object(Bucket=bucket, Key=mp3_key)['ETag']}
+    for out in outputs.values():
+        key = rendition_keys.get(out['attr'])
+        if not key:
             continue
+        if out.get('segmented'):
+            pages = s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=f'{os.path.dirname(key)}/')
+            for page in pages:
+                etags.update((obj['Key'], obj['ETag']) for obj in page.get('Contents', []))
+        else:
+            etags[key] = s3.head_object(Bucket=bucket, Key=key)['ETag']
+    return etags
+
 
-        # Step 3) Upload to mp3/
-        mp3_key = key.replace('flac/', 'mp3/').replace('.flac', '.mp3')
-        print(f"Uploading MP3 to s3://{bucket}/{mp3_key}")
+def cache_store(bucket, hashes, mp3_key, rendition_keys, outputs, encode_seconds, source_key, analysis=None,
+                profile=ENCODING_PROFILE):
+    if not TRANSCODE_CACHE_TABLE:
+        return
+    try:
+        etags = output_etags(bucket, mp3_key, rendition_keys, outputs)
+    except Exception as e:
+        print(f"WARNING: could not read the outputs of {source_key}, not caching them: {e}")
+        return
+    keys = [f'{h}#{profile}' for h in dict.fromkeys(hashes)]
+    for k in keys:
         try:
-            s3.upload_file(local_mp3_path, bucket, mp3_key)
+            dynamodb.meta.client.put_item(TableName=TRANSCODE_CACHE_TABLE, Item={
+                'contentHash': k,
+                'contentHashes': keys,  # the same outputs under every hash, dropped together
+                'mp3Key': mp3_key,
+                'renditions': rendition_keys,
+                'etags': etags,
+                'encodeSeconds': str(round(encode_seconds, 3)),
+                'sourceKey': source_key,
+                'analysis': analysis or {},
+            })
         except Exception as e:
-            print(f"ERROR: S3 upload for MP3 failed: {e}")
+            print(f"WARNING: could not store transcode cache entry {k}: {e}")
+
+
+def cache_drop(entry):
+    for k in entry.get('contentHashes') or [entry['contentHash']]:
+        try:
+            dynamodb.meta.client.delete_item(TableName=TRANSCODE_CACHE_TABLE, Key={'contentHash': k})
+        except Exception as e:
+            print(f"WARNING: could not drop transcode cache entry {k}: {e}")
+
+
+def restore_from_cache(bucket, entry, mp3_key, outputs):
+    """
+    Server-side copy a cached ladder to this source's keys; returns {attr: key}.
+
+    The cached keys are named after their source, which can be overwritten or
+    deleted later, so every copy is conditional on the ETag recorded when the
+    entry was stored. Anything else raises StaleCacheEntry.
+    """
+    from botocore.exceptions import ClientError  # imports botocore; keep it off the init path
+    etags = entry.get('etags') or {}
+    copies = [(entry['mp3Key'], mp3_key)]
+    rendition_keys = {}
+    cached = entry.get('renditions') or {}
+    for out in outputs.values():
+        if out['attr'] not in cached:
             continue
+        if out.get('segmented'):
+            # copy the whole HLS directory; the playlist uses relative segment URIs
+            src_prefix, dst_prefix = os.path.dirname(cached[out['attr']]), os.path.dirname(out['key'])
+            copies += [(k, dst_prefix + k[len(src_prefix):]) for k in etags if k.startswith(f'{src_prefix}/')]
+        else:
+            copies.append((cached[out['attr']], out['key']))
+        rendition_keys[out['attr']] = out['key']
+    for src, dst in copies:
+        if src not in etags:
+            raise StaleCacheEntry(f"no ETag recorded for {src}")
+        try:
+            if src == dst:
+                s3.head_object(Bucket=bucket, Key=src, IfMatch=etags[src])
+            else:
+                s3.copy({'Bucket': bucket, 'Key': src}, bucket, dst, ExtraArgs={'CopySourceIfMatch': etags[src]})
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('404', 'NoSuchKey', '412', 'PreconditionFailed'):
+                raise StaleCacheEntry(f"{src}: {code}") from e
+            raise
+    return rendition_keys
+
+
+def process_record(record):
+    """
+    Transcode one S3 record and point its track at the MP3.
+
+    Returns {"key", "status": "ok" | "skipped" | "failed", ...}. Each record
+    gets its own work directory so records can run side by side.
+    """
+    bucket = record['s3']['bucket']['name']
+    raw_key = record['s3']['object']['key']
+    size_bytes = record['s3']['object'].get('size', 0)
+
+    # decode any URL-encoded chars like spaces
+    key = urllib.parse.unquote_plus(raw_key)
+
+    # We only transcode lossless sources (FLAC / WAV / AIFF) in the upload prefixes
+    if not audio_keys.is_lossless_key(key):
+        print(f"Skipping object {key} (not a lossless upload).")
+        return {'key': key, 'status': 'skipped'}
+
+    input_format, duration = probe_source(bucket, key)
+    if not input_format:
+        print(f"Skipping object {key} (content is not FLAC, WAV or AIFF).")
+        return {'key': key, 'status': 'skipped'}
+
+    print(f"Processing {input_format.upper()} file: {bucket}/{key}, size={size_bytes} bytes, "
+          f"duration={duration if duration is None else round(duration, 1)}s")
+
+    # Attempt to read the object's user metadata to get trackId
+    head_resp = {}
+    try:
+        head_resp = s3.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+        user_meta = head_resp.get('Metadata', {})
+        track_id = user_meta.get('trackid')  # case-insensitive, but best to keep lower
+    except Exception as e:
+        print(f"ERROR: Could not head_object or read metadata for {key}: {e}")
+        track_id = None
+    # presigned uploads carry the trackId in the key instead
+    track_id = track_id or audio_keys.track_id_from_key(key)
+
+    if not track_id:
+        print(f"WARNING: No trackId metadata found for {key}. We'll skip DB update.")
+    else:
+        print(f"Found trackId={track_id} in object metadata of {key}.")
+
+    mp3_key = audio_keys.rendition_key(key, 'audioS3Key')
+    stats = StageStats()
+    record_started = time.monotonic()
+    mode = 'cache'
+    hashes = source_hashes(head_resp)
+    cache = {'cache': 'off'} if not TRANSCODE_CACHE_TABLE else {'cache': 'miss'}
+    segmented = bool(duration and duration >= SEGMENT_MIN_SECONDS and SEGMENT_WORKERS > 1)
+    profile = SEGMENTED_PROFILE if segmented else ENCODING_PROFILE
+    work_dir = tempfile.mkdtemp(prefix='transcode-', dir='/tmp')
+    try:
+        outputs = rendition_outputs(key, work_dir)
+
+        # Same bytes already encoded with the same settings? Copy instead of encoding.
+        entry = None
+        try:
+            entry = cache_lookup(hashes, profile)
+            if entry:
+                rendition_keys = restore_from_cache(bucket, entry, mp3_key, outputs)
+                analysis = entry.get('analysis') or {}
+                cache = {'cache': 'hit', 'secondsSaved': float(entry.get('encodeSeconds', 0))}
+                print(f"Transcode cache hit for {key}: copied from {entry['mp3Key']}")
+        except StaleCacheEntry as e:
+            print(f"Transcode cache entry for {key} is stale ({e}), dropping it and encoding")
+            cache_drop(entry)
+            cache = {'cache': 'stale'}
+            entry = None
+        except Exception as e:
+            print(f"WARNING: transcode cache unusable for {key}, encoding instead: {e}")
+            entry = None
 
-        # Step 4) Update DynamoDB if we have trackId
-        if track_id:
-            print(f"Updating DynamoDB table {DYNAMODB_TABLE} item id={track_id} to {mp3_key}")
+        if not entry:
+            started = time.monotonic()
+            analysis_path = os.path.join(work_dir, 'analysis.txt') if ANALYZE else None
+            if segmented:
+                mode = 'segmented'
+                streamed = transcode_segmented(bucket, key, mp3_key, work_dir, outputs, input_format, duration,
+                                          analysis_path, stats)
+            elif TRANSCODE_MODE == 'file':
+                mode = 'file'
+                streamed = transcode_to_file(bucket, key, mp3_key, work_dir, outputs, input_format, analysis_path,
+                                        stats)
+            else:
+                mode = 'stream'
+                streamed = transcode_streaming(bucket, key, mp3_key, outputs, input_format, analysis_path, stats,
+                                          duration)
+            rendition_keys = upload_renditions(bucket, outputs, stats)
             try:
-                # We'll do a direct update if item exists
-                update_resp = table.update_item(
+                analysis = parse_analysis(analysis_path)
+            except Exception as e:  # never fail a finished transcode over the analysis
+                print(f"WARNING: could not parse analysis for {key}: {e}")
+                analysis = {}
+            cache_store(bucket, hashes + streamed, mp3_key, rendition_keys, outputs,
+                        time.monotonic() - started, key, analysis, profile)
+    except Exception as e:
+        print(f"ERROR: transcode failed for {key}: {e}")
+        return {'key': key, 'status': 'failed', 'error': str(e)}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Update DynamoDB if we have trackId
+    result = {'key': key, 'status': 'ok', 'mp3Key': mp3_key, **rendition_keys, **cache,
+              'analysis': {k: float(v) for k, v in analysis.items()},
+              'trackId': track_id, 'dbUpdated': False}
+    if track_id:
+        print(f"Updating DynamoDB table {DYNAMODB_TABLE} item id={track_id} to {mp3_key} {rendition_keys}")
+        try:
+            # We'll do a direct update if item exists; all rendition keys in one write.
+            # sourceS3Key keeps a pointer to the lossless original; the analysis
+            # (loudness / gain / peak / duration) rides along in the same write.
+            attrs = {'audioS3Key': mp3_key, **rendition_keys,
+                     'sourceS3Key': key, 'sourceFormat': input_format, **analysis}
+            with stats.timed('db'):
+                dynamodb.meta.client.update_item(
+                    TableName=DYNAMODB_TABLE,
                     Key={'id': track_id},
-                    UpdateExpression="SET audioS3Key = :mp3k",
-                    ExpressionAttributeValues={":mp3k": mp3_key},
+                    UpdateExpression="SET " + ", ".join(f"{a} = :v{i}" for i, a in enumerate(attrs)),
+                    ExpressionAttributeValues={f":v{i}": v for i, v in enumerate(attrs.values())},
                     ConditionExpression="attribute_exists(id)"
                 )
-                print(f"DB update success. Updated item to reference {mp3_key}.")
-            except Exception as e:
-                print(f"WARNING: Could not update DB for track_id={track_id} => {e}")
-        else:
-            print("Skipping DB update since no trackId found.")
-
-        # Step 5) Cleanup
-        try:
-            os.remove(local_flac_path)
-            os.remove(local_mp3_path)
+            result['dbUpdated'] = True
+            print(f"DB update success. Updated item to reference {mp3_key}.")
         except Exception as e:
-            print(f"Warning: error removing local temp files: {e}")
+            print(f"WARNING: Could not update DB for track_id={track_id} => {e}")
+
+    audio_seconds = float(analysis.get('durationSec') or duration or 0)
+    result['timings'] = {'mode': mode, 'audioSeconds': round(audio_seconds, 3),
+                         'totalSeconds': round(time.monotonic() - record_started, 3),
+                         **stats.summary(audio_seconds)}
+    emit_record_metrics(result)
+    return result
+
+
+METRIC_UNITS = {
+    'downloadSeconds': 'Seconds', 'encodeSeconds': 'Seconds', 'uploadSeconds': 'Seconds',
+    'dbSeconds': 'Seconds', 'totalSeconds': 'Seconds', 'audioSeconds': 'Seconds',
+    'downloadBytes': 'Bytes', 'uploadBytes': 'Bytes',
+    'downloadMBps': 'Megabytes/Second', 'uploadMBps': 'Megabytes/Second',
+    'encodeRealtime': 'None',
+}
+
+
+def emit_record_metrics(result):
+    """One EMF record per transcoded file, dimensioned by mode (stream / file / segmented / cache)."""
+    timings = result['timings']
+    try:
+        metrics.emit(
+            METRICS_NAMESPACE,
+            {k: v for k, v in timings.items() if k in METRIC_UNITS},
+            dimensions={'Mode': timings['mode']},
+            units=METRIC_UNITS,
+            properties={'key': result['key'], 'trackId': result.get('trackId')},
+        )
+    except Exception as e:
+        print(f"WARNING: could not emit metrics for {result['key']}: {e}")
+
+
+@tracing.traced("transcode")
+def flac_to_mp3_handler(event, context):
+    """
+    Triggered by S3 PutObject for lossless uploads: 'flac/', 'wav/', 'aiff/'
+    and presigned 'tracks/<trackId>.<flac|wav|aif|aiff>' (see audio_keys).
+
+    For every record we:
+      0) Detect the real format from the first bytes (non-lossless is skipped)
+      1) Transcode the source to a 320 kbps MP3 under the 'mp3/' prefix, either
+         streamed through ffmpeg (TRANSCODE_MODE=stream) or staged in a
+         per-record /tmp work dir (file). The same ffmpeg run also writes the
+         RENDITIONS ladder (96k AAC under 'aac/', preview clip under 'preview/',
+         optionally an HLS playlist + fMP4 segments under 'hls/<name>/').
+         Sources longer than SEGMENT_MIN_SECONDS are encoded in parallel
+         frame-aligned segments instead (transcode_segmented).
+         A last branch of the same decode measures EBU R128 loudness, true
+         peak and the exact duration (ANALYZE).
+      2) Using the object metadata (trackId), we update that DB item so audioS3Key = "mp3/..."
+         and lowBitrateS3Key / previewS3Key point at the companions, together
+         with loudnessLufs / replayGainDb / truePeakDbtp / durationSec / sampleRate.
+
+    Records run concurrently on TRANSCODE_WORKERS threads (one ffmpeg process
+    each); the response lists the outcome of every record.
+    """
+    records = event.get('Records', [])
+    keys = [r.get('s3', {}).get('object', {}).get('key') for r in records]
+    print(f"Received S3 event: records={len(records)} keys={keys[:5]}{' ...' if len(keys) > 5 else ''}")
+    tracing.annotate(records=len(records))
+    workers = max(1, min(TRANSCODE_WORKERS, len(records)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_safe_process_record, records))
+
+    counts = {s: sum(r['status'] == s for r in results) for s in ('ok', 'skipped', 'failed')}
+    print(f"Transcode summary: records={len(results)} workers={workers} {counts}")
+    if TRANSCODE_CACHE_TABLE:
+        hits = sum(r.get('cache') == 'hit' for r in results)
+        lookups = sum(r.get('cache') in ('hit', 'miss', 'stale') for r in results)
+        saved = sum(r.get('secondsSaved', 0) for r in results)
+        print(f"Transcode cache: hits={hits}/{lookups} "
+              f"hitRate={hits / lookups if lookups else 0:.2f} secondsSaved={saved:.1f}")
+    for r in results:
+        if r['status'] == 'failed':
+            print(f"FAILED {r['key']}: {r.get('error')}")
+
+    return {
+        "statusCode": 200 if not counts['failed'] else 207,
+        "body": json.dumps({"message": "Transcode done", **counts, "results": results}),
+    }
+
 
-    return {"statusCode": 200, "body": "Transcode done"}
+def _safe_process_record(record):
+    try:
+        return process_record(record)
+    except Exception as e:  # malformed record; never take the rest of the batch down
+        return {'key': record.get('s3', {}).get('object', {}).get('key'), 'status': 'failed', 'error': str(e)}
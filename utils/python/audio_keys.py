@@ -0,0 +1,103 @@
+import os
+import struct
+
+# Where uploaded lossless sources live. "tracks/" is the presigned-upload flow
+# (tracks/<trackId>.<ext>, see generate_presigned_url_upload).
+LOSSLESS_PREFIXES = ("flac/", "wav/", "aiff/", "tracks/")
+LOSSLESS_EXTENSIONS = (".flac", ".wav", ".aif", ".aiff", ".aifc")
+
+# Track attribute -> (prefix, extension) of each compressed rendition the
+# transcoder writes for a lossless source.
+PLAYBACK_KEYS = {
+    "audioS3Key":      ("mp3/", ".mp3"),
+    "lowBitrateS3Key": ("aac/", ".m4a"),
+    "previewS3Key":    ("preview/", ".m4a"),
+    # HLS: playlist + init segment + fMP4 segments under hls/<name>/
+    "hlsS3Key":        ("hls/", "/index.m3u8"),
+}
+
+
+def is_lossless_key(key: str) -> bool:
+    k = (key or "").lower()
+    return k.startswith(LOSSLESS_PREFIXES) and k.endswith(LOSSLESS_EXTENSIONS)
+
+
+def source_stem(key: str) -> str:
+    """'flac/Artist - Song.flac' -> 'Artist - Song' (sub-folders are kept)."""
+    return os.path.splitext(key.split("/", 1)[-1])[0]
+
+
+def rendition_key(source_key: str, attr: str) -> str:
+    """
+    Where the transcoder writes `attr` for a lossless source:
+      tracks/<id>.wav   -> mp3/<id>.mp3       (presigned uploads, by trackId)
+      flac/Song.flac    -> mp3/Song.mp3       (the original layout; existing items,
+                                               presigned URLs and delete_track use it)
+      wav/Song.wav      -> mp3/wav/Song.mp3   (newer folders keep their prefix so
+      aiff/Song.aiff    -> mp3/aiff/Song.mp3   they can't overwrite a flac/ rendition)
+    """
+    prefix, ext = PLAYBACK_KEYS[attr]
+    if source_key.startswith("flac/"):
+        name = source_stem(source_key)
+    else:
+        name = track_id_from_key(source_key) or os.path.splitext(source_key)[0]
+    return f"{prefix}{name}{ext}"
+
+
+def track_id_from_key(key: str):
+    """Presigned uploads are stored as tracks/<trackId>.<ext>."""
+    if key.startswith("tracks/") and "/" not in key[len("tracks/"):]:
+        return source_stem(key)
+    return None
+
+
+def sniff_format(head: bytes):
+    """Detect the container from the first 12 bytes: 'flac' | 'wav' | 'aiff' | None."""
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] in (b"RIFF", b"RF64", b"BW64") and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    return None
+
+
+def header_duration(head: bytes):
+    """
+    Duration in seconds read from the container header (first ~64 KB of the
+    file), or None when the header doesn't say (streamed FLAC, RF64, ...).
+    """
+    fmt = sniff_format(head)
+    try:
+        if fmt == "flac":
+            # STREAMINFO is always the first metadata block: 20-bit rate, 3+5 bits, 36-bit total samples
+            bits = int.from_bytes(head[18:26], "big")
+            rate, total = bits >> 44, bits & ((1 << 36) - 1)
+            return total / rate if rate and total else None
+        if fmt == "wav":
+            byte_rate = None
+            for cid, data, size in _chunks(head, "<"):
+                if cid == b"fmt ":
+                    byte_rate = struct.unpack_from("<I", data, 8)[0]
+                elif cid == b"data" and byte_rate and size != 0xFFFFFFFF:
+                    return size / byte_rate
+        if fmt == "aiff":
+            for cid, data, _ in _chunks(head, ">"):
+                if cid == b"COMM":
+                    frames = struct.unpack_from(">I", data, 2)[0]
+                    exp, mant = struct.unpack_from(">HQ", data, 8)
+                    rate = mant * 2.0 ** ((exp & 0x7FFF) - 16383 - 63)
+                    return frames / rate if rate else None
+    except struct.error:
+        pass
+    return None
+
+
+def _chunks(head, endian):
+    """(id, data, declared size) of the RIFF/IFF chunks that start inside head."""
+    pos = 12
+    while pos + 8 <= len(head):
+        cid = head[pos:pos + 4]
+        size = struct.unpack_from(endian + "I", head, pos + 4)[0]
+        yield cid, head[pos + 8:pos + 8 + size], size
+        pos += 8 + size + (size & 1)
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+
+import tracing
+
+# One HTTP pool per client, shared by every thread and kept across warm
+# invocations; size it for the widest thread pool of any handler.
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", "3"))
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def config(**overrides):
+    """botocore Config with the shared defaults (keep-alive, pool size, standard retries) + overrides."""
+    from botocore.config import Config
+    base = Config(
+        tcp_keepalive=True,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        retries={"mode": "standard", "max_attempts": 4},
+    )
+    return base.merge(Config(**overrides)) if overrides else base
+
+
+def _cached(kind, service, region_name, endpoint_url, overrides):
+    # an explicit region equal to the Lambda's own must hit the same cache entry
+    region_name = region_name or os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+    key = (kind, service, region_name, endpoint_url, json.dumps(overrides, sort_keys=True))
+    obj = _cache.get(key)
+    if obj is None:
+        with _lock:  # two threads racing on a cold container build it once
+            obj = _cache.get(key)
+            if obj is None:
+                import boto3  # ~200 ms: paid by the first request that needs AWS, not by every init
+                factory = boto3.client if kind == "client" else boto3.resource
+                obj = factory(service, region_name=region_name, endpoint_url=endpoint_url,
+                              config=config(**overrides))
+                tracing.instrument(obj if kind == "client" else obj.meta.client)
+                _cache[key] = obj
+    return obj
+
+
+def __getattr__(name):
+    # `except aws_clients.ClientError` is only evaluated once an exception
+    # reaches it, so handlers catch botocore errors without importing botocore at init
+    if name == "ClientError":
+        from botocore.exceptions import ClientError
+        return ClientError
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def client(service, region_name=None, endpoint_url=None, **overrides):
+    """Shared boto3 client (thread-safe); extra kwargs are botocore Config options."""
+    return _cached("client", service, region_name, endpoint_url, overrides)
+
+
+def resource(service, region_name=None, endpoint_url=None, **overrides):
+    """
+    Shared boto3 resource. Resources are not thread-safe: worker threads
+    should use resource(...).meta.client or build their own.
+    """
+    return _cached("resource", service, region_name, endpoint_url, overrides)
+
+
+def table(name, region_name=None):
+    return resource("dynamodb", region_name=region_name).Table(name)
+
+
+class Lazy:
+    """
+    Module-level stand-in for a client, resource or Table that is built on
+    first attribute access, so importing a handler (its Lambda init) does not
+    import boto3 or load service models, and an OPTIONS preflight or a 400
+    never pays for them.
+    """
+    __slots__ = ("_factory", "_obj")
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    def resolve(self):
+        if self._obj is None:
+            self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        return f"Lazy({self._obj!r})" if self._obj is not None else "Lazy(<unresolved>)"
+
+
+def lazy_client(service, **kwargs):
+    return Lazy(lambda: client(service, **kwargs))
+
+
+def lazy_resource(service, **kwargs):
+    return Lazy(lambda: resource(service, **kwargs))
+
+
+def lazy_table(name, region_name=None):
+    return Lazy(lambda: table(name, region_name))
@@ -2,13 +2,42 @@ import json
 from decimal import Decimal
 
 class _DecimalEncoder(json.JSONEncoder):
-    """Turn decimal.Decimal → float so every response is valid JSON."""
+    """Turn decimal.Decimal → float (and DynamoDB sets → sorted lists) so every response is valid JSON."""
     def default(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)         # or str(obj) if you prefer
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj)        # promoted SS/NS attributes (moods, style)
         return super().default(obj)
 
 
+def _json_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+# Same output as json.dumps(body, cls=_DecimalEncoder), byte for byte
+# (scripts/bench_json.py checks it), from encoders built once. The fast one's
+# default is Decimal.__float__ itself, so every Decimal is converted by a C
+# call instead of a Python method (anything else still raises TypeError); a
+# body with sets (promoted SS/NS attributes) fails on the first one and is
+# re-encoded by the full one. Response bodies are trees built from DynamoDB
+# items, never cyclic, so the per-container/per-default() cycle markers are
+# skipped.
+_FAST_ENCODER = json.JSONEncoder(default=Decimal.__float__, check_circular=False)
+_ENCODER = json.JSONEncoder(default=_json_default, check_circular=False)
+
+
+def dumps(body):
+    try:
+        return _FAST_ENCODER.encode(body)
+    except TypeError:
+        return _ENCODER.encode(body)
+
+
 def build_response(status_code, body, cors=True):
     headers = {
         "Content-Type": "application/json",
@@ -17,11 +46,11 @@ def build_response(status_code, body, cors=True):
         headers.update({
             "Access-Control-Allow-Origin": "*",  # Or specific origin
             "Access-Control-Allow-Methods": "POST, GET, OPTIONS, PUT, DELETE",
-            "Access-Control-Allow-Headers": "Content-Type, X-Amz-Date, Authorization, X-Api-Key, X-Amz-Security-Token"
+            "Access-Control-Allow-Headers": "Content-Type, X-Amz-Date, Authorization, X-Api-Key, X-Amz-Security-Token, X-Profile"
         })
 
     return {
         "statusCode": status_code,
         "headers": headers,
-        "body": json.dumps(body, cls=_DecimalEncoder),
+        "body": dumps(body),
     }
\ No newline at end of file
@@ -0,0 +1,49 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_GET_MAX = 100  # DynamoDB limit per BatchGetItem request
+MAX_ATTEMPTS = 8
+
+
+def batch_get(dynamodb, table_name, keys, projection=None, names=None, workers=1):
+    """
+    Fetch many items by primary key with BatchGetItem. `dynamodb` is the boto3
+    resource; calls go through its client (which keeps the resource's type
+    (de)serialization but, unlike the resource, is thread-safe), so up to
+    `workers` chunks of 100 keys are in flight at once. Keys are
+    de-duplicated; UnprocessedKeys are retried with jittered exponential
+    backoff. Returns the found items in no particular order; missing keys are
+    simply absent.
+    """
+    client = dynamodb.meta.client
+    unique = list({tuple(sorted(k.items())): k for k in keys}.values())
+    requests = []
+    for start in range(0, len(unique), BATCH_GET_MAX):
+        request = {"Keys": unique[start:start + BATCH_GET_MAX]}
+        if projection:
+            request["ProjectionExpression"] = projection
+        if names:
+            request["ExpressionAttributeNames"] = names
+        requests.append({table_name: request})
+
+    if workers > 1 and len(requests) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(requests))) as pool:
+            chunks = list(pool.map(lambda r: _get_until_done(client, r), requests))
+    else:
+        chunks = [_get_until_done(client, r) for r in requests]
+    return [item for chunk in chunks for item in chunk]
+
+
+def _get_until_done(client, request_items):
+    items = []
+    for attempt in range(MAX_ATTEMPTS):
+        resp = client.batch_get_item(RequestItems=request_items)
+        for table_items in resp.get("Responses", {}).values():
+            items += table_items
+        request_items = resp.get("UnprocessedKeys") or {}
+        if not request_items:
+            return items
+        time.sleep(min(2.0, 0.05 * 2 ** attempt) * random.random())
+    raise RuntimeError(f"BatchGetItem left {sum(len(r['Keys']) for r in request_items.values())} "
+                       f"keys unprocessed after {MAX_ATTEMPTS} attempts")
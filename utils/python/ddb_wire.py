@@ -0,0 +1,90 @@
+import json
+
+import aws_clients
+
+# Bulk reads straight from DynamoDB's JSON wire format to response-ready values.
+#
+# Through the boto3 resource a Scan/Query response is walked three times in
+# Python: botocore's parser follows the service model into every attribute
+# value, TypeDeserializer turns each one into Decimal/set/Binary, and
+# build_response turns them back into floats and lists. On the client from
+# client() below, a before-parse hook decodes the raw body with json.loads
+# (C) and one pass of decode_item(), hands botocore the body without "Items"
+# (so LastEvaluatedKey, Count and ConsumedCapacity are parsed as usual) and
+# puts the decoded items back into the result. Items come out as:
+#   S -> str, N -> int or float, BOOL -> bool, NULL -> None, L -> list, M -> dict,
+#   SS / NS -> sorted list, B -> base64 str (as on the wire), BS -> sorted list of those.
+# Request parameters (ExpressionAttributeValues, ExclusiveStartKey) stay in wire
+# format: {":pk": {"S": "DJ"}}. Numbers lose Decimal's exactness past float
+# precision, which build_response already did when it encoded them.
+DECODED_OPERATIONS = ("Scan", "Query")
+USER_AGENT = "wl-ddb-wire"
+
+
+def _number(s):
+    if "." in s or "e" in s or "E" in s:
+        return float(s)
+    return int(s)
+
+
+def decode(value):
+    """One attribute value ({"S": "x"}, {"N": "1.5"}, ...) as a plain JSON value."""
+    (tag, v), = value.items()
+    if tag == "S":
+        return v
+    if tag == "N":
+        return _number(v)
+    if tag == "M":
+        return {k: decode(x) for k, x in v.items()}
+    if tag == "L":
+        return [decode(x) for x in v]
+    if tag == "BOOL":
+        return v
+    if tag == "NULL":
+        return None
+    if tag == "SS" or tag == "BS":
+        return sorted(v)
+    if tag == "NS":
+        return sorted(_number(x) for x in v)
+    if tag == "B":
+        return v
+    raise ValueError(f"unknown DynamoDB attribute type {tag!r}")
+
+
+def decode_item(item):
+    return {k: decode(v) for k, v in item.items()}
+
+
+def _decode_items(response_dict, customized_response_dict, **kwargs):
+    if response_dict.get("status_code") != 200:
+        return  # errors go through botocore's parser untouched
+    body = json.loads(response_dict["body"])
+    items = body.pop("Items", None)
+    if items is None:
+        return
+    customized_response_dict["Items"] = [decode_item(item) for item in items]
+    response_dict["body"] = json.dumps(body).encode()
+
+
+def install(client):
+    """Register the decoder on a DynamoDB client (idempotent); only use that client for reads."""
+    events = client.meta.events
+    if getattr(events, "_wl_wire", False):
+        return client
+    for op in DECODED_OPERATIONS:
+        events.register(f"before-parse.dynamodb.{op}", _decode_items, unique_id=f"wl-ddb-wire-{op}")
+    events._wl_wire = True
+    return client
+
+
+def client(region_name=None):
+    """
+    Shared DynamoDB client whose scan() / query() return decoded Items. It is
+    a separate client from aws_clients.client("dynamodb") (the user agent
+    suffix gives it its own cache entry), so nothing else sees plain items.
+    """
+    return install(aws_clients.client("dynamodb", region_name=region_name, user_agent_extra=USER_AGENT))
+
+
+def lazy_client(region_name=None):
+    return aws_clients.Lazy(lambda: client(region_name))
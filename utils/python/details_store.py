@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+from decimal import Decimal
+
+ENCODING = "gzip+json"
+# Compressed documents above this go to S3 and the item keeps a pointer
+# (DynamoDB items are capped at 400 KB, and every KB read/written is paid for)
+SPILL_BYTES = int(os.environ.get("DETAILS_SPILL_BYTES", "64000"))
+SPILL_PREFIX = os.environ.get("DETAILS_SPILL_PREFIX", "details/")
+
+
+def _number(d):
+    return int(d) if d == d.to_integral_value() else float(d)
+
+
+def encode(doc):
+    """Canonical JSON (sorted keys, no whitespace) of a details document, gzipped."""
+    raw = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_number)
+    return gzip.compress(raw.encode("utf-8"), compresslevel=6, mtime=0)
+
+
+def decode(blob):
+    """
+    Inverse of encode(). Floats come back as Decimal, so the document can be
+    written to DynamoDB as-is; ints stay int, so responses keep 124 (not 124.0).
+    """
+    return json.loads(gzip.decompress(bytes(blob)), parse_float=Decimal)
+
+
+def spill_key(track_id):
+    return f"{SPILL_PREFIX}{track_id}.json.gz"
+
+
+def build_item(track_id, doc, s3=None, bucket=None):
+    """
+    TrackDetails attributes holding `doc`: {"detailsBlob", "detailsEncoding"}
+    inline, or {"detailsS3Key", "detailsEncoding"} after uploading the blob to
+    `bucket` when it is larger than SPILL_BYTES.
+    """
+    from boto3.dynamodb.types import Binary
+
+    blob = encode(doc)
+    if len(blob) <= SPILL_BYTES or s3 is None:
+        return {"detailsBlob": Binary(blob), "detailsEncoding": ENCODING}
+    key = spill_key(track_id)
+    s3.put_object(Bucket=bucket, Key=key, Body=blob,
+                  ContentType="application/json", ContentEncoding="gzip")
+    return {"detailsS3Key": key, "detailsSize": len(blob), "detailsEncoding": ENCODING}
+
+
+def read_details(item, s3=None, bucket=None):
+    """
+    The details document of a TrackDetails item, whichever way it was stored:
+    inline compressed blob, S3 pointer, or the legacy `details` map.
+    """
+    if not item:
+        return None
+    if "detailsBlob" in item:
+        blob = item["detailsBlob"]
+        return decode(getattr(blob, "value", blob))  # boto3 Binary or raw bytes
+    if "detailsS3Key" in item:
+        return decode(s3.get_object(Bucket=bucket, Key=item["detailsS3Key"])["Body"].read())
+    return item.get("details")
+
+
+def load_details(table, track_id, s3=None, bucket=None):
+    """get_item + read_details; None when the track has no details."""
+    item = table.get_item(Key={"trackId": track_id}).get("Item")
+    return read_details(item, s3, bucket)
@@ -0,0 +1,78 @@
+from collections import Counter
+from datetime import date, timedelta
+
+# Single item in the stats table holding one counter attribute per UTC day:
+#   {"id": "due", "d_2026-10-19": 12, "d_2026-10-20": 3, ...}
+# Every track in the LearningIndex is counted in the bucket of its nextReviewAt.
+DUE_STATS_ID = "due"
+BUCKET_PREFIX = "d_"
+
+
+def bucket_for(next_review_at: str) -> str:
+    """Counter attribute for an ISO-8601 nextReviewAt (UTC)."""
+    return BUCKET_PREFIX + next_review_at[:10]
+
+
+def is_counted(item) -> bool:
+    """Only items that live in the LearningIndex are part of the forecast."""
+    return bool(item and item.get("pkLearning") and item.get("nextReviewAt"))
+
+
+def adjust(stats_table, deltas):
+    """
+    Apply {nextReviewAt or bucket: +/-n} with one atomic ADD UpdateItem.
+    Zero deltas (e.g. a grade that keeps the track in the same day) are dropped.
+    """
+    merged = Counter()
+    for k, n in deltas.items():
+        merged[k if k.startswith(BUCKET_PREFIX) else bucket_for(k)] += n
+    merged = {k: n for k, n in merged.items() if n}
+    if not merged:
+        return
+
+    names, values, parts = {}, {}, []
+    for i, (bucket, n) in enumerate(sorted(merged.items())):
+        names[f"#b{i}"] = bucket
+        values[f":n{i}"] = n
+        parts.append(f"#b{i} :n{i}")
+
+    stats_table.update_item(
+        Key={"id": DUE_STATS_ID},
+        UpdateExpression="ADD " + ", ".join(parts),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def forecast(item, today: date, days: int = 7):
+    """
+    Turn the stats item into the /stats/due payload.
+
+    Buckets before `today` are folded into `overdue`; `histogram` lists today
+    and the following days. The counters are per day, so the summaries are too:
+    `dueToday` includes reviews due later today. Negative counters (drift
+    before a rebuild) read as 0.
+    """
+    counts = {}
+    for k, v in (item or {}).items():
+        if k.startswith(BUCKET_PREFIX):
+            counts[k[len(BUCKET_PREFIX):]] = max(int(v), 0)
+
+    def due_before(offset):
+        # everything due before the start of today + offset, however long the histogram is
+        end = (today + timedelta(days=offset)).isoformat()
+        return sum(n for d, n in counts.items() if d < end)
+
+    histogram = []
+    for i in range(days):
+        d = (today + timedelta(days=i)).isoformat()
+        histogram.append({"date": d, "count": counts.get(d, 0)})
+
+    return {
+        "overdue": due_before(0),
+        "dueToday": due_before(1),
+        "dueByTomorrow": due_before(2),
+        "dueThisWeek": due_before(7),
+        "total": sum(counts.values()),
+        "histogram": histogram,
+    }
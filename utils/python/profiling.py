@@ -0,0 +1,133 @@
+import hashlib
+import hmac
+import io
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+# PROFILE=1 profiles every invocation of the function (turn on, reproduce, turn off).
+# With a secret configured, a single API request can ask for it with a signed header:
+#   X-Profile: <unix expiry>.<hex HMAC-SHA256(secret, "<function>:<expiry>")>
+# (scripts/profile_header.py mints one). Deployed functions get the name of an
+# SSM SecureString in PROFILE_SECRET_PARAM and read it the first time a request
+# carries the header, so the secret never sits in the function configuration;
+# PROFILE_SECRET sets it directly for local runs. With none of them set, nothing
+# is parsed or imported per invocation: enabled() is a constant False.
+PROFILE = os.environ.get("PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_SECRET_PARAM = os.environ.get("PROFILE_SECRET_PARAM", "")
+PROFILE_BUCKET = os.environ.get("PROFILE_BUCKET") or os.environ.get("BUCKET_NAME") or os.environ.get("S3_BUCKET")
+PROFILE_PREFIX = os.environ.get("PROFILE_PREFIX", "diagnostics/profiles/")
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", "30"))
+HEADER = "x-profile"
+MAX_TTL = 3600  # a leaked header stops working within the hour
+
+
+def enabled():
+    return PROFILE or bool(PROFILE_SECRET or PROFILE_SECRET_PARAM)
+
+
+def header_secret():
+    """The header secret; fetched from SSM on first use and kept for the container's lifetime."""
+    global PROFILE_SECRET
+    if not PROFILE_SECRET and PROFILE_SECRET_PARAM:
+        import aws_clients
+        try:
+            PROFILE_SECRET = aws_clients.client("ssm").get_parameter(
+                Name=PROFILE_SECRET_PARAM, WithDecryption=True)["Parameter"]["Value"]
+        except Exception as e:  # profiling must never fail the request; retried on the next signed one
+            print(f"WARNING: profile secret {PROFILE_SECRET_PARAM} unreadable: {e}")
+    return PROFILE_SECRET
+
+
+def sign(function, secret, ttl=900, now=None):
+    expires = int((now or time.time()) + ttl)
+    mac = hmac.new(secret.encode(), f"{function}:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{mac}"
+
+
+def verify(function, value, secret, now=None):
+    try:
+        expires, mac = value.split(".", 1)
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return False
+    now = now or time.time()
+    if not now <= expires <= now + MAX_TTL:
+        return False
+    expected = hmac.new(secret.encode(), f"{function}:{expires}".encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(mac, expected)
+
+
+def requested(function, event):
+    """Should this invocation be profiled? Env switch, else a valid signed header."""
+    if PROFILE:
+        return True
+    if not isinstance(event, dict):
+        return False
+    headers = event.get("headers") or {}
+    value = next((v for k, v in headers.items() if k.lower() == HEADER), None)
+    if not value:
+        return False
+    key = header_secret()
+    return bool(key) and verify(function, value, key)
+
+
+class Profile:
+    """
+    cProfile + tracemalloc around one handler call. cProfile only sees the
+    invoking thread: work handed to a thread pool (transcode's encodes, the
+    details enricher's fetches and promotions) shows up as time spent waiting
+    on its futures. tracemalloc does count the pool threads' allocations.
+    """
+
+    def __init__(self, function, request_id=None):
+        self.function = function
+        self.request_id = request_id or str(uuid.uuid4())
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        self.key = f"{PROFILE_PREFIX}{function}/{day}/{self.request_id}"
+
+    def run(self, handler, event, context):
+        import cProfile
+        import tracemalloc
+        self.profiler = cProfile.Profile()
+        tracemalloc.start(10)
+        started = time.perf_counter()
+        try:
+            self.profiler.enable()
+            try:
+                return handler(event, context)
+            finally:
+                self.profiler.disable()
+        finally:
+            self.duration_ms = (time.perf_counter() - started) * 1000
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def summary(self):
+        import pstats
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        allocations = [{
+            "site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+            "kb": round(s.size / 1024, 1), "count": s.count,
+        } for s in self.snapshot.statistics("lineno")[:PROFILE_TOP]]
+        return {
+            "function": self.function, "requestId": self.request_id,
+            "durationMs": round(self.duration_ms, 1), "peakKb": round(self.peak / 1024),
+            "topAllocations": allocations, "cumulative": out.getvalue(),
+        }
+
+    def upload(self, s3, bucket=None):
+        """<key>.prof (load with pstats / snakeviz) and <key>.json (summary + top allocation sites)."""
+        import marshal
+        bucket = bucket or PROFILE_BUCKET
+        self.profiler.create_stats()
+        s3.put_object(Bucket=bucket, Key=self.key + ".prof", Body=marshal.dumps(self.profiler.stats))
+        s3.put_object(Bucket=bucket, Key=self.key + ".json", ContentType="application/json",
+                      Body=json.dumps(self.summary(), indent=1).encode())
+        return self.key
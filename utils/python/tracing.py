@@ -0,0 +1,263 @@
+import functools
+import json
+import os
+import threading
+import time
+
+import metrics
+import profiling
+
+# emf: one CloudWatch EMF record per invocation (metrics + per-operation breakdown)
+# log: the same record as a plain JSON line (no metrics)
+# off: hooks stay registered but nothing is collected
+TRACE_MODE = os.environ.get("TRACE", "emf").lower()
+TRACE_NAMESPACE = os.environ.get("TRACE_NAMESPACE", "WaveLoft/Api")
+# add "X-Consumed-Capacity: rcu=..; wcu=..; calls=.." to API responses (debugging only)
+CAPACITY_HEADER = os.environ.get("CAPACITY_HEADER", "").lower() in ("1", "true", "yes")
+CAPACITY_HEADER_NAME = "X-Consumed-Capacity"
+PROFILING = profiling.enabled()  # False: not even a header lookup per invocation
+
+# DynamoDB operations whose ConsumedCapacity is read capacity; everything else writes
+READ_OPS = {"GetItem", "BatchGetItem", "Query", "Scan", "TransactGetItems"}
+
+UNITS = {"DurationMs": "Milliseconds", "AwsMs": "Milliseconds", "AwsCalls": "Count", "Retries": "Count",
+         "AwsErrors": "Count", "BytesIn": "Bytes", "BytesOut": "Bytes",
+         "ReadCapacityUnits": "Count", "WriteCapacityUnits": "Count"}
+
+
+class Trace:
+    """AWS calls of one invocation, aggregated per "service.Operation"."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.ops = {}
+        self.annotations = {}
+        self.tables = {}  # table -> {"rcu", "wcu"}
+        self._lock = threading.Lock()  # handlers fan calls out to thread pools
+
+    def record(self, op, ms, retries=0, bytes_in=0, bytes_out=0, error=False, capacity=None):
+        with self._lock:
+            s = self.ops.get(op)
+            if s is None:
+                s = self.ops[op] = {"n": 0, "ms": 0.0, "maxMs": 0.0, "retries": 0, "errors": 0,
+                                    "bytesIn": 0, "bytesOut": 0}
+            s["n"] += 1
+            s["ms"] += ms
+            s["maxMs"] = max(s["maxMs"], ms)
+            s["retries"] += retries
+            s["errors"] += error
+            s["bytesIn"] += bytes_in
+            s["bytesOut"] += bytes_out
+            for table, rcu, wcu in capacity or ():
+                s["rcu"] = s.get("rcu", 0) + rcu
+                s["wcu"] = s.get("wcu", 0) + wcu
+                t = self.tables.setdefault(table, {"rcu": 0, "wcu": 0})
+                t["rcu"] += rcu
+                t["wcu"] += wcu
+
+    def totals(self):
+        ops = self.ops.values()
+        return {
+            "DurationMs": round((time.perf_counter() - self.started) * 1000, 1),
+            "AwsCalls": sum(s["n"] for s in ops),
+            "AwsMs": round(sum(s["ms"] for s in ops), 1),
+            "Retries": sum(s["retries"] for s in ops),
+            "AwsErrors": sum(s["errors"] for s in ops),
+            "BytesIn": sum(s["bytesIn"] for s in ops),
+            "BytesOut": sum(s["bytesOut"] for s in ops),
+            "ReadCapacityUnits": round(sum(t["rcu"] for t in self.tables.values()), 2),
+            "WriteCapacityUnits": round(sum(t["wcu"] for t in self.tables.values()), 2),
+        }
+
+
+_current = None
+
+
+def current():
+    return _current
+
+
+def annotate(**fields):
+    """Extra properties for this invocation's record (route, record count, ...)."""
+    if _current is not None:
+        _current.annotations.update(fields)
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    try:  # file-like upload bodies
+        pos = body.tell()
+        body.seek(0, os.SEEK_END)
+        size = body.tell() - pos
+        body.seek(pos)
+        return size
+    except Exception:
+        return 0
+
+
+def _response_size(http_response, model):
+    size = http_response.headers.get("content-length")
+    if size is not None:
+        return int(size)
+    # already read for non-streaming operations; never touch a streaming body
+    return 0 if model.has_streaming_output else len(http_response.content or b"")
+
+
+def _capacity(op, parsed):
+    """[(table, rcu, wcu)] from a DynamoDB response's ConsumedCapacity (one dict or a list)."""
+    consumed = parsed.get("ConsumedCapacity") if isinstance(parsed, dict) else None
+    if not consumed:
+        return []
+    out = []
+    for c in consumed if isinstance(consumed, list) else [consumed]:
+        if "ReadCapacityUnits" in c or "WriteCapacityUnits" in c:  # transactions split them
+            rcu, wcu = c.get("ReadCapacityUnits", 0), c.get("WriteCapacityUnits", 0)
+        elif op in READ_OPS:
+            rcu, wcu = c.get("CapacityUnits", 0), 0
+        else:
+            rcu, wcu = 0, c.get("CapacityUnits", 0)
+        out.append((c.get("TableName", "?"), rcu, wcu))
+    return out
+
+
+def _request_capacity(params, model, **_):
+    # every DynamoDB call made during a traced invocation reports what it cost;
+    # before-parameter-build sees the params boto3's resource layer actually sends
+    # (its provide-client-params handler works on a copy)
+    if _current is not None and "ReturnConsumedCapacity" in model.input_shape.members:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _before_call(model, params, context, **_):
+    if _current is not None:
+        context["_trace_t0"] = time.perf_counter()
+        context["_trace_out"] = _body_size(params.get("body"))
+
+
+def _after_call(http_response, parsed, model, context, **_):
+    t0 = context.pop("_trace_t0", None)
+    if _current is None or t0 is None:
+        return
+    meta = parsed.get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+    _current.record(
+        f"{model.service_model.service_name}.{model.name}",
+        (time.perf_counter() - t0) * 1000,
+        retries=meta.get("RetryAttempts", 0),
+        bytes_in=_response_size(http_response, model),
+        bytes_out=context.pop("_trace_out", 0),
+        error=http_response.status_code >= 300,
+        capacity=_capacity(model.name, parsed),
+    )
+
+
+def _after_call_error(context, **_):
+    t0 = context.pop("_trace_t0", None)
+    if _current is not None and t0 is not None:
+        _current.record("error", (time.perf_counter() - t0) * 1000, error=True)
+
+
+def instrument(client):
+    """Register the tracing hooks on a boto3 client (idempotent)."""
+    events = client.meta.events
+    if getattr(events, "_wl_traced", False):
+        return client
+    events.register("before-parameter-build.dynamodb", _request_capacity, unique_id="wl-trace-capacity")
+    events.register("before-call", _before_call, unique_id="wl-trace-before")
+    events.register("after-call", _after_call, unique_id="wl-trace-after")
+    events.register("after-call-error", _after_call_error, unique_id="wl-trace-error")
+    events._wl_traced = True
+    return client
+
+
+def emit(trace, status=None, request_id=None):
+    totals = trace.totals()
+    ops = {op: {k: round(v, 1) if isinstance(v, float) else v for k, v in s.items()}
+           for op, s in sorted(trace.ops.items(), key=lambda kv: -kv[1]["ms"])}
+    properties = {"requestId": request_id, "status": status, "ops": ops, **trace.annotations}
+    if trace.tables:
+        properties["capacity"] = {t: {k: round(v, 2) for k, v in c.items()} for t, c in trace.tables.items()}
+    if TRACE_MODE == "emf":
+        return metrics.emit(TRACE_NAMESPACE, totals, dimensions={"Function": trace.name},
+                            units=UNITS, properties=properties)
+    record = {"trace": trace.name, **totals, **properties}
+    print(json.dumps(record, default=str, separators=(",", ":")))
+    return record
+
+
+def expose_header(headers, name):
+    """Add `name` to Access-Control-Expose-Headers (browsers hide the others from scripts)."""
+    exposed = [h.strip() for h in headers.get("Access-Control-Expose-Headers", "").split(",") if h.strip()]
+    if name not in exposed:
+        headers["Access-Control-Expose-Headers"] = ", ".join(exposed + [name])
+
+
+def add_capacity_header(response, trace):
+    totals = trace.totals()
+    headers = response.setdefault("headers", {})
+    headers[CAPACITY_HEADER_NAME] = (f"rcu={totals['ReadCapacityUnits']:g}; wcu={totals['WriteCapacityUnits']:g}; "
+                                     f"calls={totals['AwsCalls']}")
+    expose_header(headers, CAPACITY_HEADER_NAME)
+
+
+def _upload_profile(profile, response):
+    import aws_clients
+    try:
+        key = profile.upload(aws_clients.client("s3"))
+        print(f"profile uploaded: s3://{profiling.PROFILE_BUCKET}/{key}.json")
+        if isinstance(response, dict) and response.get("statusCode") is not None:
+            headers = response.setdefault("headers", {})
+            headers["X-Profile-Key"] = key
+            expose_header(headers, "X-Profile-Key")
+    except Exception as e:  # profiling must never fail the request
+        print(f"WARNING: profile upload failed: {e}")
+
+
+def traced(name):
+    """
+    Decorator for a lambda_handler: collect every AWS call the invocation
+    makes (through clients from aws_clients) and emit one record when it
+    returns. Nested traced handlers (the API router calling a route's
+    handler) report into the outer trace.
+
+    It is also where an invocation is profiled when profiling asks for it
+    (PROFILE=1 or a signed X-Profile header, see profiling.py); the
+    profile is uploaded after the handler returned, outside the trace.
+    """
+    def wrap(handler):
+        @functools.wraps(handler)
+        def run(event, context):
+            global _current
+            if _current is not None:
+                return handler(event, context)
+            profile = None
+            if PROFILING and profiling.requested(name, event):
+                profile = profiling.Profile(name, getattr(context, "aws_request_id", None))
+            if TRACE_MODE == "off" and profile is None:
+                return handler(event, context)
+            _current = trace = Trace(name)
+            status = response = None
+            try:
+                response = profile.run(handler, event, context) if profile else handler(event, context)
+                if isinstance(response, dict):
+                    status = response.get("statusCode")
+                    if CAPACITY_HEADER and status is not None:
+                        add_capacity_header(response, trace)
+                return response
+            except Exception:
+                status = "exception"
+                raise
+            finally:
+                _current = None
+                if TRACE_MODE != "off":
+                    try:
+                        emit(trace, status, getattr(context, "aws_request_id", None))
+                    except Exception as e:  # tracing must never fail the request
+                        print(f"WARNING: trace emit failed: {e}")
+                if profile is not None:
+                    _upload_profile(profile, response)
+        return run
+    return wrap